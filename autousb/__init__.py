@@ -0,0 +1,5 @@
+"""AutoUSB core: autorun generation, drive provisioning and batch-to-EXE builds.
+
+Nothing in this package imports tkinter except autousb.gui, so the core modules and the CLI
+stay usable on headless machines.
+"""
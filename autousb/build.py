@@ -0,0 +1,274 @@
+"""Turning batch scripts into Windows executables with PyInstaller or MinGW-w64."""
+import os
+import shutil
+import tempfile
+import time
+
+from .toolchain import ensure_pch, find_toolchain, toolchain_for
+from .util import format_bytes, tool_version
+
+PYINSTALLER_FLAGS = ["--onefile", "--noconsole", "--clean"]
+MINGW_FLAGS = ["-Os", "-static", "-s", "-mwindows"]
+
+
+class BuildError(Exception):
+    """Raised when an EXE could not be produced."""
+
+
+def encode_batch(content):
+    """Returns a script as Windows expects it on disk: UTF-8 with CRLF line endings."""
+    text = content.replace("\r\n", "\n").rstrip("\n") + "\n"
+    return text.replace("\n", "\r\n").encode("utf-8")
+
+
+def find_mingw():
+    toolchain = find_toolchain()
+    return toolchain.path if toolchain else None
+
+
+def _pyinstaller_runner(content):
+    return (
+        "import os, subprocess, tempfile\n"
+        f"SCRIPT_CONTENT = {content!r}\n"
+        "IS_WINDOWS = True\n\n"
+        "def main():\n"
+        "    suffix = '.bat' if IS_WINDOWS else '.sh'\n"
+        "    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, mode='w', encoding='utf-8') as fh:\n"
+        "        fh.write(SCRIPT_CONTENT)\n"
+        "        script_path = fh.name\n"
+        "    try:\n"
+        "        if IS_WINDOWS:\n"
+        "            creation_flags = getattr(subprocess, 'CREATE_NO_WINDOW', 0)\n"
+        "            subprocess.run(['cmd', '/c', script_path], check=False, creationflags=creation_flags)\n"
+        "        else:\n"
+        "            os.chmod(script_path, 0o700)\n"
+        "            subprocess.run(['bash', script_path], check=False)\n"
+        "    finally:\n"
+        "        try:\n"
+        "            os.remove(script_path)\n"
+        "        except OSError:\n"
+        "            pass\n\n"
+        "if __name__ == '__main__':\n"
+        "    main()\n"
+    )
+
+
+def _escape_cpp_string(text):
+    return (
+        text.replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\r", "")
+        .replace("\n", "\\n\"\n\"")
+    )
+
+
+def _mingw_source(content):
+    escaped_batch = _escape_cpp_string(content)
+    return f'''
+#include <windows.h>
+#include <string>
+#include <fstream>
+
+int WINAPI WinMain(HINSTANCE, HINSTANCE, LPSTR, int) {{
+    char tempPath[MAX_PATH];
+    if (!GetTempPathA(MAX_PATH, tempPath)) return 1;
+    char tempFile[MAX_PATH];
+    if (!GetTempFileNameA(tempPath, "ab", 0, tempFile)) return 1;
+    {{
+        std::ofstream out(tempFile, std::ios::binary);
+        out << "{escaped_batch}";
+    }}
+    STARTUPINFOA si = {{0}};
+    si.cb = sizeof(si);
+    PROCESS_INFORMATION pi = {{0}};
+    std::string cmd = std::string("cmd /c \\"") + tempFile + "\\"";
+    if (!CreateProcessA(NULL, cmd.data(), NULL, NULL, FALSE, CREATE_NO_WINDOW, NULL, NULL, &si, &pi)) {{
+        return 1;
+    }}
+    CloseHandle(pi.hProcess);
+    CloseHandle(pi.hThread);
+    DeleteFileA(tempFile);
+    return 0;
+}}
+'''
+
+
+def _build_pyinstaller(job, pyinstaller, content, save_path):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        runner_path = os.path.join(tmpdir, "runner.py")
+        with open(runner_path, "w", encoding="utf-8") as fh:
+            fh.write(_pyinstaller_runner(content))
+
+        exe_name = os.path.splitext(os.path.basename(save_path))[0]
+        cmd = [
+            pyinstaller,
+            *PYINSTALLER_FLAGS,
+            "--distpath",
+            tmpdir,
+            "--name",
+            exe_name,
+            runner_path,
+        ]
+        returncode, output = job.run_process(cmd, cwd=tmpdir)
+        if returncode != 0:
+            raise BuildError(output)
+
+        built_path = os.path.join(tmpdir, f"{exe_name}.exe")
+        if not os.path.exists(built_path):
+            raise BuildError("Expected build artifact not found after PyInstaller run.")
+        shutil.copy2(built_path, save_path)
+
+
+def _build_mingw(job, compiler, content, save_path):
+    header = ensure_pch(job, toolchain_for(compiler))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cpp_path = os.path.join(tmpdir, "stub.cpp")
+        with open(cpp_path, "w", encoding="utf-8") as fh:
+            fh.write(_mingw_source(content))
+
+        out_path = os.path.join(tmpdir, "autorun.exe")
+        cmd = [
+            compiler,
+            *MINGW_FLAGS,
+            # The source's own #includes are then no-ops behind the headers' include guards.
+            *(["-include", header] if header else []),
+            cpp_path,
+            "-o",
+            out_path,
+        ]
+        returncode, output = job.run_process(cmd)
+        if returncode != 0:
+            raise BuildError(output)
+
+        shutil.copy2(out_path, save_path)
+
+
+def _build_pyinstaller_warm(job, pyinstaller, content, save_path):
+    from .warm import build_warm
+
+    return build_warm(job, pyinstaller, content, save_path)
+
+
+def _build_stub(job, compiler, content, save_path):
+    from .stub import build_with_stub
+
+    return build_with_stub(job, compiler, content, save_path)
+
+
+def _build_tiny(job, compiler, content, save_path):
+    from .stub import build_with_stub
+
+    return build_with_stub(job, compiler, content, save_path, launcher="tiny")
+
+
+def _build_tiny_lz(job, compiler, content, save_path):
+    from .stub import build_with_stub
+
+    return build_with_stub(job, compiler, content, save_path, launcher="tiny", compress=True)
+
+
+# backend: (label, flags, build function, whether results go through the build cache)
+BUILD_BACKENDS = {
+    "pyinstaller": ("PyInstaller", PYINSTALLER_FLAGS, _build_pyinstaller, True),
+    "pyinstaller-warm": ("PyInstaller (warm)", PYINSTALLER_FLAGS, _build_pyinstaller_warm, True),
+    "mingw": ("MinGW-w64 cross-compiler", MINGW_FLAGS, _build_mingw, True),
+    # Appending to a prebuilt stub is as cheap as a cache hit, so these skip the cache.
+    "stub": ("MinGW-w64 launcher stub", MINGW_FLAGS, _build_stub, False),
+    "tiny": ("MinGW-w64 tiny launcher", MINGW_FLAGS, _build_tiny, False),
+    "tiny-lz": ("MinGW-w64 tiny launcher, LZNT1 payload", MINGW_FLAGS, _build_tiny_lz, False),
+}
+MINGW_BACKENDS = ("mingw", "stub", "tiny", "tiny-lz")
+PYINSTALLER_BACKENDS = ("pyinstaller", "pyinstaller-warm")
+# Backends that append to a prebuilt launcher, and which launcher.
+LAUNCHER_BACKENDS = {"stub": "stub", "tiny": "tiny", "tiny-lz": "tiny"}
+
+
+def next_available_path(folder, filename, reserve=False):
+    """Returns a path in folder that does not overwrite existing files.
+
+    With reserve, the name is claimed by creating an empty file with O_EXCL, so builds running
+    side by side can never settle on the same autorun_built_N.exe. The build overwrites the
+    placeholder; whoever reserved it removes it again if the build fails.
+    """
+    base, ext = os.path.splitext(filename)
+    counter = 0
+    while True:
+        candidate = os.path.join(folder, f"{base}_{counter}{ext}" if counter else filename)
+        if not reserve:
+            if not os.path.exists(candidate):
+                return candidate
+        else:
+            try:
+                os.close(os.open(candidate, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+                return candidate
+            except FileExistsError:
+                pass
+        counter += 1
+
+
+def resolve_backend(backend=None):
+    """Returns (backend, tool path) for the requested or platform-default backend.
+
+    AUTOUSB_BUILD_BACKEND, when it names a backend, overrides the platform default. The tool
+    path is None when the toolchain is not installed.
+    """
+    if backend is None:
+        backend = os.getenv("AUTOUSB_BUILD_BACKEND", "")
+        if backend not in BUILD_BACKENDS:
+            backend = "pyinstaller-warm" if os.name == "nt" else "stub"
+    if backend in PYINSTALLER_BACKENDS:
+        return backend, shutil.which("pyinstaller")
+    return backend, find_mingw()
+
+
+class BuildResult:
+    """What build_exe produced: the output path and size, whether it came from cache, and how long it took."""
+
+    def __init__(self, path, backend, cached=False, seconds=0.0, note="", size=0):
+        self.path = path
+        self.backend = backend
+        self.cached = cached
+        self.seconds = seconds
+        self.note = note
+        self.size = size
+
+    def describe(self):
+        text = "from build cache" if self.cached else self.note or f"built in {self.seconds:.1f} s"
+        return f"{text}, {format_bytes(self.size)}" if self.size else text
+
+
+def build_exe(job, backend, tool, content, save_path, cache):
+    """Builds content into save_path with the given backend. Returns a BuildResult.
+
+    The EXE is built under the same name in a scratch folder next to save_path and renamed
+    over it only once complete, so a failed or cancelled build leaves save_path as it was.
+    """
+    stage = tempfile.mkdtemp(prefix=".autousb-build-", dir=os.path.dirname(os.path.abspath(save_path)))
+    try:
+        result = _build_staged(job, backend, tool, content, os.path.join(stage, os.path.basename(save_path)), cache)
+        os.replace(result.path, save_path)
+    finally:
+        shutil.rmtree(stage, ignore_errors=True)
+    result.path = save_path
+    return result
+
+
+def _build_staged(job, backend, tool, content, save_path, cache):
+    label, flags, build, cacheable = BUILD_BACKENDS[backend]
+    started = time.monotonic()
+    cache_key = None
+    if cacheable:
+        with job.span("cache lookup") as record:
+            cache_key = cache.make_key(content, backend, tool, tool_version(tool), flags)
+            record["cache_hit"] = cache.fetch(cache_key, save_path)
+        if record["cache_hit"]:
+            seconds = time.monotonic() - started
+            return BuildResult(save_path, backend, cached=True, seconds=seconds, size=os.path.getsize(save_path))
+    job.report(f"Building EXE with {label}...")
+    with job.span("compile", backend=backend):
+        note = build(job, tool, content, save_path)
+    if cache_key:
+        with job.span("cache store"):
+            cache.store(cache_key, save_path)
+    seconds = time.monotonic() - started
+    return BuildResult(save_path, backend, seconds=seconds, note=note or "", size=os.path.getsize(save_path))
@@ -0,0 +1,225 @@
+"""Building many batch scripts at once: a process pool, with identical scripts built once.
+
+Each script in the queue gets its own output path, claimed atomically up front, and its own
+status. Scripts whose normalized content matches an earlier one (for the same backend) do not
+start a build of their own; they receive a copy of the first one's EXE when it is done.
+Builds run in worker processes so the Python side of each build (hashing, cache copies, stub
+appends) runs in parallel. Cancelling the queue cancels the running builds, killing their
+compilers, and drops the scripts that have not started.
+"""
+import hashlib
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .build import LAUNCHER_BACKENDS, BuildResult, build_exe, next_available_path
+from .cache import BuildCache, normalize_batch
+from .jobs import Job, JobCancelled
+from .metrics import Tracer
+from .toolchain import ensure_pch, toolchain_for
+
+BUILD_QUEUE_WORKERS = os.cpu_count() or 1
+CANCEL_POLL_S = 0.1
+
+_cancel_event = None
+
+
+class QueuedBuild:
+    """One script in a build queue: its output path, status and, once finished, its BuildResult."""
+
+    def __init__(self, name, content, backend):
+        self.name = name
+        self.content = normalize_batch(content)
+        self.key = build_key(self.content, backend)
+        self.save_path = ""
+        self.same_as = None
+        self.status = "queued"
+        self.result = None
+        self.error = ""
+
+    @property
+    def ok(self):
+        return self.result is not None
+
+
+def build_key(content, backend):
+    """Identifies scripts that would produce the same EXE with the same backend."""
+    digest = hashlib.sha256()
+    for part in (backend, normalize_batch(content)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def output_name(name):
+    """setup.bat builds setup.exe; scripts without a file name build autorun_built.exe."""
+    stem, ext = os.path.splitext(os.path.basename(name))
+    return f"{stem}.exe" if ext.lower() in (".bat", ".cmd") and stem else "autorun_built.exe"
+
+
+def batch_files(folder):
+    """Returns (name, content) for every .bat and .cmd file directly inside folder, by name."""
+    scripts = []
+    for entry in sorted(os.scandir(folder), key=lambda item: item.name.lower()):
+        if entry.is_file() and os.path.splitext(entry.name)[1].lower() in (".bat", ".cmd"):
+            with open(entry.path, encoding="utf-8", errors="replace") as fh:
+                scripts.append((entry.name, fh.read()))
+    return scripts
+
+
+def _init_worker(cancel_event):
+    global _cancel_event
+    _cancel_event = cancel_event
+
+
+def _watch_cancel(job, finished):
+    while not finished.wait(CANCEL_POLL_S):
+        if _cancel_event is not None and _cancel_event.is_set():
+            job.cancel()
+            return
+
+
+def _build_in_worker(backend, tool, content, save_path, cache_root, cache_max_bytes):
+    """Runs one build in a pool process. Returns (BuildResult, the spans it recorded)."""
+    tracer = Tracer("build", log_path="")
+    job = Job(name=f"build {save_path}", tracer=tracer)
+    finished = threading.Event()
+    threading.Thread(target=_watch_cancel, args=(job, finished), daemon=True).start()
+    try:
+        result = build_exe(job, backend, tool, content, save_path, BuildCache(cache_root, cache_max_bytes))
+    finally:
+        finished.set()
+    return result, tracer.spans
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _settle(job, backend, item, future, followers):
+    """Records a finished build and hands its EXE, or its failure, to identical scripts."""
+    try:
+        item.result, spans = future.result()
+    except JobCancelled:
+        item.status = "cancelled"
+        _remove(item.save_path)
+    except Exception as exc:
+        # Compiler output can run to pages; its last line is the one that names the problem.
+        lines = str(exc).strip().splitlines()
+        item.status, item.error = "failed", lines[-1] if lines else type(exc).__name__
+        _remove(item.save_path)
+    else:
+        item.status = "cached" if item.result.cached else "done"
+        for record in spans:
+            record = dict(record)
+            record.pop("offset_s", None)
+            job.tracer.add(record.pop("span"), record.pop("wall_s"), record.pop("cpu_s"), **record)
+    job.report((item.name, f"failed: {item.error}" if item.error else item.status, 0.0))
+
+    for follower in followers:
+        if item.ok:
+            try:
+                shutil.copy2(item.save_path, follower.save_path)
+            except OSError as exc:
+                follower.status, follower.error = "failed", str(exc)
+            else:
+                follower.status = "done"
+                note = f"same as {item.name}"
+                follower.result = BuildResult(
+                    follower.save_path, backend, cached=item.result.cached, note=note, size=item.result.size
+                )
+        else:
+            follower.status, follower.error = item.status, item.error
+            _remove(follower.save_path)
+        job.report((follower.name, f"failed: {follower.error}" if follower.error else follower.status, 0.0))
+
+
+def build_queue(job, backend, tool, scripts, folder, cache, max_workers=BUILD_QUEUE_WORKERS):
+    """Builds every (name, content) in scripts into folder. Returns a QueuedBuild per script, in order.
+
+    Progress arrives as (name, status, 0.0) tuples, the same shape as multi-drive provisioning.
+    """
+    items = [QueuedBuild(name, content, backend) for name, content in scripts]
+    firsts = {}
+    followers = {}
+    for item in items:
+        first = firsts.setdefault(item.key, item)
+        item.save_path = next_available_path(folder, output_name(item.name), reserve=True)
+        if first is not item:
+            item.same_as = first
+            followers.setdefault(item.key, []).append(item)
+        job.report((item.name, "queued" if first is item else f"same as {first.name}", 0.0))
+
+    pending = list(firsts.values())
+    try:
+        if backend in LAUNCHER_BACKENDS:
+            from .stub import ensure_stub
+
+            # Compile the launcher once here rather than once in every worker on first use.
+            ensure_stub(job, tool, LAUNCHER_BACKENDS[backend])
+        elif backend == "mingw":
+            # Likewise the precompiled header every per-script compile includes.
+            ensure_pch(job, toolchain_for(tool))
+        with job.span("build queue", scripts=len(items), builds=len(pending)):
+            _run_pool(job, backend, tool, pending, followers, cache, max(1, min(len(pending), max_workers)))
+    finally:
+        for item in items:
+            if item.status in ("queued", "building"):
+                item.status = "cancelled"
+                _remove(item.save_path)
+                job.report((item.name, item.status, 0.0))
+    job.check_cancelled()
+    return items
+
+
+def _run_pool(job, backend, tool, pending, followers, cache, workers):
+    # Spawned workers behave the same on every platform and do not inherit the GUI's threads.
+    context = multiprocessing.get_context("spawn")
+    cancel_event = context.Event()
+    running = {}
+    with ProcessPoolExecutor(workers, context, initializer=_init_worker, initargs=(cancel_event,)) as pool:
+        try:
+            while pending or running:
+                # Submitting no more than there are workers keeps "building" honest and lets a
+                # cancel drop the rest without waiting on the pool.
+                while pending and len(running) < workers and not job.cancelled:
+                    item = pending.pop(0)
+                    args = (backend, tool, item.content, item.save_path, cache.root, cache.max_bytes)
+                    running[pool.submit(_build_in_worker, *args)] = item
+                    item.status = "building"
+                    job.report((item.name, item.status, 0.0))
+                if job.cancelled:
+                    cancel_event.set()
+                    pending = []
+                    if not running:
+                        break
+                done, _ = wait(running, timeout=CANCEL_POLL_S, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = running.pop(future)
+                    _settle(job, backend, item, future, followers.get(item.key, ()))
+        except BaseException:
+            cancel_event.set()
+            raise
+
+
+def summarize_builds(items):
+    """Returns a human-readable summary of a build queue run."""
+    ok = [item for item in items if item.ok]
+    builds = len({item.key for item in items})
+    lines = [
+        f"Built {len(ok)} of {len(items)} script{'s' if len(items) != 1 else ''} "
+        f"({builds} distinct build{'s' if builds != 1 else ''}, "
+        f"{sum(1 for item in ok if item.result.cached)} from cache)."
+    ]
+    lines.extend(f"{item.name} -> {item.save_path} ({item.result.describe()})" for item in ok)
+    failed = [item for item in items if not item.ok]
+    if failed:
+        lines.append("")
+        lines.append("Failed:")
+        lines.extend(f"{item.name}: {item.error or item.status}" for item in failed)
+    return "\n".join(lines)
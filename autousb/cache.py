@@ -0,0 +1,122 @@
+"""Content-addressed on-disk cache of built executables."""
+import hashlib
+import os
+import shutil
+import threading
+
+from .util import cache_dir
+
+# Bump when the generated runner/stub templates change so stale artifacts are not reused.
+BUILD_CACHE_VERSION = 1
+BUILD_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+def normalize_batch(content):
+    """Normalizes line endings so equivalent scripts share a cache entry."""
+    return content.replace("\r\n", "\n").replace("\r", "\n").strip()
+
+
+class BuildCache:
+    """On-disk LRU store of built executables keyed by their build inputs."""
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or os.path.join(cache_dir(), "builds")
+        if max_bytes is None:
+            env_mb = os.getenv("AUTOUSB_BUILD_CACHE_MB")
+            max_bytes = int(env_mb) * 1024 * 1024 if env_mb else BUILD_CACHE_MAX_BYTES
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(content, backend, tool_path, tool_ver, flags):
+        digest = hashlib.sha256()
+        for part in (str(BUILD_CACHE_VERSION), backend, tool_path, tool_ver, "\0".join(flags), normalize_batch(content)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.root, f"{key}.exe")
+
+    def fetch(self, key, dest):
+        """Copies a cached artifact to dest. Returns True on a hit; a zero-size cache always misses."""
+        entry = self._entry_path(key)
+        try:
+            if self.max_bytes <= 0:
+                raise FileNotFoundError(entry)
+            shutil.copy2(entry, dest)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        # mtime doubles as the LRU timestamp.
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        self.hits += 1
+        return True
+
+    def store(self, key, src):
+        """Adds a built artifact to the cache. A full or read-only cache never fails the build."""
+        if self.max_bytes <= 0:
+            return False
+        entry = self._entry_path(key)
+        # Threads storing the same key each need their own temp file for the rename to stay whole.
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, entry)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return False
+        self._evict()
+        return True
+
+    def _entries(self):
+        entries = []
+        try:
+            with os.scandir(self.root) as it:
+                for item in it:
+                    if item.name.endswith(".exe") and item.is_file():
+                        st = item.stat()
+                        entries.append((st.st_mtime, st.st_size, item.path))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        """Removes every cached artifact. Returns the number of entries removed."""
+        removed = 0
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,387 @@
+"""Headless command line. Imports only what each command needs and never loads Tk."""
+import argparse
+import sys
+
+GUI_MODULES = ("tkinter", "_tkinter", "ttkthemes")
+
+
+def check_headless():
+    """Raises RuntimeError if any Tk module has been imported into this process."""
+    loaded = sorted(name for name in sys.modules if name.split(".")[0] in GUI_MODULES)
+    if loaded:
+        raise RuntimeError(f"GUI modules loaded in CLI mode: {', '.join(loaded)}")
+
+
+def _progress(message):
+    if isinstance(message, tuple):
+        from .util import format_bytes
+
+        drive, status, rate = message
+        message = f"{drive}: {status}" + (f" ({format_bytes(rate)}/s)" if rate else "")
+    print(message, file=sys.stderr, flush=True)
+
+
+def _make_job(args, name):
+    from .jobs import Job
+
+    return Job(name=name, callbacks={"progress": None if args.quiet else _progress}, tracer=args.tracer)
+
+
+def cmd_provision(args):
+    import os
+    import time
+
+    from .provision import (
+        ProvisionError,
+        check_payload_dir,
+        check_provision_inputs,
+        provision_drive,
+        provision_drives,
+        summarize_results,
+    )
+
+    exe = args.exe or ""
+    copy_files = not args.no_copy
+    if len(args.drive) == 1:
+        with args.tracer.span("validate"):
+            check_provision_inputs(args.drive[0], exe, copy_files, args.payload)
+        job = _make_job(args, f"provision {args.drive[0]}")
+        autorun_path, copy_result = provision_drive(
+            job,
+            args.drive[0],
+            exe,
+            args.label,
+            copy_files,
+            verify_hash=args.verify_hash,
+            payload_dir=args.payload,
+            verify=not args.no_verify,
+        )
+        message = f"autorun.inf written to {autorun_path}"
+        if copy_result is not None:
+            message += f"; {copy_result.describe(os.path.basename(args.payload or exe))}"
+        print(message)
+        return 0
+
+    if not exe or not os.path.isfile(exe):
+        raise ProvisionError(f"File not found: {exe}" if exe else "--exe is required when provisioning several drives.")
+    if args.payload:
+        check_payload_dir(args.payload, exe)
+    job = _make_job(args, f"provision {len(args.drive)} drives")
+    started = time.monotonic()
+    results = provision_drives(
+        job,
+        args.drive,
+        exe,
+        args.label,
+        payload_dir=args.payload,
+        verify=not args.no_verify,
+        copy_files=copy_files,
+        verify_hash=args.verify_hash,
+    )
+    print(summarize_results(results, time.monotonic() - started))
+    return 0 if all(result.ok for result in results) else 1
+
+
+def cmd_image(args):
+    import os
+    import tempfile
+    import time
+
+    from .fatimage import ImageError, build_payload_image, check_target, is_block_device, target_size, write_image
+    from .provision import ProvisionError, check_payload_dir, summarize_results
+
+    if not os.path.isfile(args.exe):
+        raise ProvisionError(f"File not found: {args.exe}")
+    if not args.target and not args.keep_image:
+        raise ImageError("Give a --target to write the image to, or --keep-image FILE to save it.")
+    if args.payload:
+        check_payload_dir(args.payload, args.exe)
+    for target in args.target:
+        check_target(target, 0)
+    size = args.size
+    if size is None:
+        # Fill the smallest device so every copy gets the whole stick; files get a snug image.
+        device_sizes = [target_size(target) for target in args.target if is_block_device(target)]
+        size = min(device_sizes) if device_sizes else None
+
+    job = _make_job(args, f"image to {len(args.target)} target(s)")
+    with tempfile.TemporaryDirectory(prefix="autousb-image-") as tmpdir:
+        image_path = args.keep_image or os.path.join(tmpdir, "payload.img")
+        with args.tracer.span("build image") as record:
+            image = build_payload_image(image_path, args.exe, args.label, args.payload, size, job)
+            record["bytes"] = image.used_bytes
+        if not args.quiet:
+            print(f"Image: {image.describe()}", file=sys.stderr)
+        if not args.target:
+            print(f"Image saved to {image_path}")
+            return 0
+        started = time.monotonic()
+        with args.tracer.span("write image", bytes=image.used_bytes * len(args.target)):
+            results = write_image(job, image, args.target)
+    print(summarize_results(results, time.monotonic() - started))
+    return 0 if all(result.ok for result in results) else 1
+
+
+def cmd_build(args):
+    import os
+
+    from .build import PYINSTALLER_BACKENDS, BuildError, build_exe, next_available_path, resolve_backend
+    from .buildqueue import batch_files
+    from .cache import BuildCache, normalize_batch
+
+    scripts = []
+    for script in args.script:
+        if script == "-":
+            scripts.append(("stdin", sys.stdin.read()))
+        else:
+            with open(script, encoding="utf-8") as fh:
+                scripts.append((script, fh.read()))
+    for folder in args.folder:
+        scripts.extend((os.path.join(folder, name), content) for name, content in batch_files(folder))
+    if not scripts:
+        raise BuildError("Give a --script, or a --folder containing .bat files.")
+    empty = [name for name, content in scripts if not normalize_batch(content)]
+    if empty:
+        raise BuildError(f"The batch script is empty: {empty[0]}")
+    if args.output and len(scripts) > 1:
+        raise BuildError("--output only applies to a single script; queued builds are saved here.")
+    if args.sizes:
+        return _report_sizes(args, normalize_batch(scripts[0][1]))
+
+    with args.tracer.span("toolchain"):
+        backend, tool = resolve_backend(args.backend)
+    if not tool:
+        hint = "pip install pyinstaller" if backend in PYINSTALLER_BACKENDS else "apt install mingw-w64"
+        raise BuildError(f"No {backend} toolchain found on PATH (install with: {hint}).")
+
+    cache = BuildCache(max_bytes=0) if args.no_cache else BuildCache()
+    if len(scripts) > 1:
+        from .buildqueue import BUILD_QUEUE_WORKERS, build_queue, summarize_builds
+
+        job = _make_job(args, f"build {len(scripts)} scripts")
+        items = build_queue(job, backend, tool, scripts, os.getcwd(), cache, args.jobs or BUILD_QUEUE_WORKERS)
+        print(summarize_builds(items))
+        return 0 if all(item.ok for item in items) else 1
+
+    save_path = args.output or next_available_path(os.getcwd(), "autorun_built.exe", reserve=True)
+    content = normalize_batch(scripts[0][1])
+    try:
+        result = build_exe(_make_job(args, f"build {save_path}"), backend, tool, content, save_path, cache)
+    except BaseException:
+        # Only the placeholder claimed above is ours to remove; --output may be the user's file.
+        if not args.output:
+            try:
+                os.remove(save_path)
+            except OSError:
+                pass
+        raise
+    print(f"EXE saved to {save_path} ({result.describe()})")
+    return 0
+
+
+def _report_sizes(args, content):
+    """Builds content with every MinGW variant into a scratch folder and prints the EXE sizes."""
+    import os
+    import tempfile
+
+    from .build import MINGW_BACKENDS, BuildError, build_exe, find_mingw
+    from .cache import BuildCache
+    from .util import format_bytes
+
+    compiler = find_mingw()
+    if not compiler:
+        raise BuildError("No MinGW-w64 toolchain found on PATH (install with: apt install mingw-w64).")
+    cache = BuildCache(max_bytes=0)
+    with tempfile.TemporaryDirectory(prefix="autousb-sizes-") as tmpdir:
+        for backend in MINGW_BACKENDS:
+            save_path = os.path.join(tmpdir, f"{backend}.exe")
+            result = build_exe(_make_job(args, f"build {backend}"), backend, compiler, content, save_path, cache)
+            print(f"{backend:<8} {format_bytes(result.size):>9}  {result.note or result.describe()}")
+    return 0
+
+
+def cmd_drives(args):
+    from .drives import list_drive_info
+    from .preflight import drive_status, probe_drive
+
+    infos = list_drive_info()
+    rows = []
+    for info in infos:
+        row = vars(info).copy()
+        try:
+            probe = probe_drive(info.path) if args.probe else drive_status(info.path, info.fstype)
+        except OSError as exc:
+            row["error"] = str(exc)
+        else:
+            row.update(free=probe.free, write_rate=probe.rate)
+        rows.append(row)
+    if args.json:
+        import json
+
+        print(json.dumps(rows, indent=2))
+        return 0
+    from .util import format_bytes
+
+    for info, row in zip(infos, rows):
+        details = [info.describe()] if info.describe() else []
+        if "free" in row:
+            details.append(f"{format_bytes(row['free'])} free")
+        if row.get("write_rate"):
+            details.append(f"writes {format_bytes(row['write_rate'])}/s")
+        print("\t".join([info.path, ", ".join(details)]) if details else info.path)
+    return 0
+
+
+def cmd_cache(args):
+    from .cache import BuildCache
+    from .toolchain import forget_pch_failures
+    from .util import format_bytes
+
+    cache = BuildCache()
+    if args.clear:
+        forget_pch_failures()
+        print(f"Removed {cache.clear()} cached build(s) from {cache.root}")
+        return 0
+    stats = cache.stats()
+    print(f"{stats['entries']} cached build(s), {format_bytes(stats['bytes'])} in {cache.root}")
+    return 0
+
+
+def cmd_serve(args):
+    from .daemon import serve
+
+    def ready(info):
+        where = info.get("socket") or info["url"]
+        print(f"AutoUSB daemon listening on {where} (pid {info['pid']})", file=sys.stderr, flush=True)
+
+    serve(args.host, args.port, args.socket, verbose=not args.quiet, on_ready=ready)
+    return 0
+
+
+def cmd_call(args):
+    import json
+
+    from .daemon import DaemonClient
+
+    try:
+        body = json.loads(args.data) if args.data else None
+    except ValueError as exc:
+        print(f"error: --data is not JSON: {exc}", file=sys.stderr)
+        return 2
+    client = DaemonClient(args.url, args.socket, args.token)
+    try:
+        response = client.request("POST" if body is not None or args.post else "GET", "/" + args.path.lstrip("/"), body)
+    finally:
+        client.close()
+    print(json.dumps(response, indent=2))
+    failed = isinstance(response, dict) and (response.get("state") in ("error", "cancelled") or response.get("ok") is False)
+    return 1 if failed else 0
+
+
+def build_parser():
+    from .util import parse_size
+
+    parser = argparse.ArgumentParser(prog="main.py", description="AutoUSB headless mode.")
+    parser.add_argument("-q", "--quiet", action="store_true", help="suppress progress output")
+    parser.add_argument("--profile", metavar="FILE", help="write cProfile stats for the command to FILE")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("provision", help="copy an EXE and write autorun.inf to one or more drives")
+    p.add_argument("--drive", action="append", required=True, help="drive mount point; repeat for several drives")
+    p.add_argument("--exe", help="executable to copy and auto-run")
+    p.add_argument("--payload", metavar="DIR", help="mirror this folder to the drive root; --exe must be inside it")
+    p.add_argument("--label", default="", help="volume label written to autorun.inf")
+    p.add_argument("--no-copy", action="store_true", help="only write autorun.inf")
+    p.add_argument("--verify-hash", action="store_true", help="compare content, not just size and mtime, before skipping")
+    p.add_argument("--no-verify", action="store_true", help="skip reading the files back from the drive after copying")
+    p.set_defaults(func=cmd_provision)
+
+    p = sub.add_parser("image", help="build a FAT32 image once and write it to block devices or image files")
+    p.add_argument("--exe", required=True, help="executable to auto-run")
+    p.add_argument("--payload", metavar="DIR", help="put this folder in the image root; --exe must be inside it")
+    p.add_argument("--label", default="", help="volume label, also written to autorun.inf")
+    p.add_argument("--target", action="append", default=[], help="device or image file to write; repeat for several")
+    p.add_argument("--size", type=parse_size, help="filesystem size, e.g. 2G (default: smallest device, else payload + 10%%)")
+    p.add_argument("--keep-image", metavar="FILE", help="build the image here and keep it")
+    p.set_defaults(func=cmd_image)
+
+    p = sub.add_parser("build", help="turn batch scripts into EXEs")
+    p.add_argument("--script", action="append", default=[], help="batch file to convert, or - for stdin; repeatable")
+    p.add_argument("--folder", action="append", default=[], help="convert every .bat/.cmd file in this folder")
+    p.add_argument("--output", help="output path for a single script (default: next free autorun_built*.exe here)")
+    p.add_argument("--jobs", type=int, help="parallel builds for several scripts (default: one per CPU)")
+    p.add_argument(
+        "--backend",
+        choices=("stub", "tiny", "tiny-lz", "mingw", "pyinstaller-warm", "pyinstaller"),
+        help="stub appends the script to a launcher compiled once; tiny does the same with a "
+        "few-KB C launcher that needs no runtime, and tiny-lz also LZNT1-compresses the script; "
+        "mingw compiles per script; "
+        "pyinstaller-warm reuses PyInstaller's analysis between builds "
+        "(default: $AUTOUSB_BUILD_BACKEND, else pyinstaller-warm on Windows and stub elsewhere)",
+    )
+    p.add_argument("--no-cache", action="store_true", help="always rebuild")
+    p.add_argument("--sizes", action="store_true", help="build the script with each MinGW variant and compare EXE sizes")
+    p.set_defaults(func=cmd_build)
+
+    p = sub.add_parser("drives", help="list detected drives")
+    p.add_argument("--json", action="store_true")
+    p.add_argument("--probe", action="store_true", help="measure write speed with a short test write to each drive")
+    p.set_defaults(func=cmd_drives)
+
+    p = sub.add_parser("cache", help="show or clear the build cache")
+    p.add_argument("--clear", action="store_true")
+    p.set_defaults(func=cmd_cache)
+
+    p = sub.add_parser("serve", help="run the provisioning daemon with a local JSON API")
+    p.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    p.add_argument("--port", type=int, default=8765, help="port to listen on; 0 picks a free one (default: 8765)")
+    p.add_argument("--socket", metavar="PATH", help="listen on this Unix socket instead of TCP")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("call", help="send one request to a running daemon and print the JSON reply")
+    p.add_argument("path", help="endpoint, e.g. status, drives, jobs/3, build, provision, shutdown")
+    p.add_argument("--data", metavar="JSON", help='request body, e.g. \'{"script": "echo hi", "wait": true}\'; implies POST')
+    p.add_argument("--post", action="store_true", help="POST without a body, e.g. for jobs/3/cancel")
+    p.add_argument("--url", help="daemon URL (default: read from the daemon's state file)")
+    p.add_argument("--socket", metavar="PATH", help="daemon Unix socket")
+    p.add_argument("--token", help="API token (default: read from the daemon's state file)")
+    p.set_defaults(func=cmd_call)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    check_headless()
+    from .metrics import Tracer
+
+    args.tracer = Tracer(args.command, profile_path=args.profile)
+    status = "error"
+    try:
+        returncode = args.tracer.profile(args.func, args)
+        status = "ok" if returncode == 0 else "failed"
+        return returncode
+    except KeyboardInterrupt:
+        status = "cancelled"
+        print("Interrupted.", file=sys.stderr)
+        return 130
+    except Exception as exc:
+        from .build import BuildError
+        from .jobs import JobCancelled
+        from .provision import ProvisionError
+
+        if isinstance(exc, JobCancelled):
+            status = "cancelled"
+            return 130
+        from .daemon import DaemonError
+        from .fatimage import ImageError
+
+        if isinstance(exc, (BuildError, ProvisionError, ImageError, DaemonError, OSError)):
+            print(f"error: {exc}", file=sys.stderr)
+            return 1
+        raise
+    finally:
+        if args.tracer.spans:
+            summary = args.tracer.finish(status)
+            if not args.quiet:
+                print(f"timing: {summary}", file=sys.stderr)
+        check_headless()
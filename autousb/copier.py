@@ -0,0 +1,259 @@
+"""File copy engine: skips identical destinations and prefers kernel-side copies."""
+import errno
+import hashlib
+import mmap
+import os
+import shutil
+import threading
+import time
+
+from .journal import part_path, write_journaled
+from .metrics import NULL_TRACER
+from .util import format_bytes
+
+COPY_CHUNK_SIZE = 1024 * 1024
+KERNEL_COPY_CHUNK = 8 * 1024 * 1024
+PROGRESS_INTERVAL = 0.2
+# FAT stores mtimes with two-second resolution.
+MTIME_TOLERANCE = 2.0
+_KERNEL_COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF}
+
+
+class CopyResult:
+    """Outcome of copy_file: bytes written, whether the copy was skipped, and throughput."""
+
+    def __init__(self, bytes_copied=0, skipped=False, seconds=0.0, method="", resumed_from=0):
+        self.bytes_copied = bytes_copied
+        self.skipped = skipped
+        self.seconds = seconds
+        self.method = method
+        self.resumed_from = resumed_from
+
+    @property
+    def rate(self):
+        return self.bytes_copied / self.seconds if self.seconds else 0.0
+
+    def describe(self, name):
+        if self.skipped:
+            return f"{name} unchanged, copy skipped"
+        resumed = f", resumed after {format_bytes(self.resumed_from)}" if self.resumed_from else ""
+        return f"copied {name} ({format_bytes(self.bytes_copied)} at {format_bytes(self.rate)}/s{resumed})"
+
+
+def file_sha256(path, chunk_size=COPY_CHUNK_SIZE):
+    digest = hashlib.sha256()
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as fh:
+        while True:
+            n = fh.readinto(buf)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+class SourceHashes:
+    """Thread-safe memo of source file hashes keyed by (path, size, mtime).
+
+    Shared between the drives of a multi-drive sync so each source file is read once.
+    """
+
+    def __init__(self):
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, size, mtime):
+        key = (path, size, mtime)
+        with self._lock:
+            digest = self._hashes.get(key)
+        if digest is None:
+            digest = file_sha256(path)
+            with self._lock:
+                self._hashes[key] = digest
+        return digest
+
+
+def is_up_to_date(src, dst, verify_hash=False):
+    """Returns True if dst already holds the same bytes as src.
+
+    Size plus mtime decides by default; verify_hash additionally compares content, and lets a
+    matching file with a different mtime count as unchanged.
+    """
+    try:
+        src_st = os.stat(src)
+        dst_st = os.stat(dst)
+    except OSError:
+        return False
+    if src_st.st_size != dst_st.st_size:
+        return False
+    same_mtime = abs(src_st.st_mtime - dst_st.st_mtime) <= MTIME_TOLERANCE
+    if not verify_hash:
+        return same_mtime
+    return file_sha256(src) == file_sha256(dst)
+
+
+def _refresh_mtime(src, dst):
+    """Copies src's timestamps to a hash-matched dst whose mtime is stale, so the cheap check hits next time."""
+    try:
+        if abs(os.stat(src).st_mtime - os.stat(dst).st_mtime) > MTIME_TOLERANCE:
+            shutil.copystat(src, dst)
+    except OSError:
+        # A read-only stick still holds the right bytes; the skip stands.
+        pass
+
+
+def _copy_range(fin, fout, job, progress, total):
+    """Copies via the kernel (copy_file_range, then sendfile). Returns (bytes, method) or None."""
+    for method in ("copy_file_range", "sendfile"):
+        func = getattr(os, method, None)
+        if func is None:
+            continue
+        copied = 0
+        try:
+            while copied < total:
+                if job is not None:
+                    job.check_cancelled()
+                if method == "copy_file_range":
+                    n = func(fin, fout, min(KERNEL_COPY_CHUNK, total - copied))
+                else:
+                    n = func(fout, fin, copied, min(KERNEL_COPY_CHUNK, total - copied))
+                if n == 0:
+                    break
+                copied += n
+                progress(copied)
+        except OSError as exc:
+            if copied or exc.errno not in _KERNEL_COPY_FALLBACK_ERRNOS:
+                raise
+            continue
+        return copied, method
+    return None
+
+
+_buffers = threading.local()
+
+
+def _copy_buffer(chunk_size):
+    """Returns this thread's copy buffer, allocated again only when chunk_size changes.
+
+    An anonymous mapping is page aligned, which keeps every read and write on page boundaries.
+    """
+    buf = getattr(_buffers, "buf", None)
+    if buf is None or len(buf) != chunk_size:
+        if buf is not None:
+            buf.close()
+        buf = _buffers.buf = mmap.mmap(-1, chunk_size)
+    return buf
+
+
+def _copy_buffered(fin, fout, job, progress, chunk_size):
+    buf = _copy_buffer(chunk_size)
+    copied = 0
+    with memoryview(buf) as view, open(fin, "rb", buffering=0, closefd=False) as reader, open(
+        fout, "wb", buffering=0, closefd=False
+    ) as writer:
+        while True:
+            if job is not None:
+                job.check_cancelled()
+            n = reader.readinto(view)
+            if not n:
+                break
+            written = 0
+            while written < n:
+                written += writer.write(view[written:n])
+            copied += n
+            progress(copied)
+    return copied
+
+
+def copy_file(src, dst, job=None, verify_hash=False, chunk_size=COPY_CHUNK_SIZE, skip_unchanged=True, journal=None):
+    """Copies src to dst unless dst is already identical. Returns a CopyResult.
+
+    Uses copy_file_range/sendfile where the platform offers them and falls back to a
+    page-aligned buffer each thread reuses. Progress and cancellation go through job when
+    given. The copy is written under a part name and renamed over dst once complete; with a
+    journal (and a job) it is checkpointed as it goes and an interrupted copy resumes where
+    it stopped.
+    """
+    tracer = job.tracer if job is not None else NULL_TRACER
+    started = time.monotonic()
+    if skip_unchanged:
+        with tracer.span("compare", verify_hash=verify_hash) as record:
+            record["skipped"] = is_up_to_date(src, dst, verify_hash)
+        if record["skipped"]:
+            if verify_hash:
+                _refresh_mtime(src, dst)
+            return CopyResult(skipped=True, seconds=time.monotonic() - started, method="skip")
+
+    name = os.path.basename(src)
+    total = os.path.getsize(src)
+    last_report = [0.0]
+
+    def progress(copied, written=None):
+        if job is None:
+            return
+        now = time.monotonic()
+        if now - last_report[0] >= PROGRESS_INTERVAL:
+            last_report[0] = now
+            rate = (copied if written is None else written) / max(now - started, 1e-6)
+            percent = copied * 100 // total if total else 100
+            job.report(f"Copying {name}: {percent}% ({format_bytes(rate)}/s)")
+
+    resumed = 0
+    with tracer.span("copy", bytes=total) as record:
+        if journal is not None:
+            copied, resumed = _copy_journaled(src, dst, job, journal, progress, total, chunk_size)
+            method = "journaled"
+            record.update(bytes=copied, resumed_from=resumed)
+        else:
+            copied, method = _copy_open(src, dst, job, progress, total, chunk_size)
+        record["method"] = method
+    return CopyResult(copied, seconds=time.monotonic() - started, method=method, resumed_from=resumed)
+
+
+def _copy_journaled(src, dst, job, journal, progress, total, chunk_size):
+    fin = os.open(src, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+
+    def read(offset, length):
+        os.lseek(fin, offset, os.SEEK_SET)
+        return os.read(fin, length)
+
+    try:
+        return write_journaled(job, read, total, dst, src, journal, chunk_size, progress)
+    finally:
+        os.close(fin)
+
+
+def _copy_open(src, dst, job, progress, total, chunk_size):
+    """Opens both ends and copies into dst's part file, then renames it over dst.
+
+    The part file is removed on any failure, so dst is either the old file or the whole new one.
+    """
+    binary = getattr(os, "O_BINARY", 0)
+    part = part_path(dst)
+    try:
+        fin = os.open(src, os.O_RDONLY | binary)
+        try:
+            fout = os.open(part, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | binary, 0o666)
+            try:
+                kernel = _copy_range(fin, fout, job, progress, total) if total else None
+                if kernel is not None and kernel[0] == total:
+                    copied, method = kernel
+                else:
+                    os.lseek(fin, 0, os.SEEK_SET)
+                    os.lseek(fout, 0, os.SEEK_SET)
+                    os.ftruncate(fout, 0)
+                    copied, method = _copy_buffered(fin, fout, job, progress, chunk_size), "buffered"
+            finally:
+                os.close(fout)
+        finally:
+            os.close(fin)
+        shutil.copystat(src, part)
+        os.replace(part, dst)
+    except BaseException:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise
+    return copied, method
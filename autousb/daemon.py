@@ -0,0 +1,661 @@
+"""Long-running provisioning daemon: a local JSON API over HTTP or a Unix socket.
+
+A CLI run or a GUI start pays for imports, a drive scan, toolchain lookups and, for builds,
+a launcher compile before any work starts. The daemon pays once and keeps that state warm:
+the drive list follows DriveMonitor, resolved toolchains are remembered, the launcher stub is
+compiled at start-up, and built EXEs stay on disk keyed by their inputs, so provisioning the
+same script again skips the build entirely.
+
+Requests and responses are JSON. Work runs as jobs on a JobRunner; a request returns the job
+at once, or waits for it with "wait": true.
+
+    GET  /status                 uptime, drives, toolchains, cache and job counts
+    GET  /drives                 the live drive list
+    GET  /jobs                   recent jobs
+    GET  /jobs/<id>[?wait=S]     one job, optionally waiting up to S seconds for it to finish
+    GET  /artifacts              built EXEs kept on disk, most recently used last
+    POST /build                  {"script", "backend"?, "output"?, "name"?, "wait"?}
+    POST /provision              {"drives": [...] | "removable", "exe" | "script", "label"?,
+                                  "payload"?, "verify"?, "name"?, "backend"?, "wait"?}
+    POST /jobs/<id>/cancel
+    POST /shutdown
+
+Over HTTP every request must carry the token from the state file in the X-AutoUSB-Token
+header, so a web page cannot drive the daemon. A Unix socket relies on its 0600 mode instead.
+A socket path is only taken over when it is a stale socket nobody answers on.
+"""
+import hmac
+import http.client
+import itertools
+import json
+import os
+import secrets
+import socket
+import socketserver
+import stat
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .build import BUILD_BACKENDS, LAUNCHER_BACKENDS, BuildError, BuildResult, build_exe, resolve_backend
+from .cache import BuildCache, normalize_batch
+from .drives import DriveMonitor, list_drive_info
+from .jobs import JobRunner
+from .metrics import Tracer
+from .preflight import PreflightError
+from .provision import PROVISION_MAX_WORKERS, ProvisionError, check_payload_dir, provision_drives, summarize_results
+from .util import cache_dir, tool_version
+
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = 8765
+DAEMON_WORKERS = 4
+DISPATCH_INTERVAL = 0.02
+JOB_HISTORY = 200
+PROGRESS_HISTORY = 20
+ARTIFACT_LIMIT = 256
+TOKEN_HEADER = "X-AutoUSB-Token"
+DEFAULT_EXE_NAME = "autorun_built.exe"
+
+
+class DaemonError(Exception):
+    """A request the daemon cannot serve; status is the HTTP status it is answered with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def state_path():
+    """Where a running daemon publishes its address and token for local clients."""
+    return os.path.join(cache_dir(), "daemon.json")
+
+
+class JobRecord:
+    """A daemon job as clients see it: parameters, state, recent progress and the result."""
+
+    def __init__(self, job_id, kind, params):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.state = "running"
+        self.result = None
+        self.error = ""
+        self.timing = ""
+        self.created = time.time()
+        self.finished = None
+        self.job = None
+        self.done = threading.Event()
+        self._progress = deque(maxlen=PROGRESS_HISTORY)
+        self._lock = threading.Lock()
+
+    def add_progress(self, message):
+        if isinstance(message, tuple):
+            drive, status, rate = message
+            message = {"drive": drive, "status": status, "rate": rate}
+        with self._lock:
+            self._progress.append(message)
+
+    def to_json(self, progress=True):
+        data = {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "params": self.params,
+            "created": self.created,
+            "finished": self.finished,
+            "result": self.result,
+            "error": self.error,
+            "timing": self.timing,
+        }
+        if progress:
+            with self._lock:
+                data["progress"] = list(self._progress)
+        return data
+
+
+def _build_json(result):
+    return {
+        "path": result.path,
+        "backend": result.backend,
+        "size": result.size,
+        "cached": result.cached,
+        "seconds": result.seconds,
+        "describe": result.describe(),
+    }
+
+
+class Daemon:
+    """Warm state shared by every request: drives, toolchains, built artifacts and jobs."""
+
+    def __init__(self, workers=DAEMON_WORKERS, watch_drives=True):
+        self.started = time.time()
+        self.runner = JobRunner(max_workers=workers)
+        self.cache = BuildCache()
+        self.artifact_dir = os.path.join(cache_dir(), "daemon", "artifacts")
+        self._lock = threading.Lock()
+        self._drives = list_drive_info()
+        self._toolchains = {}
+        self._artifacts = OrderedDict()
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._stop = threading.Event()
+        self._monitor = DriveMonitor(self._drives_changed) if watch_drives else None
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="autousb-daemon-dispatch", daemon=True)
+
+    def start(self):
+        if self._monitor is not None:
+            self._monitor.start(current=self._drives)
+        self._dispatcher.start()
+        self._warm()
+
+    def stop(self):
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.stop()
+        self.runner.shutdown()
+
+    def _dispatch_loop(self):
+        # Job callbacks only fire from dispatch(); this thread plays the GUI's _poll_jobs.
+        while not self._stop.wait(DISPATCH_INTERVAL):
+            self.runner.dispatch()
+
+    def _drives_changed(self, drives):
+        with self._lock:
+            self._drives = drives
+
+    def drives(self):
+        with self._lock:
+            return list(self._drives)
+
+    def _warm(self):
+        """Resolves the default toolchain and compiles its launcher or headers before the first request needs them."""
+        backend, tool = self.toolchain()
+        if tool and backend in LAUNCHER_BACKENDS:
+            from .stub import ensure_stub
+
+            self._submit("warm", {"backend": backend}, ensure_stub, tool, LAUNCHER_BACKENDS[backend], to_json=str)
+        elif tool and backend == "mingw":
+            from .toolchain import ensure_pch, toolchain_for
+
+            self._submit("warm", {"backend": backend}, ensure_pch, toolchain_for(tool), to_json=str)
+
+    def toolchain(self, backend=None):
+        """Returns (backend, tool), resolving each backend once; a missing tool is looked for again."""
+        with self._lock:
+            known = self._toolchains.get(backend)
+        if known and known[1]:
+            return known
+        resolved = resolve_backend(backend)
+        with self._lock:
+            self._toolchains[backend] = resolved
+        return resolved
+
+    # --- jobs ---
+    def _submit(self, kind, params, func, *args, to_json=None):
+        record = JobRecord(str(next(self._ids)), kind, params)
+        tracer = Tracer(f"daemon {kind}")
+
+        def finish(state, result=None, error=""):
+            record.result = to_json(result) if to_json and result is not None else None
+            record.error = error
+            record.timing = tracer.finish("ok" if state == "done" else state)
+            record.finished = time.time()
+            record.state = state
+            record.done.set()
+
+        with self._lock:
+            self._jobs[record.id] = record
+            finished = [key for key, old in self._jobs.items() if old.done.is_set()]
+            for key in finished[: max(0, len(self._jobs) - JOB_HISTORY)]:
+                del self._jobs[key]
+        record.job = self.runner.submit(
+            f"{kind} {record.id}",
+            func,
+            *args,
+            on_progress=record.add_progress,
+            on_done=lambda result: finish("done", result),
+            on_error=lambda exc: finish("error", error=str(exc)),
+            on_cancel=lambda: finish("cancelled"),
+            tracer=tracer,
+        )
+        return record
+
+    def job(self, job_id):
+        with self._lock:
+            record = self._jobs.get(job_id)
+        if record is None:
+            raise DaemonError(f"No job {job_id}.", 404)
+        return record
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    # --- builds ---
+    def _artifact_path(self, content, backend, tool, name):
+        key = BuildCache.make_key(content, backend, tool, tool_version(tool), BUILD_BACKENDS[backend][1])
+        return os.path.join(self.artifact_dir, key[:32], name)
+
+    def _build_artifact(self, job, backend, tool, content, path):
+        """Builds into the artifact store, or returns the artifact already there. Returns a BuildResult."""
+        with self._lock:
+            known = path in self._artifacts
+            if known:
+                self._artifacts.move_to_end(path)
+        if known and os.path.isfile(path):
+            with job.span("artifact hit"):
+                return BuildResult(path, backend, cached=True, size=os.path.getsize(path))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Identical requests may build side by side; each publishes a whole file by rename.
+        tmp_path = os.path.join(os.path.dirname(path), f"{job.name.replace(' ', '-')}-{os.path.basename(path)}")
+        result = build_exe(job, backend, tool, content, tmp_path, self.cache)
+        os.replace(tmp_path, path)
+        result.path = path
+        with self._lock:
+            self._artifacts[path] = True
+            evicted = list(self._artifacts)[: max(0, len(self._artifacts) - ARTIFACT_LIMIT)]
+            for old in evicted:
+                del self._artifacts[old]
+        for old in evicted:
+            try:
+                os.remove(old)
+                os.rmdir(os.path.dirname(old))
+            except OSError:
+                pass
+        return result
+
+    def artifacts(self):
+        with self._lock:
+            paths = list(self._artifacts)
+        listing = []
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            listing.append({"path": path, "size": size})
+        return listing
+
+    def _resolve_script(self, params):
+        content = normalize_batch(_field(params, "script", str))
+        if not content:
+            raise DaemonError("The batch script is empty.")
+        backend, tool = self.toolchain(_field(params, "backend", str, required=False))
+        if not tool:
+            raise DaemonError(f"No {backend} toolchain found on PATH.", 503)
+        name = os.path.basename(_field(params, "name", str, required=False) or DEFAULT_EXE_NAME)
+        return content, backend, tool, name
+
+    def build(self, params):
+        content, backend, tool, name = self._resolve_script(params)
+        output = _field(params, "output", str, required=False)
+        if output:
+            func, args = build_exe, (backend, tool, content, os.path.abspath(output), self.cache)
+        else:
+            path = self._artifact_path(content, backend, tool, name)
+            func, args = self._build_artifact, (backend, tool, content, path)
+        return self._submit("build", params, func, *args, to_json=_build_json)
+
+    # --- provisioning ---
+    def provision(self, params):
+        drives = params.get("drives")
+        if drives == "removable":
+            drives = [info.path for info in self.drives() if info.removable]
+        if not isinstance(drives, list) or not drives or not all(isinstance(drive, str) for drive in drives):
+            raise DaemonError('"drives" must be a non-empty list of mount points, or "removable".')
+        missing = [drive for drive in drives if not os.path.isdir(drive)]
+        if missing:
+            raise DaemonError(f"Drive '{missing[0]}' does not exist.")
+        label = _field(params, "label", str, required=False) or ""
+        payload = _field(params, "payload", str, required=False)
+        verify = params.get("verify", True) is not False
+        exe = _field(params, "exe", str, required=False)
+        script = None
+        if exe:
+            if not os.path.isfile(exe):
+                raise DaemonError(f"File not found: {exe}")
+            if payload:
+                check_payload_dir(payload, exe)
+        elif "script" in params:
+            if payload:
+                raise DaemonError('"payload" needs "exe": a built script cannot sit inside a payload folder.')
+            content, backend, tool, name = self._resolve_script(params)
+            script = (backend, tool, content, self._artifact_path(content, backend, tool, name))
+        else:
+            raise DaemonError('Give "exe" or "script".')
+        return self._submit(
+            "provision", params, self._run_provision, drives, exe, script, label, payload, verify, to_json=lambda r: r
+        )
+
+    def _run_provision(self, job, drives, exe, script, label, payload, verify):
+        data = {}
+        if script:
+            built = self._build_artifact(job, *script)
+            exe = built.path
+            data["build"] = _build_json(built)
+        started = time.monotonic()
+        results = provision_drives(job, drives, exe, label, PROVISION_MAX_WORKERS, payload, verify)
+        elapsed = time.monotonic() - started
+        data["drives"] = [dict(vars(result), rate=result.rate) for result in results]
+        data["ok"] = all(result.ok for result in results)
+        data["summary"] = summarize_results(results, elapsed)
+        return data
+
+    # --- requests ---
+    def status(self):
+        jobs = self.jobs()
+        # Request threads add toolchains and artifacts while this runs; read them under the lock.
+        with self._lock:
+            toolchains = list(self._toolchains.items())
+            artifacts = len(self._artifacts)
+        return {
+            "pid": os.getpid(),
+            "uptime_s": time.time() - self.started,
+            "drives": [dict(vars(info), describe=info.describe()) for info in self.drives()],
+            "toolchains": {
+                requested or "default": {"backend": backend, "tool": tool} for requested, (backend, tool) in toolchains
+            },
+            "cache": self.cache.stats(),
+            "artifacts": artifacts,
+            "jobs": {
+                state: sum(1 for record in jobs if record.state == state)
+                for state in ("running", "done", "error", "cancelled")
+            },
+        }
+
+    def handle(self, method, path, body, query=""):
+        """Routes one request. Returns (JSON-able response, whether the daemon should stop after it)."""
+        parts = [part for part in path.split("/") if part]
+        if method == "GET" and parts == ["status"]:
+            return self.status(), False
+        if method == "GET" and parts == ["drives"]:
+            return [dict(vars(info), describe=info.describe()) for info in self.drives()], False
+        if method == "GET" and parts == ["artifacts"]:
+            return self.artifacts(), False
+        if method == "GET" and parts == ["jobs"]:
+            return [record.to_json(progress=False) for record in self.jobs()], False
+        if method == "GET" and len(parts) == 2 and parts[0] == "jobs":
+            record = self.job(parts[1])
+            wait = _query_float(query, "wait")
+            if wait:
+                record.done.wait(wait)
+            return record.to_json(), False
+        if method == "POST" and len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            record = self.job(parts[1])
+            if record.job is not None:
+                record.job.cancel()
+            return record.to_json(), False
+        if method == "POST" and parts in (["build"], ["provision"]):
+            record = self.build(body) if parts == ["build"] else self.provision(body)
+            if body.get("wait"):
+                record.done.wait(_number(body.get("timeout")))
+            return record.to_json(), False
+        if method == "POST" and parts == ["shutdown"]:
+            return {"stopping": True}, True
+        raise DaemonError(f"No such endpoint: {method} {path}", 404)
+
+
+def _field(params, name, kind, required=True):
+    value = params.get(name)
+    if value is None and not required:
+        return None
+    if not isinstance(value, kind):
+        raise DaemonError(f'"{name}" must be a {kind.__name__}.')
+    return value
+
+
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) and value > 0 else None
+
+
+def _query_float(query, name):
+    for pair in query.split("&"):
+        key, _, value = pair.partition("=")
+        if key == name:
+            try:
+                return float(value or 0) or None
+            except ValueError:
+                raise DaemonError(f"{name} must be a number.") from None
+    return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "AutoUSB"
+    # Keep-alive lets a client send many requests over one connection.
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._serve("GET")
+
+    def do_POST(self):
+        self._serve("POST")
+
+    def _serve(self, method):
+        stop = False
+        try:
+            body = self._read_body()
+            token = self.server.token
+            if token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ""), token):
+                raise DaemonError("Missing or wrong token.", 401)
+            path, _, query = self.path.partition("?")
+            payload, stop = self.server.daemon.handle(method, path, body, query)
+            status = 200
+        except DaemonError as exc:
+            status, payload = exc.status, {"error": str(exc)}
+        except (BuildError, ProvisionError, PreflightError, OSError) as exc:
+            status, payload = 400, {"error": str(exc)}
+        except Exception as exc:
+            status, payload = 500, {"error": f"{type(exc).__name__}: {exc}"}
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        if stop:
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError as exc:
+            raise DaemonError(f"Request body is not JSON: {exc}") from None
+        if not isinstance(body, dict):
+            raise DaemonError("Request body must be a JSON object.")
+        return body
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) pair.
+        return request, ("local", 0)
+
+
+def _publish_state(info):
+    path = state_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as fh:
+        json.dump(info, fh)
+    os.replace(tmp, path)
+
+
+def _withdraw_state():
+    try:
+        with open(state_path(), encoding="utf-8") as fh:
+            ours = json.load(fh).get("pid") == os.getpid()
+    except (OSError, ValueError):
+        return
+    if ours:
+        try:
+            os.remove(state_path())
+        except OSError:
+            pass
+
+
+def _claim_socket_path(socket_path):
+    """Removes a stale socket left by a daemon that died; refuses anything else at socket_path."""
+    try:
+        st = os.lstat(socket_path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(st.st_mode):
+        raise DaemonError(f"{socket_path} exists and is not a socket; not replacing it.", 409)
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        os.remove(socket_path)
+        return
+    except OSError as exc:
+        raise DaemonError(f"Could not check {socket_path}: {exc}", 409) from None
+    finally:
+        probe.close()
+    raise DaemonError(f"A daemon is already listening on {socket_path}.", 409)
+
+
+def make_server(host=DAEMON_HOST, port=DAEMON_PORT, socket_path=None, daemon=None, verbose=False):
+    """Binds the API to host:port, or to a Unix socket, and publishes where to reach it."""
+    if socket_path:
+        _claim_socket_path(socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            server = _UnixServer(socket_path, _Handler)
+        finally:
+            os.umask(old_umask)
+        server.token = ""
+        info = {"pid": os.getpid(), "socket": os.path.abspath(socket_path)}
+    else:
+        server = _TCPServer((host, port), _Handler)
+        server.token = secrets.token_urlsafe(32)
+        info = {"pid": os.getpid(), "url": f"http://{host}:{server.server_address[1]}", "token": server.token}
+    server.daemon = daemon or Daemon()
+    server.verbose = verbose
+    server.info = info
+    return server
+
+
+def serve(host=DAEMON_HOST, port=DAEMON_PORT, socket_path=None, verbose=False, on_ready=None):
+    """Runs the daemon until a /shutdown request or KeyboardInterrupt."""
+    server = make_server(host, port, socket_path, verbose=verbose)
+    server.daemon.start()
+    _publish_state(server.info)
+    if on_ready:
+        on_ready(server.info)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.daemon.stop()
+        _withdraw_state()
+        if socket_path:
+            try:
+                os.remove(socket_path)
+            except OSError:
+                pass
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class DaemonClient:
+    """Talks to a running daemon over one kept-alive connection.
+
+    Without an explicit url or socket path, it reads what the daemon published in daemon.json.
+    """
+
+    def __init__(self, url=None, socket_path=None, token=None, timeout=None):
+        if not url and not socket_path:
+            try:
+                with open(state_path(), encoding="utf-8") as fh:
+                    info = json.load(fh)
+            except (OSError, ValueError):
+                raise DaemonError("No daemon is running (start one with: python main.py serve).", 503) from None
+            url, socket_path, token = info.get("url"), info.get("socket"), token or info.get("token")
+        self.token = token or ""
+        if socket_path:
+            self._connect = lambda: _UnixConnection(socket_path, timeout)
+        else:
+            host_port = url.split("://", 1)[-1].rstrip("/")
+            self._connect = lambda: http.client.HTTPConnection(host_port, timeout=timeout)
+        self._conn = None
+
+    def request(self, method, path, body=None):
+        """Sends one request and returns the decoded JSON. Raises DaemonError on an error status."""
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers[TOKEN_HEADER] = self.token
+        for attempt in (1, 2):
+            if self._conn is None:
+                self._conn = self._connect()
+            try:
+                self._conn.request(method, path, body=data, headers=headers)
+                response = self._conn.getresponse()
+                payload = json.loads(response.read() or b"null")
+                break
+            except (ConnectionError, http.client.HTTPException) as exc:
+                # A kept-alive connection the daemon closed: reconnect once.
+                self.close()
+                if attempt == 2:
+                    raise DaemonError(f"Could not reach the daemon: {exc}", 503) from exc
+            except OSError as exc:
+                self.close()
+                raise DaemonError(f"Could not reach the daemon: {exc}", 503) from exc
+        if response.status >= 400:
+            message = payload.get("error", response.reason) if isinstance(payload, dict) else response.reason
+            raise DaemonError(message, response.status)
+        return payload
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def status(self):
+        return self.request("GET", "/status")
+
+    def drives(self):
+        return self.request("GET", "/drives")
+
+    def build(self, script, wait=False, **params):
+        return self.request("POST", "/build", dict(params, script=script, wait=wait))
+
+    def provision(self, drives, wait=False, **params):
+        return self.request("POST", "/provision", dict(params, drives=drives, wait=wait))
+
+    def artifacts(self):
+        return self.request("GET", "/artifacts")
+
+    def job(self, job_id, wait=None):
+        return self.request("GET", f"/jobs/{job_id}" + (f"?wait={wait}" if wait else ""))
+
+    def cancel(self, job_id):
+        return self.request("POST", f"/jobs/{job_id}/cancel")
+
+    def shutdown(self):
+        return self.request("POST", "/shutdown")
@@ -0,0 +1,309 @@
+"""Drive discovery from the mount table and sysfs, plus a change monitor."""
+import os
+import re
+import select
+import stat
+import threading
+
+from .util import format_bytes
+
+MOUNTINFO_PATH = "/proc/self/mountinfo"
+SYSFS_ROOT = "/sys"
+MOUNT_ROOTS = ("/media", "/run/media")
+DRIVE_POLL_INTERVAL = 2.0
+
+_MOUNTINFO_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+
+class DriveInfo:
+    """A mounted drive plus the metadata sysfs exposes about its device."""
+
+    def __init__(self, path, fstype="", source="", dev="", removable=None, size=None):
+        self.path = path
+        self.fstype = fstype
+        self.source = source
+        self.dev = dev
+        self.removable = removable
+        self.size = size
+
+    def describe(self):
+        parts = [self.fstype] if self.fstype else []
+        if self.size:
+            parts.append(format_bytes(self.size))
+        if self.removable:
+            parts.append("removable")
+        return ", ".join(parts)
+
+    def __eq__(self, other):
+        return isinstance(other, DriveInfo) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return f"DriveInfo({self.path!r}, {self.describe()!r})"
+
+
+def _unescape_mount_field(field):
+    return _MOUNTINFO_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), field)
+
+
+def parse_mountinfo(text):
+    """Parses mountinfo text into (mount_point, fstype, source, "major:minor") tuples."""
+    mounts = []
+    for line in text.splitlines():
+        fields = line.split()
+        try:
+            sep = fields.index("-", 6)
+        except ValueError:
+            continue
+        if len(fields) < sep + 3:
+            continue
+        mounts.append(
+            (
+                _unescape_mount_field(fields[4]),
+                fields[sep + 1],
+                _unescape_mount_field(fields[sep + 2]),
+                fields[2],
+            )
+        )
+    return mounts
+
+
+def _drive_bases(user):
+    bases = set()
+    for root in MOUNT_ROOTS:
+        bases.add(root)
+        if user:
+            bases.add(os.path.join(root, user))
+    return bases
+
+
+def _sysfs_block_dir(dev, sysfs_root=SYSFS_ROOT):
+    """Returns the sysfs directory for a "major:minor" block device, or "" if unknown."""
+    path = os.path.realpath(os.path.join(sysfs_root, "dev", "block", dev))
+    return path if os.path.isdir(path) else ""
+
+
+def _sysfs_disk_dir(dev, sysfs_root=SYSFS_ROOT):
+    """Like _sysfs_block_dir but resolves partitions to their whole-disk directory."""
+    path = _sysfs_block_dir(dev, sysfs_root)
+    # Partitions sit one level below their whole-disk entry in sysfs.
+    if path and os.path.exists(os.path.join(path, "partition")):
+        path = os.path.dirname(path)
+    return path
+
+
+def _read_sysfs_int(path):
+    try:
+        with open(path, encoding="ascii") as fh:
+            return int(fh.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def scan_drives(mountinfo_text, sysfs_root=SYSFS_ROOT, user=None):
+    """Returns DriveInfo for every mount directly under a removable-media root."""
+    if user is None:
+        user = os.getenv("USER") or os.getenv("USERNAME") or ""
+    bases = _drive_bases(user)
+    drives = {}
+    for mount_point, fstype, source, dev in parse_mountinfo(mountinfo_text):
+        if os.path.dirname(mount_point) not in bases:
+            continue
+        # Later entries shadow earlier mounts on the same point.
+        info = DriveInfo(mount_point, fstype, source, dev)
+        block_dir = _sysfs_block_dir(dev, sysfs_root)
+        if block_dir:
+            sectors = _read_sysfs_int(os.path.join(block_dir, "size"))
+            info.size = sectors * 512 if sectors is not None else None
+            removable = _read_sysfs_int(os.path.join(_sysfs_disk_dir(dev, sysfs_root), "removable"))
+            info.removable = bool(removable) if removable is not None else None
+        drives[mount_point] = info
+    return list(drives.values())
+
+
+def _read_mountinfo(path=MOUNTINFO_PATH):
+    try:
+        with open(path, encoding="utf-8", errors="surrogateescape") as fh:
+            return fh.read()
+    except OSError:
+        return None
+
+
+def _windows_drive_mask():
+    try:
+        import ctypes
+
+        return ctypes.windll.kernel32.GetLogicalDrives()
+    except (ImportError, AttributeError, OSError):
+        return None
+
+
+def _windows_drives(mask=None):
+    if mask is None:
+        mask = _windows_drive_mask()
+    drives = []
+    for letter in "CDEFGHIJKLMNOPQRSTUVWXYZ":
+        path = f"{letter}:"
+        if mask is not None:
+            if mask & (1 << (ord(letter) - ord("A"))):
+                drives.append(path)
+        elif os.path.exists(path):
+            drives.append(path)
+    return drives
+
+
+def _walk_mount_roots():
+    drives = []
+    user = os.getenv("USER") or os.getenv("USERNAME") or ""
+    mount_roots = ["/media", "/run/media"]
+    for root in mount_roots:
+        if not os.path.isdir(root):
+            continue
+        bases = []
+        if user and os.path.isdir(os.path.join(root, user)):
+            bases.append(os.path.join(root, user))
+        bases.append(root)
+        for base in bases:
+            if not os.path.isdir(base):
+                continue
+            for name in os.listdir(base):
+                path = os.path.join(base, name)
+                if os.path.ismount(path):
+                    drives.append(path)
+    return drives
+
+
+def list_drive_info():
+    """Lists available drives with metadata. Linux reads mountinfo; elsewhere only paths are known."""
+    if os.name == "nt":
+        return [DriveInfo(path) for path in _windows_drives()]
+    text = _read_mountinfo()
+    if text is None:
+        return [DriveInfo(path) for path in _walk_mount_roots()]
+    return scan_drives(text)
+
+
+def list_drives():
+    """Lists available drives on Windows & Linux."""
+    return [info.path for info in list_drive_info()]
+
+
+class DriveMonitor:
+    """Watches the mount table and calls on_change(list of DriveInfo) from a background thread.
+
+    On Linux the thread sleeps in poll() on mountinfo, which the kernel wakes on every mount
+    or unmount, so the table is parsed once per change. Other platforms poll cheaply.
+    """
+
+    def __init__(self, on_change, mountinfo_path=MOUNTINFO_PATH, sysfs_root=SYSFS_ROOT, interval=DRIVE_POLL_INTERVAL):
+        self.on_change = on_change
+        self.mountinfo_path = mountinfo_path
+        self.sysfs_root = sysfs_root
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._known = None
+
+    def start(self, current=None):
+        """Starts watching. Pass the list the caller already has to skip re-announcing it."""
+        self._known = current
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="autousb-drive-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        if os.name == "nt":
+            self._run_windows()
+        elif hasattr(select, "poll") and os.path.exists(self.mountinfo_path):
+            self._run_mountinfo()
+        else:
+            self._run_polling()
+
+    def _emit(self, drives, last):
+        if drives != last:
+            self.on_change(drives)
+        return drives
+
+    def _run_mountinfo(self):
+        last = self._known
+        with open(self.mountinfo_path, "rb") as fh:
+            poller = select.poll()
+            poller.register(fh.fileno(), select.POLLPRI | select.POLLERR)
+            changed = True
+            while not self._stop.is_set():
+                if changed:
+                    fh.seek(0)
+                    text = fh.read().decode("utf-8", "surrogateescape")
+                    last = self._emit(scan_drives(text, self.sysfs_root), last)
+                changed = bool(poller.poll(self.interval * 1000))
+
+    def _run_windows(self):
+        last_mask = object()
+        last = self._known
+        while not self._stop.is_set():
+            mask = _windows_drive_mask()
+            if mask is None or mask != last_mask:
+                last_mask = mask
+                last = self._emit([DriveInfo(path) for path in _windows_drives(mask)], last)
+            self._stop.wait(self.interval)
+
+    def _run_polling(self):
+        last = self._known
+        while not self._stop.is_set():
+            last = self._emit(list_drive_info(), last)
+            self._stop.wait(self.interval)
+
+
+def filesystem_type(path):
+    """Returns the filesystem type holding path ("vfat", "exfat", "FAT32", ...), or "" if unknown."""
+    if os.name == "nt":
+        import ctypes
+
+        name = ctypes.create_unicode_buffer(32)
+        root = os.path.splitdrive(os.path.abspath(path))[0] + "\\"
+        ok = ctypes.windll.kernel32.GetVolumeInformationW(root, None, 0, None, None, None, name, len(name))
+        return name.value if ok else ""
+    text = _read_mountinfo()
+    if text is None:
+        return ""
+    target = os.path.realpath(path)
+    best, fstype = "", ""
+    for mount_point, mount_fstype, _source, _dev in parse_mountinfo(text):
+        inside = target == mount_point or target.startswith(mount_point.rstrip("/") + "/")
+        # Later entries shadow earlier mounts on the same point.
+        if inside and len(mount_point) >= len(best):
+            best, fstype = mount_point, mount_fstype
+    return fstype
+
+
+def device_mount_point(path, mountinfo_text=None, sysfs_root=SYSFS_ROOT):
+    """Returns where block device path, or any partition on it, is mounted; "" if nowhere."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    if not stat.S_ISBLK(st.st_mode):
+        return ""
+    dev = f"{os.major(st.st_rdev)}:{os.minor(st.st_rdev)}"
+    disk = _sysfs_disk_dir(dev, sysfs_root) or dev
+    if mountinfo_text is None:
+        mountinfo_text = _read_mountinfo() or ""
+    for mount_point, _fstype, _source, mount_dev in parse_mountinfo(mountinfo_text):
+        if mount_dev == dev or (_sysfs_disk_dir(mount_dev, sysfs_root) or mount_dev) == disk:
+            return mount_point
+    return ""
+
+
+def physical_device(path):
+    """Returns a key shared by all mount points that live on the same physical device."""
+    if os.name == "nt":
+        return os.path.splitdrive(os.path.abspath(path))[0].upper()
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path
+    dev_id = f"{os.major(st.st_dev)}:{os.minor(st.st_dev)}"
+    disk_dir = _sysfs_disk_dir(dev_id)
+    return os.path.basename(disk_dir) if disk_dir else dev_id
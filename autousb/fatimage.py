@@ -0,0 +1,473 @@
+"""FAT32 images built in pure Python, and a writer that streams one image to many targets.
+
+For bulk duplication the payload, autorun.inf and volume label are laid out once into an
+image file: an MBR with one FAT32 (LBA) partition at 1 MiB, then the filesystem. Clusters
+are allocated contiguously from the start of the data region, so everything in use sits
+below a single high-water mark. write_image copies only that prefix to each target in large
+sequential blocks, one thread per target, leaving the unused clusters alone.
+"""
+import array
+import mmap
+import os
+import stat
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .drives import device_mount_point
+from .jobs import JobCancelled
+from .provision import PROVISION_MAX_WORKERS, DriveResult, autorun_content, start_file_name
+from .sync import scan_tree
+from .util import format_bytes
+
+SECTOR_SIZE = 512
+RESERVED_SECTORS = 32
+NUM_FATS = 2
+PARTITION_OFFSET = 1024 * 1024
+IMAGE_BLOCK_SIZE = 4 * 1024 * 1024
+MIN_IMAGE_SIZE = 64 * 1024 * 1024
+MIN_FAT32_CLUSTERS = 65525
+FAT_EOC = 0x0FFFFFFF
+PROGRESS_INTERVAL = 0.2
+
+ATTR_VOLUME_ID = 0x08
+ATTR_DIRECTORY = 0x10
+ATTR_ARCHIVE = 0x20
+ATTR_LFN = 0x0F
+
+_BPB = struct.Struct("<3s8sHBHBHHBHHHIIIHHIHH12sBBBI11s8s")
+_DIRENT = struct.Struct("<11sBBBHHHHHHHI")
+_LFN = struct.Struct("<B10sBBB12sH4s")
+_PARTITION = struct.Struct("<B3sB3sII")
+_SHORT_NAME_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!#$%&'()-@^_`{}~")
+
+
+class ImageError(Exception):
+    """Raised when the payload cannot be laid out as FAT32 or a target cannot take the image."""
+
+
+class _Node:
+    def __init__(self, name, is_dir=False, source=None, data=None, size=0, mtime=None):
+        self.name = name
+        self.is_dir = is_dir
+        self.source = source
+        self.data = data
+        self.size = size
+        self.mtime = time.time() if mtime is None else mtime
+        self.children = {}
+        self.short_name = b""
+        self.needs_lfn = False
+        self.first_cluster = 0
+        self.clusters = 0
+
+
+class FatImage:
+    """A built image: its path and size, and the (offset, length) extents that hold data."""
+
+    def __init__(self, path, size, extents, files, cluster_size):
+        self.path = path
+        self.size = size
+        self.extents = extents
+        self.files = files
+        self.cluster_size = cluster_size
+
+    @property
+    def used_bytes(self):
+        return sum(length for _offset, length in self.extents)
+
+    def describe(self):
+        return (
+            f"{self.files} file{'s' if self.files != 1 else ''}, {format_bytes(self.used_bytes)} used "
+            f"of {format_bytes(self.size)} ({format_bytes(self.cluster_size)} clusters)"
+        )
+
+
+def volume_label(label):
+    """Returns label as an 11-byte FAT volume label; characters FAT rejects become "_"."""
+    text = "".join(c if c in _SHORT_NAME_CHARS or c == " " else "_" for c in label.upper())[:11]
+    return (text or "NO NAME").ljust(11).encode("ascii")
+
+
+def _sectors_per_cluster(volume_sectors):
+    # Microsoft's FAT32 defaults: 512 B clusters up to 260 MB, then 4, 8, 16 and 32 KB.
+    for limit, spc in ((532480, 1), (16777216, 8), (33554432, 16), (67108864, 32)):
+        if volume_sectors <= limit:
+            return spc
+    return 64
+
+
+def _fat_geometry(volume_sectors):
+    """Returns (sectors per cluster, sectors per FAT, cluster count) for a FAT32 volume."""
+    spc = _sectors_per_cluster(volume_sectors)
+    fat_sectors = 1
+    while True:
+        clusters = (volume_sectors - RESERVED_SECTORS - NUM_FATS * fat_sectors) // spc
+        needed = -(-(clusters + 2) * 4 // SECTOR_SIZE)
+        if needed <= fat_sectors:
+            break
+        fat_sectors = needed
+    if clusters < MIN_FAT32_CLUSTERS:
+        raise ImageError(f"{format_bytes(volume_sectors * SECTOR_SIZE)} is too small for FAT32.")
+    return spc, fat_sectors, clusters
+
+
+def _split_name(upper):
+    if "." in upper.lstrip("."):
+        base, _dot, ext = upper.rpartition(".")
+        return base, ext
+    return upper, ""
+
+
+def _short_name(name, taken):
+    """Returns (11-byte short name, whether a long-name entry is needed), unique within taken."""
+    upper = name.upper()
+    base, ext = _split_name(upper)
+    if (
+        name == upper
+        and 0 < len(base) <= 8
+        and len(ext) <= 3
+        and all(c in _SHORT_NAME_CHARS for c in base + ext)
+    ):
+        short = (base.ljust(8) + ext.ljust(3)).encode("ascii")
+        if short not in taken:
+            return short, False
+
+    def clean(part):
+        return "".join(c if c in _SHORT_NAME_CHARS else "_" for c in part.replace(" ", "").replace(".", ""))
+
+    base, ext = clean(base) or "_", clean(ext)[:3]
+    for n in range(1, 1000000):
+        tail = f"~{n}"
+        short = (base[: 8 - len(tail)] + tail).ljust(8) + ext.ljust(3)
+        short = short.encode("ascii")
+        if short not in taken:
+            return short, True
+    raise ImageError(f"Too many files resembling {name!r} in one folder.")
+
+
+def _lfn_checksum(short):
+    total = 0
+    for byte in short:
+        total = (((total & 1) << 7) + (total >> 1) + byte) & 0xFF
+    return total
+
+
+def _lfn_entries(name, checksum):
+    units = name.encode("utf-16-le")
+    if len(units) > 255 * 2:
+        raise ImageError(f"File name too long for FAT: {name}")
+    if len(units) % 26:
+        units += b"\0\0"
+        units += b"\xff" * (-len(units) % 26)
+    count = len(units) // 26
+    entries = []
+    for seq in range(count, 0, -1):
+        chars = units[(seq - 1) * 26 : seq * 26]
+        order = seq | (0x40 if seq == count else 0)
+        entries.append(_LFN.pack(order, chars[0:10], ATTR_LFN, 0, checksum, chars[10:22], 0, chars[22:26]))
+    return entries
+
+
+def _dos_datetime(timestamp):
+    t = time.localtime(max(timestamp, 315532800))  # FAT dates start in 1980
+    return ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday, (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+
+
+def _dirent(short, attr, cluster, size, mtime):
+    date, clock = _dos_datetime(mtime)
+    return _DIRENT.pack(short, attr, 0, 0, clock, date, date, cluster >> 16, clock, date, cluster & 0xFFFF, size)
+
+
+class FatImageBuilder:
+    """Collects files and a label, then lays them out as a FAT32 image with build()."""
+
+    def __init__(self, label=""):
+        self.label = volume_label(label)
+        self.root = _Node("", is_dir=True)
+        self.files = 0
+        self.payload_bytes = 0
+
+    def _parent(self, path):
+        node = self.root
+        for part in path.split("/")[:-1]:
+            child = node.children.get(part.upper())
+            if child is None:
+                child = node.children[part.upper()] = _Node(part, is_dir=True)
+            elif not child.is_dir:
+                raise ImageError(f"{part} is both a file and a folder.")
+            node = child
+        return node, path.split("/")[-1]
+
+    def _add(self, path, node):
+        parent, name = self._parent(path)
+        node.name = name
+        # FAT names are case-insensitive, so "A.txt" and "a.TXT" are the same entry.
+        parent.children[name.upper()] = node
+        self.files += 1
+        self.payload_bytes += node.size
+
+    def add_file(self, path, source):
+        """Adds source at path, a "/"-separated location inside the image."""
+        st = os.stat(source)
+        self._add(path, _Node("", source=source, size=st.st_size, mtime=st.st_mtime))
+
+    def add_bytes(self, path, data, mtime=None):
+        self._add(path, _Node("", data=bytes(data), size=len(data), mtime=mtime))
+
+    def default_size(self):
+        """A size with roughly 10% headroom over the payload, never below MIN_IMAGE_SIZE."""
+        size = int(self.payload_bytes * 1.1) + 8 * 1024 * 1024
+        size = -(-size // (1024 * 1024)) * 1024 * 1024
+        return max(MIN_IMAGE_SIZE, size)
+
+    def _walk(self, node):
+        yield node
+        for child in node.children.values():
+            if child.is_dir:
+                yield from self._walk(child)
+            else:
+                yield child
+
+    def _layout(self, cluster_bytes, total_clusters):
+        next_cluster = 2
+        for node in self._walk(self.root):
+            if node.is_dir:
+                taken = set()
+                entries = 1 if node is self.root else 2
+                for child in node.children.values():
+                    child.short_name, child.needs_lfn = _short_name(child.name, taken)
+                    taken.add(child.short_name)
+                    entries += 1 + (-(-len(child.name.encode("utf-16-le")) // 26) if child.needs_lfn else 0)
+                node.clusters = max(1, -(-entries * 32 // cluster_bytes))
+            else:
+                node.clusters = -(-node.size // cluster_bytes)
+            if node.clusters:
+                node.first_cluster = next_cluster
+                next_cluster += node.clusters
+        if next_cluster - 2 > total_clusters:
+            raise ImageError(
+                f"The payload needs {format_bytes((next_cluster - 2) * cluster_bytes)}, "
+                f"more than the {format_bytes(total_clusters * cluster_bytes)} image."
+            )
+        return next_cluster
+
+    def _directory_bytes(self, node, parent_cluster):
+        entries = []
+        if node is self.root:
+            entries.append(_dirent(self.label, ATTR_VOLUME_ID, 0, 0, time.time()))
+        else:
+            entries.append(_dirent(b".          ", ATTR_DIRECTORY, node.first_cluster, 0, node.mtime))
+            entries.append(_dirent(b"..         ", ATTR_DIRECTORY, parent_cluster, 0, node.mtime))
+        for child in node.children.values():
+            if child.needs_lfn:
+                entries.extend(_lfn_entries(child.name, _lfn_checksum(child.short_name)))
+            attr = ATTR_DIRECTORY if child.is_dir else ATTR_ARCHIVE
+            entries.append(_dirent(child.short_name, attr, child.first_cluster, 0 if child.is_dir else child.size, child.mtime))
+        return b"".join(entries)
+
+    def build(self, image_path, size=None, partitioned=True, job=None):
+        """Writes the image to image_path (sparse where the filesystem is empty). Returns a FatImage."""
+        size = size or self.default_size()
+        base = PARTITION_OFFSET if partitioned else 0
+        volume_sectors = (size - base) // SECTOR_SIZE
+        spc, fat_sectors, total_clusters = _fat_geometry(volume_sectors)
+        cluster_bytes = spc * SECTOR_SIZE
+        next_cluster = self._layout(cluster_bytes, total_clusters)
+
+        fat_offset = base + RESERVED_SECTORS * SECTOR_SIZE
+        data_offset = fat_offset + NUM_FATS * fat_sectors * SECTOR_SIZE
+
+        def cluster_offset(cluster):
+            return data_offset + (cluster - 2) * cluster_bytes
+
+        fat = array.array("I", bytes(4 * (total_clusters + 2)))
+        fat[0], fat[1] = 0x0FFFFFF8, FAT_EOC
+        for node in self._walk(self.root):
+            if node.clusters:
+                start, end = node.first_cluster, node.first_cluster + node.clusters
+                fat[start : end - 1] = array.array("I", range(start + 1, end))
+                fat[end - 1] = FAT_EOC
+        if sys.byteorder == "big":
+            fat.byteswap()
+
+        free_clusters = total_clusters - (next_cluster - 2)
+        with open(image_path, "wb") as fh:
+            fd = fh.fileno()
+            fh.truncate(size)
+            if partitioned:
+                os.pwrite(fd, _mbr(base // SECTOR_SIZE, volume_sectors), 0)
+            boot = _boot_sector(spc, base // SECTOR_SIZE, volume_sectors, fat_sectors, self.label)
+            fsinfo = _fsinfo_sector(free_clusters, next_cluster)
+            tail = bytes(SECTOR_SIZE - 2) + b"\x55\xaa"
+            for first in (0, 6):
+                os.pwrite(fd, boot + fsinfo + tail, base + first * SECTOR_SIZE)
+            fat_bytes = fat.tobytes()
+            for copy in range(NUM_FATS):
+                os.pwrite(fd, fat_bytes, fat_offset + copy * fat_sectors * SECTOR_SIZE)
+            self._write_nodes(fd, self.root, 0, cluster_offset, job)
+
+        used_end = cluster_offset(next_cluster)
+        return FatImage(image_path, size, [(0, used_end)], self.files, cluster_bytes)
+
+    def _write_nodes(self, fd, node, parent_cluster, cluster_offset, job):
+        os.pwrite(fd, self._directory_bytes(node, parent_cluster), cluster_offset(node.first_cluster))
+        # ".." of a first-level folder points at cluster 0, which means the root.
+        own_cluster = 0 if node is self.root else node.first_cluster
+        for child in node.children.values():
+            if job is not None:
+                job.check_cancelled()
+            if child.is_dir:
+                self._write_nodes(fd, child, own_cluster, cluster_offset, job)
+            elif child.data is not None:
+                os.pwrite(fd, child.data, cluster_offset(child.first_cluster))
+            elif child.size:
+                if job is not None and child.size >= IMAGE_BLOCK_SIZE:
+                    job.report(f"Adding {child.name} to the image")
+                _copy_into(fd, child.source, cluster_offset(child.first_cluster), job)
+
+
+def _copy_into(fd, source, offset, job):
+    with open(source, "rb") as src:
+        while True:
+            block = src.read(IMAGE_BLOCK_SIZE)
+            if not block:
+                return
+            if job is not None:
+                job.check_cancelled()
+            os.pwrite(fd, block, offset)
+            offset += len(block)
+
+
+def _mbr(start_sector, sector_count):
+    mbr = bytearray(SECTOR_SIZE)
+    struct.pack_into("<I", mbr, 440, int(time.time()) & 0xFFFFFFFF)
+    # CHS fields set to their maximum tell readers to use the LBA values.
+    entry = _PARTITION.pack(0x80, b"\xfe\xff\xff", 0x0C, b"\xfe\xff\xff", start_sector, sector_count)
+    mbr[446 : 446 + len(entry)] = entry
+    mbr[510:512] = b"\x55\xaa"
+    return bytes(mbr)
+
+
+def _boot_sector(spc, hidden_sectors, volume_sectors, fat_sectors, label):
+    bpb = _BPB.pack(
+        b"\xeb\x58\x90", b"MSWIN4.1", SECTOR_SIZE, spc, RESERVED_SECTORS, NUM_FATS, 0, 0, 0xF8, 0, 63, 255,
+        hidden_sectors, volume_sectors, fat_sectors, 0, 0, 2, 1, 6, bytes(12), 0x80, 0, 0x29,
+        int(time.time() * 1000) & 0xFFFFFFFF, label, b"FAT32   ",
+    )
+    return bpb + bytes(SECTOR_SIZE - len(bpb) - 2) + b"\x55\xaa"
+
+
+def _fsinfo_sector(free_clusters, next_free):
+    sector = bytearray(SECTOR_SIZE)
+    struct.pack_into("<I", sector, 0, 0x41615252)
+    struct.pack_into("<IIII", sector, 484, 0x61417272, free_clusters, next_free, 0)
+    struct.pack_into("<I", sector, 508, 0xAA550000)
+    return bytes(sector)
+
+
+def build_payload_image(image_path, start_file_path, label, payload_dir=None, size=None, job=None):
+    """Builds an image holding the executable (or payload folder) and a matching autorun.inf."""
+    builder = FatImageBuilder(label)
+    if payload_dir:
+        for rel in sorted(scan_tree(payload_dir)):
+            builder.add_file(rel, os.path.join(payload_dir, *rel.split("/")))
+    elif start_file_path:
+        builder.add_file(os.path.basename(start_file_path), start_file_path)
+    autorun = autorun_content(label, start_file_name(start_file_path, payload_dir))
+    builder.add_bytes("autorun.inf", autorun.encode("utf-8"))
+    return builder.build(image_path, size=size, job=job)
+
+
+def is_block_device(path):
+    try:
+        return stat.S_ISBLK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def target_size(path):
+    """Returns the size of a block device or existing file, or 0 if path does not exist."""
+    try:
+        with open(path, "rb") as fh:
+            return fh.seek(0, os.SEEK_END)
+    except FileNotFoundError:
+        return 0
+
+
+def check_target(path, image_size):
+    """Raises ImageError if path is a mounted or too-small device."""
+    mount_point = device_mount_point(path)
+    if mount_point:
+        raise ImageError(f"{path} is mounted at {mount_point}; unmount it before writing an image.")
+    if is_block_device(path) and target_size(path) < image_size:
+        raise ImageError(f"{path} holds {format_bytes(target_size(path))}, less than the {format_bytes(image_size)} image.")
+
+
+def _write_target(job, view, image, target, result, block_size):
+    started = time.monotonic()
+    last_report = 0.0
+    job.report((target, "writing", 0.0))
+    is_device = is_block_device(target)
+    fd = os.open(target, os.O_WRONLY | (0 if is_device else os.O_CREAT) | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        if not is_device:
+            # Start from an all-zero sparse file so the copy is byte-identical to the image.
+            os.ftruncate(fd, 0)
+            os.ftruncate(fd, image.size)
+        for offset, length in image.extents:
+            for pos in range(offset, offset + length, block_size):
+                job.check_cancelled()
+                end = min(pos + block_size, offset + length)
+                written = os.pwrite(fd, view[pos:end], pos)
+                while pos + written < end:
+                    written += os.pwrite(fd, view[pos + written : end], pos + written)
+                result.bytes_written += written
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    result.seconds = now - started
+                    percent = result.bytes_written * 100 // max(image.used_bytes, 1)
+                    job.report((target, f"writing {percent}%", result.rate))
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+        result.seconds = time.monotonic() - started
+
+
+def write_image(job, image, targets, block_size=IMAGE_BLOCK_SIZE, max_workers=PROVISION_MAX_WORKERS):
+    """Streams the used extents of image to every target concurrently. Returns DriveResults."""
+    for target in targets:
+        check_target(target, image.size)
+    results = {target: DriveResult(target) for target in targets}
+
+    def run(target):
+        result = results[target]
+        try:
+            _write_target(job, view, image, target, result, block_size)
+        except JobCancelled:
+            result.error = "cancelled"
+        except OSError as exc:
+            result.error = str(exc)
+        else:
+            result.ok = True
+        job.report((target, "done" if result.ok else f"failed: {result.error}", result.rate))
+
+    with open(image.path, "rb") as fh:
+        mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            workers = max(1, min(len(targets), max_workers))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="autousb-image") as pool:
+                futures = [pool.submit(run, target) for target in targets]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    job.cancel()
+                    raise
+        finally:
+            view.release()
+            mapped.close()
+    job.check_cancelled()
+    return [results[target] for target in targets]
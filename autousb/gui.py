@@ -0,0 +1,975 @@
+"""Tk front end. Everything here runs on the UI thread; work happens in autousb core modules."""
+import importlib.util
+import os
+import queue
+import shutil
+import sys
+import time
+import tkinter as tk
+from tkinter import filedialog, messagebox
+from tkinter import ttk
+import webbrowser
+
+from .build import (
+    BUILD_BACKENDS,
+    MINGW_BACKENDS,
+    PYINSTALLER_BACKENDS,
+    build_exe,
+    next_available_path,
+    resolve_backend,
+)
+from .buildqueue import batch_files, build_queue, summarize_builds
+from .cache import BuildCache
+from .drives import DriveMonitor, list_drive_info
+from .jobs import JobRunner
+from .metrics import Tracer
+from .preflight import drive_status, forget_probe, probe_drive
+from .provision import (
+    PROVISION_MAX_WORKERS,
+    ProvisionError,
+    check_payload_dir,
+    check_provision_inputs,
+    provision_drive,
+    provision_drives,
+    summarize_results,
+)
+from .toolchain import forget_pch_failures
+from .util import format_bytes
+
+JOB_POLL_MS = 50
+STATUS_MAX_CHARS = 90
+THEME = "arc"
+
+
+class StartupTimer:
+    """Records time-to-first-window phases and prints them to stderr when enabled."""
+
+    def __init__(self, started=None, enabled=None):
+        if enabled is None:
+            enabled = bool(os.getenv("AUTOUSB_STARTUP_TIMING"))
+        self.enabled = enabled
+        self.phases = []
+        self._last = started if started is not None else time.perf_counter()
+        self._started = self._last
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        parts = ", ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in self.phases)
+        total = (self._last - self._started) * 1000
+        print(f"AutoUSB startup: {parts}; total {total:.1f} ms", file=sys.stderr, flush=True)
+
+
+def load_theme(root, name):
+    """Loads a single ttkthemes theme by sourcing its Tcl file directly.
+
+    ThemedTk sources every theme index and loads the scid theme on creation; here only the
+    requested theme is read. Falls back to ttkthemes if its files are not where expected.
+    """
+    spec = importlib.util.find_spec("ttkthemes")
+    locations = list(spec.submodule_search_locations or []) if spec else []
+    for location in locations:
+        for theme_set in ("png", "gif", "themes"):
+            theme_tcl = os.path.join(location, theme_set, name, f"{name}.tcl")
+            if not os.path.isfile(theme_tcl):
+                continue
+            try:
+                root.tk.call("source", theme_tcl)
+                ttk.Style(root).theme_use(name)
+                return
+            except tk.TclError:
+                continue
+    from ttkthemes import ThemedStyle
+
+    ThemedStyle(root).set_theme(name)
+
+
+class AutoUSBApp(tk.Tk):
+    def __init__(self, timer=None):
+        self.timer = timer or StartupTimer(enabled=False)
+        self.timer.mark("import")
+        super().__init__()
+        self.title("AutoUSB: USB autorun helper")
+        load_theme(self, THEME)
+        self.timer.mark("theme")
+        self.resizable(False, False)
+        self._center_window(520, 340)
+        self.configure(padx=10, pady=8)
+        self.last_built_exe = ""
+        self.build_cache = BuildCache()
+        self.jobs = JobRunner()
+        self.save_job = None
+        self.drive_info = {}
+        self.drive_labels = {}
+        self.bg_color = "#eaf0fb"
+        self.panel_color = "#ffffff"
+        self.accent_color = "#2f7bff"
+        self.accent_hover = "#2264d4"
+        self.text_color = "#182a43"
+        self._configure_style()
+        self._build_ui()
+        self.timer.mark("widgets")
+        # The monitor thread only enqueues; _poll_jobs applies updates on the UI thread.
+        self.drive_updates = queue.Queue()
+        self.drive_monitor = DriveMonitor(self.drive_updates.put)
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        # Scan once, after the window has had a chance to paint.
+        self.after_idle(self._first_drive_scan)
+        self.after(JOB_POLL_MS, self._poll_jobs)
+
+    def _first_drive_scan(self):
+        self.refresh_drives()
+        self.drive_monitor.start(current=list(self.drive_info.values()))
+        self.timer.mark("first drive scan")
+        self.timer.report()
+
+    def _next_available_path(self, folder, filename):
+        """Claims a path in folder that does not overwrite existing files, even with builds queued."""
+        return next_available_path(folder, filename, reserve=True)
+
+    def _center_window(self, width, height):
+        screen_width = self.winfo_screenwidth()
+        screen_height = self.winfo_screenheight()
+        x = (screen_width // 2) - (width // 2)
+        y = (screen_height // 2) - (height // 2)
+        self.geometry(f"{width}x{height}+{x}+{y}")
+
+    def _configure_style(self):
+        style = ttk.Style(self)
+        self.configure(background=self.bg_color)
+        style.configure(".", background=self.bg_color, foreground=self.text_color)
+        style.configure("TFrame", padding=4, background=self.panel_color)
+        style.configure("Card.TFrame", padding=6, background=self.panel_color)
+        style.configure("TNotebook", background=self.bg_color, padding=4)
+        style.configure(
+            "TNotebook.Tab",
+            padding=(12, 6),
+            background=self.panel_color,
+            foreground=self.text_color,
+        )
+        style.map(
+            "TNotebook.Tab",
+            background=[("selected", self.bg_color), ("active", self.bg_color)],
+            foreground=[("selected", self.text_color)],
+        )
+        style.configure("TLabel", padding=(2, 2), background=self.panel_color, foreground=self.text_color)
+        style.configure(
+            "TButton",
+            padding=(8, 5),
+            background=self.panel_color,
+            foreground="#000000",
+        )
+        style.map("TButton", background=[("active", "#e5e9f2"), ("!disabled", self.panel_color)])
+        style.configure(
+            "Accent.TButton",
+            padding=(8, 5),
+            foreground="#000000",
+            background=self.panel_color,
+        )
+        style.map("Accent.TButton", background=[("active", "#e5e9f2"), ("!disabled", self.panel_color)])
+        style.configure("Header.TLabel", font=("Helvetica", 18, "bold"), background=self.bg_color)
+        style.configure("Sub.TLabel", font=("Helvetica", 11), background=self.bg_color)
+        style.configure("Section.TLabel", font=("Helvetica", 12, "bold"), background=self.panel_color)
+
+    def _build_ui(self):
+        header = ttk.Frame(self, style="Card.TFrame")
+        header.pack(fill="x")
+        ttk.Label(header, text="Welcome to AutoUSB", style="Header.TLabel").pack(anchor="w")
+        # Subtitle removed for a cleaner header
+
+        body = ttk.Frame(self, style="Card.TFrame")
+        body.pack(fill="x", expand=False, pady=(0, 0))
+
+        form = ttk.Frame(body, style="Card.TFrame")
+        form.pack(fill="x", pady=(0, 8))
+        ttk.Label(form, text="USB drive").grid(row=0, column=0, sticky="w", pady=4)
+        self.drive_var = tk.StringVar()
+        self.drive_combo = ttk.Combobox(
+            form, textvariable=self.drive_var, state="readonly", width=24
+        )
+        self.drive_combo.grid(row=0, column=1, sticky="ew", pady=4, padx=(6, 4))
+        self.drive_combo.bind("<<ComboboxSelected>>", self._show_drive_info)
+        self.probe_button = ttk.Button(form, text="Test speed", command=self.probe_selected_drive)
+        self.probe_button.grid(row=0, column=2, sticky="w", pady=4, ipady=1)
+        btn_refresh = ttk.Button(form, text="Refresh", command=self.refresh_drives)
+        btn_refresh.grid(row=0, column=3, sticky="e", pady=4, ipady=1)
+        form.grid_columnconfigure(1, weight=1)
+        form.grid_columnconfigure(2, weight=1)
+
+        ttk.Label(form, text="Label (optional)").grid(row=1, column=0, sticky="w", pady=4)
+        self.name_var = tk.StringVar()
+        ttk.Entry(form, textvariable=self.name_var).grid(row=1, column=1, columnspan=3, sticky="ew", pady=4, padx=(6, 0))
+
+        ttk.Label(form, text="Executable to auto-run").grid(row=2, column=0, sticky="w", pady=(8, 4))
+        self.start_file_var = tk.StringVar()
+        ttk.Entry(form, textvariable=self.start_file_var).grid(row=2, column=1, sticky="ew", pady=(8, 4), padx=(6, 4))
+        ttk.Button(form, text="Browse", command=self.select_start_file).grid(row=2, column=2, sticky="w", pady=(8, 4))
+        ttk.Button(form, text="Batch to EXE", command=self.open_batch_builder).grid(
+            row=2, column=3, sticky="w", pady=(8, 4), padx=(6, 0)
+        )
+
+        ttk.Label(form, text="Payload folder (optional)").grid(row=3, column=0, sticky="w", pady=4)
+        self.payload_var = tk.StringVar()
+        ttk.Entry(form, textvariable=self.payload_var).grid(row=3, column=1, sticky="ew", pady=4, padx=(6, 4))
+        ttk.Button(form, text="Browse", command=self.select_payload_dir).grid(row=3, column=2, sticky="w", pady=4)
+
+        self.autorun_status_var = tk.StringVar()
+        ttk.Label(form, textvariable=self.autorun_status_var, foreground="#3c763d").grid(
+            row=4, column=0, columnspan=4, sticky="w", pady=(6, 2)
+        )
+        self.batch_status_var = tk.StringVar()
+        ttk.Label(form, textvariable=self.batch_status_var, foreground="#3c763d").grid(
+            row=5, column=0, columnspan=4, sticky="w", pady=(0, 0)
+        )
+        self.timing_var = tk.StringVar()
+        ttk.Label(form, textvariable=self.timing_var, foreground="#777777").grid(
+            row=6, column=0, columnspan=4, sticky="w", pady=(2, 0)
+        )
+
+        footer = ttk.Frame(self)
+        footer.pack(fill="x", pady=(12, 4))
+        ttk.Button(footer, text="Open GitHub", command=self.open_github).pack(side="left")
+        ttk.Button(footer, text="Help", command=self.show_help).pack(side="left", padx=(6, 0))
+        ttk.Button(footer, text="Multiple drives", command=self.open_multi_drive).pack(side="left", padx=(6, 0))
+        self.verify_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(footer, text="Verify after copy", variable=self.verify_var).pack(side="left", padx=(12, 0))
+        self.save_button = ttk.Button(footer, text="Save", command=self.save_everything, style="Accent.TButton")
+        self.save_button.pack(side="right")
+
+    # --- Autorun logic ---
+    def refresh_drives(self):
+        self._apply_drives(list_drive_info())
+        self._show_drive_info()
+
+    def _apply_drives(self, infos):
+        """Updates the drive list, keeping the current selection while its drive is still mounted."""
+        selected = self.selected_drive()
+        for gone in set(self.drive_info) - {info.path for info in infos}:
+            forget_probe(gone)
+        self.drive_info = {info.path: info for info in infos}
+        self.drive_labels = {self._drive_label(info.path, info.fstype): info.path for info in infos}
+        labels = list(self.drive_labels)
+        self.drive_combo["values"] = labels
+        if selected in self.drive_info:
+            self.drive_combo.current(list(self.drive_labels.values()).index(selected))
+            return
+        if labels:
+            self.drive_combo.current(0)
+        else:
+            self.drive_var.set("")
+        self._show_drive_info()
+
+    def _drive_label(self, path, fstype=""):
+        """Returns "path (fstype, free, speed)" for drive pickers; speed appears once probed."""
+        try:
+            details = drive_status(path, fstype).describe()
+        except OSError:
+            details = ""
+        return f"{path} ({details})" if details else path
+
+    def selected_drive(self):
+        label = self.drive_var.get()
+        return self.drive_labels.get(label, label)
+
+    def _show_drive_info(self, _event=None):
+        info = self.drive_info.get(self.selected_drive())
+        self.autorun_status_var.set(f"{info.path}: {info.describe()}" if info and info.describe() else "")
+
+    def probe_selected_drive(self):
+        drive = self.selected_drive()
+        if not drive:
+            messagebox.showerror("Error", "Select a USB drive first.")
+            return
+
+        def finished(probe):
+            self.probe_button.state(["!disabled"])
+            self._apply_drives(list(self.drive_info.values()))
+            self.autorun_status_var.set(f"{drive}: writes at {format_bytes(probe.rate)}/s")
+
+        def failed(exc):
+            self.probe_button.state(["!disabled"])
+            self.autorun_status_var.set("")
+            messagebox.showerror("Error", f"Could not test {drive}: {exc}")
+
+        self.probe_button.state(["disabled"])
+        self.autorun_status_var.set(f"Testing write speed of {drive}...")
+        self.jobs.submit(
+            f"probe {drive}",
+            lambda job: probe_drive(drive, job=job),
+            on_done=finished,
+            on_error=failed,
+            on_cancel=lambda: self.probe_button.state(["!disabled"]),
+        )
+
+    def select_start_file(self):
+        start_file = filedialog.askopenfilename(
+            title="Select Start File",
+            filetypes=[
+                ("Executable Files", "*.exe"),
+                ("All Files", "*.*"),
+            ],
+        )
+        if start_file:
+            self.start_file_var.set(start_file)
+
+    def select_payload_dir(self):
+        payload_dir = filedialog.askdirectory(title="Select Payload Folder", mustexist=True)
+        if payload_dir:
+            self.payload_var.set(payload_dir)
+
+    def create_autorun(self, copy_files=False, notify=True, on_done=None):
+        """Validates the form and provisions the drive in the background.
+
+        Returns the running Job, or False if validation failed. on_done(ok) runs on the UI thread.
+        """
+        drive = self.selected_drive()
+        new_name = self.name_var.get().strip()
+        start_file_path = self.start_file_var.get().strip()
+        payload_dir = self.payload_var.get().strip() or None
+        tracer = self._new_tracer("save" if copy_files else "autorun")
+
+        try:
+            with tracer.span("validate"):
+                check_provision_inputs(drive, start_file_path, copy_files, payload_dir)
+        except ProvisionError as exc:
+            messagebox.showerror("Error", str(exc))
+            return False
+
+        def finished(result):
+            self._show_timing(tracer)
+            autorun_path, copy_result = result
+            message = f"autorun.inf created at {autorun_path}"
+            if copy_result is not None:
+                message += f"; {copy_result.describe(os.path.basename(payload_dir or start_file_path))}"
+            self.autorun_status_var.set(message)
+            if notify:
+                messagebox.showinfo("Success", f"autorun.inf saved to {autorun_path}")
+            if on_done:
+                on_done(True)
+
+        def failed(exc):
+            self._show_timing(tracer, "error")
+            self.autorun_status_var.set("")
+            messagebox.showerror("Error", str(exc))
+            if on_done:
+                on_done(False)
+
+        def cancelled():
+            self._show_timing(tracer, "cancelled")
+            self.autorun_status_var.set("Save cancelled.")
+            if on_done:
+                on_done(False)
+
+        return self.jobs.submit(
+            f"provision {drive}",
+            provision_drive,
+            drive,
+            start_file_path,
+            new_name,
+            copy_files,
+            False,
+            payload_dir,
+            self.verify_var.get(),
+            on_progress=self.autorun_status_var.set,
+            on_done=finished,
+            on_error=failed,
+            on_cancel=cancelled,
+            tracer=tracer,
+        )
+
+    def _new_tracer(self, run):
+        # AUTOUSB_PROFILE=<file> dumps cProfile stats for each run, the latest overwriting the last.
+        return Tracer(run, profile_path=os.getenv("AUTOUSB_PROFILE") or None)
+
+    def _show_timing(self, tracer, status="ok"):
+        if tracer is not None:
+            self.timing_var.set(tracer.finish(status))
+
+    def show_help(self):
+        help_text = (
+            "1) Pick your USB drive and optional label.\n"
+            "2) Choose the executable to auto-run, or click 'Batch to EXE' to paste commands and generate one.\n"
+            "3) Click 'Save' to copy the EXE and write autorun.inf.\n\n"
+            "Note: Modern Windows limits USB autorun; you may still get an AutoPlay prompt. Batch to EXE uses "
+            "PyInstaller on Windows (pip install pyinstaller) and a MinGW-w64 launcher elsewhere "
+            "(apt install mingw-w64); AUTOUSB_BUILD_BACKEND picks another backend."
+        )
+        messagebox.showinfo("How to use AutoUSB", help_text)
+
+    def open_github(self):
+        webbrowser.open("https://github.com/tripleu613/AutoUSB")
+
+    # --- Background jobs ---
+    def _poll_jobs(self):
+        # Reschedule even when a callback raises, or no job would report again.
+        try:
+            self.jobs.dispatch()
+            latest = None
+            while True:
+                try:
+                    latest = self.drive_updates.get_nowait()
+                except queue.Empty:
+                    break
+            if latest is not None:
+                self._apply_drives(latest)
+        finally:
+            self.after(JOB_POLL_MS, self._poll_jobs)
+
+    def _on_close(self):
+        self.drive_monitor.stop()
+        self.jobs.shutdown()
+        self.destroy()
+
+    # --- Multi-drive logic ---
+    def open_multi_drive(self):
+        dialog = tk.Toplevel(self)
+        dialog.title("Provision multiple drives")
+        dialog.geometry("640x380")
+        dialog.transient(self)
+        dialog.grab_set()
+
+        frame = ttk.Frame(dialog, padding=10)
+        frame.pack(fill="both", expand=True)
+        ttk.Label(frame, text="Select the drives to provision with the current EXE and label.", style="Section.TLabel").pack(
+            anchor="w", pady=(0, 6)
+        )
+
+        tree = ttk.Treeview(frame, columns=("status", "rate"), selectmode="extended", height=10)
+        tree.heading("#0", text="Drive")
+        tree.heading("status", text="Status")
+        tree.heading("rate", text="Throughput")
+        tree.column("#0", width=300)
+        tree.column("status", width=180)
+        tree.column("rate", width=100, anchor="e")
+        tree.pack(fill="both", expand=True, pady=4)
+
+        def load_drives():
+            tree.delete(*tree.get_children())
+            for info in list_drive_info():
+                tree.insert("", "end", iid=info.path, text=self._drive_label(info.path, info.fstype), values=("", ""))
+            tree.selection_set(tree.get_children())
+
+        load_drives()
+
+        status_var = tk.StringVar()
+        ttk.Label(frame, textvariable=status_var, foreground="#3c763d").pack(anchor="w", pady=(4, 0))
+
+        btns = ttk.Frame(frame)
+        btns.pack(fill="x", pady=(8, 0))
+        running = {"job": None}
+
+        def set_running(job):
+            running["job"] = job
+            if not dialog.winfo_exists():
+                return
+            start_btn.state(["disabled"] if job else ["!disabled"])
+            refresh_btn.state(["disabled"] if job else ["!disabled"])
+            cancel_btn.state(["!disabled"] if job else ["disabled"])
+
+        def update_row(payload):
+            drive, status, rate = payload
+            if dialog.winfo_exists() and tree.exists(drive):
+                tree.set(drive, "status", status)
+                tree.set(drive, "rate", f"{format_bytes(rate)}/s" if rate else "")
+
+        def start():
+            drives = list(tree.selection())
+            start_file_path = self.start_file_var.get().strip()
+            if not drives:
+                messagebox.showerror("Error", "Select at least one drive.", parent=dialog)
+                return
+            if not start_file_path:
+                messagebox.showerror("Error", "Select an executable to auto-run before saving to USB.", parent=dialog)
+                return
+            if not os.path.isfile(start_file_path):
+                messagebox.showerror("Error", f"File not found: {start_file_path}", parent=dialog)
+                return
+            payload_dir = self.payload_var.get().strip() or None
+            if payload_dir:
+                try:
+                    check_payload_dir(payload_dir, start_file_path)
+                except ProvisionError as exc:
+                    messagebox.showerror("Error", str(exc), parent=dialog)
+                    return
+            for drive in tree.get_children():
+                tree.set(drive, "status", "queued" if drive in drives else "")
+                tree.set(drive, "rate", "")
+            started = time.monotonic()
+            tracer = self._new_tracer("provision")
+
+            def finished(results):
+                set_running(None)
+                self._show_timing(tracer, "ok" if all(r.ok for r in results) else "failed")
+                summary = summarize_results(results, time.monotonic() - started)
+                status_var.set(summary.splitlines()[0])
+                self.autorun_status_var.set(summary.splitlines()[0])
+                showinfo = messagebox.showinfo if all(r.ok for r in results) else messagebox.showwarning
+                showinfo("Provisioning finished", summary, parent=dialog if dialog.winfo_exists() else None)
+
+            def failed(exc):
+                set_running(None)
+                self._show_timing(tracer, "error")
+                status_var.set("")
+                messagebox.showerror("Error", f"Could not provision drives: {exc}")
+
+            def cancelled():
+                set_running(None)
+                self._show_timing(tracer, "cancelled")
+                status_var.set("Provisioning cancelled.")
+
+            status_var.set(f"Provisioning {len(drives)} drive{'s' if len(drives) != 1 else ''}...")
+            set_running(
+                self.jobs.submit(
+                    f"provision {len(drives)} drives",
+                    provision_drives,
+                    drives,
+                    start_file_path,
+                    self.name_var.get().strip(),
+                    PROVISION_MAX_WORKERS,
+                    payload_dir,
+                    self.verify_var.get(),
+                    on_progress=update_row,
+                    on_done=finished,
+                    on_error=failed,
+                    on_cancel=cancelled,
+                    tracer=tracer,
+                )
+            )
+
+        def cancel():
+            if running["job"]:
+                running["job"].cancel()
+
+        def close():
+            cancel()
+            dialog.destroy()
+
+        start_btn = ttk.Button(btns, text="Provision selected", command=start, style="Accent.TButton")
+        start_btn.pack(side="left")
+        cancel_btn = ttk.Button(btns, text="Cancel", command=cancel, state="disabled")
+        cancel_btn.pack(side="left", padx=(6, 0))
+        refresh_btn = ttk.Button(btns, text="Refresh", command=load_drives)
+        refresh_btn.pack(side="left", padx=(6, 0))
+        ttk.Button(btns, text="Close", command=close).pack(side="right")
+        dialog.protocol("WM_DELETE_WINDOW", close)
+
+    # --- Batch logic ---
+    def open_batch_builder(self):
+        # Not modal: a queue of builds can run while the main window is used.
+        builder = tk.Toplevel(self)
+        builder.title("Build EXE from batch")
+        builder.geometry("600x600")
+        builder.transient(self)
+
+        frame = ttk.Frame(builder, padding=10)
+        frame.pack(fill="both", expand=True)
+
+        ttk.Label(frame, text="Paste your batch commands, then build an EXE (saved here).", style="Section.TLabel").pack(
+            anchor="w", pady=(0, 6)
+        )
+        text = tk.Text(
+            frame,
+            height=14,
+            width=70,
+            wrap="word",
+            font=("Consolas", 10),
+            bg="#f6f8ff",
+            fg=self.text_color,
+            insertbackground=self.text_color,
+            relief="flat",
+            bd=1,
+            highlightbackground="#d6def2",
+            highlightcolor=self.accent_color,
+            highlightthickness=1,
+        )
+        text.pack(fill="both", expand=True, pady=4)
+        text.insert(
+            "1.0",
+            "@echo off\n"
+            "rem Paste your commands below. Example:\n"
+            "rem start \"\" \"%~dp0MyApp.exe\"\n",
+        )
+
+        ttk.Label(frame, text="Queue: identical scripts are built once; each gets its own EXE.").pack(
+            anchor="w", pady=(6, 0)
+        )
+        tree = ttk.Treeview(frame, columns=("status", "output"), selectmode="extended", height=6)
+        tree.heading("#0", text="Script")
+        tree.heading("status", text="Status")
+        tree.heading("output", text="Output")
+        tree.column("#0", width=200)
+        tree.column("status", width=170)
+        tree.column("output", width=180)
+        tree.pack(fill="x", pady=4)
+        queued = {}
+
+        def enqueue(name, content):
+            unique, counter = name, 1
+            while unique in queued:
+                counter += 1
+                unique = f"{name} ({counter})"
+            queued[unique] = content
+            tree.insert("", "end", iid=unique, text=unique, values=("waiting", ""))
+
+        def add_text():
+            content = text.get("1.0", "end").strip().replace("\r\n", "\n")
+            if not content:
+                messagebox.showerror("Empty batch", "Add some commands before queueing.", parent=builder)
+                return
+            enqueue(f"Script {len(queued) + 1}", content)
+
+        def add_folder():
+            folder = filedialog.askdirectory(title="Folder of .bat files", parent=builder)
+            if not folder:
+                return
+            scripts = batch_files(folder)
+            if not scripts:
+                messagebox.showinfo("No scripts", f"No .bat or .cmd files in {folder}.", parent=builder)
+            for name, content in scripts:
+                enqueue(name, content)
+
+        def clear_queue():
+            queued.clear()
+            tree.delete(*tree.get_children())
+
+        def update_row(payload):
+            if isinstance(payload, str):
+                # Queue-wide messages, such as compiling the launcher stub.
+                self._set_build_status(payload, status_var)
+                return
+            name, status, _rate = payload
+            if builder.winfo_exists() and tree.exists(name):
+                tree.set(name, "status", status)
+
+        def show_outputs(items):
+            for item in items:
+                if item.ok and builder.winfo_exists() and tree.exists(item.name):
+                    tree.set(item.name, "output", os.path.basename(item.save_path))
+
+        status_var = tk.StringVar()
+        ttk.Label(frame, textvariable=status_var, foreground="#3c763d").pack(anchor="w", pady=(4, 0))
+
+        queue_btns = ttk.Frame(frame)
+        queue_btns.pack(fill="x", pady=(8, 0))
+        btns = ttk.Frame(frame)
+        btns.pack(fill="x", pady=(6, 0))
+        running = {"job": None}
+
+        def set_running(job):
+            running["job"] = job
+            if not builder.winfo_exists():
+                return
+            for button in (build_btn, queue_btn, clear_btn):
+                button.state(["disabled"] if job else ["!disabled"])
+            cancel_btn.state(["!disabled"] if job else ["disabled"])
+
+        def build_queued():
+            if not queued:
+                messagebox.showerror("Empty queue", "Add scripts to the queue first.", parent=builder)
+                return
+            job = self.build_queue(list(queued.items()), status_var, builder, update_row, set_running, show_outputs)
+            set_running(job)
+
+        def build_now():
+            content = text.get("1.0", "end").strip().replace("\r\n", "\n")
+            self.build_batch_to_exe(
+                content,
+                status_var=status_var,
+                parent=builder,
+                on_job=set_running,
+                on_finish=lambda: set_running(None),
+            )
+
+        def cancel_build():
+            if running["job"]:
+                running["job"].cancel()
+
+        def close():
+            cancel_build()
+            builder.destroy()
+
+        def clear_cache():
+            removed = self.build_cache.clear()
+            forget_pch_failures()
+            status_var.set(f"Build cache cleared ({removed} item{'s' if removed != 1 else ''} removed).")
+
+        ttk.Button(queue_btns, text="Add to queue", command=add_text).pack(side="left")
+        ttk.Button(queue_btns, text="Add folder...", command=add_folder).pack(side="left", padx=(6, 0))
+        clear_btn = ttk.Button(queue_btns, text="Clear queue", command=clear_queue)
+        clear_btn.pack(side="left", padx=(6, 0))
+        queue_btn = ttk.Button(queue_btns, text="Build queue (save here)", command=build_queued)
+        queue_btn.pack(side="right")
+        build_btn = ttk.Button(btns, text="Build EXE (save here)", command=build_now)
+        build_btn.pack(side="left")
+        cancel_btn = ttk.Button(btns, text="Cancel build", command=cancel_build, state="disabled")
+        cancel_btn.pack(side="left", padx=(6, 0))
+        ttk.Button(btns, text="Clear build cache", command=clear_cache).pack(side="left", padx=(6, 0))
+        ttk.Button(btns, text="Close", command=close).pack(side="right")
+        builder.protocol("WM_DELETE_WINDOW", close)
+
+    def build_batch_to_exe(self, content, status_var=None, parent=None, on_job=None, on_finish=None):
+        """Starts a background build. Returns the running Job, or None if nothing was started.
+
+        on_job(job) fires whenever a job starts (an install may precede the build); on_finish()
+        fires once the chain stops, whatever the outcome.
+        """
+        if not content:
+            messagebox.showerror("Empty batch", "Add some commands before converting.")
+            return None
+
+        tracer = self._new_tracer("build")
+        with tracer.span("toolchain"):
+            backend, tool = resolve_backend()
+        if backend in PYINSTALLER_BACKENDS:
+            if not tool:
+                messagebox.showerror(
+                    "PyInstaller missing",
+                    "PyInstaller is required to build the EXE.\nInstall with: pip install pyinstaller",
+                )
+                return None
+            return self._start_build(backend, tool, content, status_var, parent, on_job, on_finish, tracer)
+
+        if tool:
+            return self._start_build(backend, tool, content, status_var, parent, on_job, on_finish, tracer)
+
+        maybe_apt = shutil.which("apt-get")
+        if maybe_apt and messagebox.askyesno(
+            "Install MinGW-w64?",
+            "To build a Windows EXE on Linux, MinGW-w64 is required.\n\n"
+            "Install now with: sudo apt-get install -y mingw-w64 ?",
+        ):
+            return self._install_mingw(backend, content, status_var, parent, on_job, on_finish, tracer)
+        self._report_missing_mingw()
+        return None
+
+    def build_queue(self, scripts, status_var, parent, on_row, on_job, on_finish=None):
+        """Builds (name, content) scripts concurrently into the working directory. Returns the Job or None.
+
+        on_row gets (name, status, 0.0) per script as it progresses; on_finish gets the QueuedBuilds.
+        """
+        tracer = self._new_tracer("build queue")
+        with tracer.span("toolchain"):
+            backend, tool = resolve_backend()
+        if not tool:
+            if backend in MINGW_BACKENDS:
+                self._report_missing_mingw()
+            else:
+                messagebox.showerror(
+                    "PyInstaller missing",
+                    "PyInstaller is required to build the EXE.\nInstall with: pip install pyinstaller",
+                    parent=parent,
+                )
+            return None
+
+        def finished(items):
+            on_job(None)
+            self._show_timing(tracer)
+            if on_finish:
+                on_finish(items)
+            built = [item for item in items if item.ok]
+            if built:
+                self.last_built_exe = built[-1].save_path
+            summary = summarize_builds(items)
+            self._set_build_status(summary.splitlines()[0], status_var)
+            messagebox.showinfo("Build queue", summary, parent=parent if parent.winfo_exists() else None)
+
+        def failed(exc):
+            on_job(None)
+            self._build_stopped(status_var, None, tracer=tracer, status="error")
+            messagebox.showerror(
+                "Build failed",
+                f"Could not run the build queue:\n{exc}",
+                parent=parent if parent.winfo_exists() else None,
+            )
+
+        def cancelled():
+            on_job(None)
+            self._build_stopped(status_var, None, "Build queue cancelled.", tracer, "cancelled")
+
+        self._set_build_status(f"Building {len(scripts)} script{'s' if len(scripts) != 1 else ''}...", status_var)
+        return self.jobs.submit(
+            f"build {len(scripts)} scripts",
+            build_queue,
+            backend,
+            tool,
+            scripts,
+            os.getcwd(),
+            self.build_cache,
+            on_progress=on_row,
+            on_done=finished,
+            on_error=failed,
+            on_cancel=cancelled,
+            tracer=tracer,
+        )
+
+    def _report_missing_mingw(self):
+        messagebox.showerror(
+            "MinGW-w64 missing",
+            "To build a Windows EXE on Linux, install MinGW-w64 (e.g., apt install mingw-w64) "
+            "to get x86_64-w64-mingw32-g++.",
+        )
+
+    def _install_mingw(self, backend, content, status_var, parent, on_job, on_finish, tracer=None):
+        def install(job):
+            install_cmd = ["sudo", "apt-get", "install", "-y", "mingw-w64"]
+            returncode, output = job.run_process(install_cmd)
+            if returncode != 0:
+                raise RuntimeError(output)
+
+        def installed(_result):
+            _backend, compiler = resolve_backend(backend)
+            if not compiler:
+                self._report_missing_mingw()
+                self._build_stopped(status_var, on_finish, tracer=tracer, status="error")
+                return
+            self._start_build(backend, compiler, content, status_var, parent, on_job, on_finish, tracer)
+
+        def failed(exc):
+            self._build_stopped(status_var, on_finish, tracer=tracer, status="error")
+            messagebox.showerror(
+                "Install failed",
+                f"Could not install mingw-w64 automatically:\n{exc}\n\n"
+                "Please install mingw-w64 manually (e.g., sudo apt-get install mingw-w64).",
+            )
+
+        self._set_build_status("Installing MinGW-w64...", status_var)
+        job = self.jobs.submit(
+            "install mingw-w64",
+            install,
+            on_progress=lambda line: self._set_build_status(line, status_var),
+            on_done=installed,
+            on_error=failed,
+            on_cancel=lambda: self._build_stopped(status_var, on_finish, "Install cancelled.", tracer, "cancelled"),
+            tracer=tracer,
+        )
+        if on_job:
+            on_job(job)
+        return job
+
+    def _set_build_status(self, message, status_var=None):
+        if len(message) > STATUS_MAX_CHARS:
+            message = message[: STATUS_MAX_CHARS - 3] + "..."
+        if status_var:
+            status_var.set(message)
+        self.batch_status_var.set(message)
+
+    def _build_stopped(self, status_var, on_finish, message="", tracer=None, status="ok"):
+        self._set_build_status(message, status_var)
+        self._show_timing(tracer, status)
+        if on_finish:
+            on_finish()
+
+    def _start_build(self, backend, tool, content, status_var, parent, on_job, on_finish, tracer=None):
+        binary_label = "EXE"
+        save_path = self._next_available_path(os.getcwd(), "autorun_built.exe")
+        tool_label = BUILD_BACKENDS[backend][0]
+
+        def finished(result):
+            if on_finish:
+                on_finish()
+            self._show_timing(tracer)
+            self._finish_build(save_path, status_var, parent, result=result)
+
+        def release():
+            try:
+                os.remove(save_path)
+            except OSError:
+                pass
+
+        def cancelled():
+            release()
+            self._build_stopped(status_var, on_finish, "Build cancelled.", tracer, "cancelled")
+
+        def failed(exc):
+            release()
+            self._build_stopped(status_var, on_finish, tracer=tracer, status="error")
+            if backend in MINGW_BACKENDS:
+                messagebox.showerror(
+                    "Build failed",
+                    f"Could not create {binary_label} with MinGW-w64:\n{exc}\n\n"
+                    "Ensure MinGW-w64 cross-compiler is installed and try again.",
+                    parent=parent,
+                )
+            else:
+                messagebox.showerror("Build failed", f"Could not create {binary_label}:\n{exc}", parent=parent)
+
+        self._set_build_status(f"Building {binary_label} with {tool_label}...", status_var)
+        job = self.jobs.submit(
+            f"build {save_path}",
+            build_exe,
+            backend,
+            tool,
+            content,
+            save_path,
+            self.build_cache,
+            on_progress=lambda line: self._set_build_status(line, status_var),
+            on_done=finished,
+            on_error=failed,
+            on_cancel=cancelled,
+            tracer=tracer,
+        )
+        if on_job:
+            on_job(job)
+        return job
+
+    def _finish_build(self, save_path, status_var=None, parent=None, result=None):
+        binary_label = "EXE"
+        message = f"{binary_label} saved to {save_path}"
+        if result is not None and result.cached:
+            stats = self.build_cache.stats()
+            message += f" (from build cache; hits {stats['hits']}, misses {stats['misses']})"
+        elif result is not None:
+            message += f" ({result.describe()})"
+        if status_var:
+            status_var.set(message)
+        self.last_built_exe = save_path
+        self.start_file_var.set(save_path)
+        self.batch_status_var.set(message)
+        if parent is not None and not parent.winfo_exists():
+            parent = None
+        messagebox.showinfo(
+            "Done",
+            f"Executable saved to:\n{save_path}\n\nIt is now set as your autorun target.",
+            parent=parent,
+        )
+        if parent:
+            parent.destroy()
+
+    def save_everything(self):
+        if self.save_job is not None:
+            # The Save button doubles as Cancel while a copy is running.
+            self.save_job.cancel()
+            return
+
+        drive = self.selected_drive().strip()
+        if not drive:
+            messagebox.showerror("Error", "Select a USB drive first.")
+            return
+        if not os.path.isdir(drive):
+            messagebox.showerror("Error", f"Drive '{drive}' does not exist.")
+            return
+
+        def saved(ok):
+            self.save_job = None
+            self.save_button.configure(text="Save")
+            if not ok:
+                return
+            msg = f"Saved autorun.inf and executable to {drive}"
+            self.batch_status_var.set(msg)
+            messagebox.showinfo("Saved", msg)
+
+        job = self.create_autorun(copy_files=True, notify=False, on_done=saved)
+        if job is False:
+            return
+        self.save_job = job
+        self.save_button.configure(text="Cancel")
+
+
+def main(started=None, timing=None):
+    app = AutoUSBApp(StartupTimer(started, timing))
+    app.mainloop()
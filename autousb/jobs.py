@@ -0,0 +1,209 @@
+"""Background job runner with a thread-safe progress queue and cancellable child processes."""
+import os
+import queue
+import signal
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import NULL_TRACER
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once cancellation has been requested."""
+
+
+class Job:
+    """A unit of work that reports progress through its runner's event queue.
+
+    A job created without a runner runs inline: progress goes straight to callbacks["progress"].
+    """
+
+    def __init__(self, runner=None, name="", callbacks=None, tracer=None):
+        self.name = name
+        self.callbacks = callbacks or {}
+        self.tracer = tracer or NULL_TRACER
+        self._runner = runner
+        self._cancel_event = threading.Event()
+        self._proc = None
+        self._proc_lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def report(self, message):
+        if self._runner is not None:
+            self._runner.events.put(("progress", self, message))
+            return
+        callback = self.callbacks.get("progress")
+        if callback is not None:
+            callback(message)
+
+    def span(self, name, **attrs):
+        """Times a phase of this job; see Tracer.span."""
+        return self.tracer.span(name, **attrs)
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise JobCancelled(self.name)
+
+    def cancel(self):
+        """Requests cancellation and kills the running child process, if any."""
+        self._cancel_event.set()
+        with self._proc_lock:
+            proc = self._proc
+        if proc is not None:
+            self._kill(proc)
+
+    def _kill(self, proc):
+        # _wait_child reaps under the same lock, so a child still unreaped here keeps its pid
+        # and process group; once reaped, the ids may already belong to someone else.
+        with self._proc_lock:
+            if proc.returncode is None:
+                _kill_process_tree(proc)
+
+    def run_process(self, cmd, cwd=None):
+        """Runs cmd, streaming each output line as progress. Returns (returncode, output tail)."""
+        self.check_cancelled()
+        with self.span("subprocess", tool=os.path.basename(cmd[0])) as record:
+            returncode, tail = self._run_process(cmd, cwd, record)
+            record["returncode"] = returncode
+        self.check_cancelled()
+        return returncode, tail
+
+    def _run_process(self, cmd, cwd, record):
+        kwargs = {}
+        if os.name == "nt":
+            kwargs["creationflags"] = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+        else:
+            kwargs["start_new_session"] = True
+        proc = subprocess.Popen(
+            cmd,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            text=True,
+            errors="replace",
+            bufsize=1,
+            **kwargs,
+        )
+        with self._proc_lock:
+            self._proc = proc
+        if self.cancelled:
+            self._kill(proc)
+        tail = []
+        try:
+            for line in proc.stdout:
+                line = line.rstrip()
+                if not line:
+                    continue
+                tail.append(line)
+                del tail[:-40]
+                self.report(line)
+            child_cpu = _wait_child(proc, self._proc_lock)
+            if child_cpu is not None:
+                record["child_cpu_s"] = child_cpu
+        except BaseException:
+            self._kill(proc)
+            raise
+        finally:
+            proc.stdout.close()
+            with self._proc_lock:
+                self._proc = None
+        return proc.returncode, "\n".join(tail)
+
+
+def _wait_child(proc, lock):
+    """Waits for proc and returns its user+system CPU seconds where the platform reports them.
+
+    The child is reaped while holding lock, the lock Job.cancel() signals under.
+    """
+    if not hasattr(os, "wait4") or not hasattr(os, "waitid"):
+        proc.wait()
+        return None
+    try:
+        # Block until it exits but leave it unreaped, so its pid cannot be reused yet.
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        with lock:
+            if proc.returncode is not None:
+                # A poll() during a kill reaped it first.
+                return None
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+    except ChildProcessError:
+        proc.wait()
+        return None
+    return usage.ru_utime + usage.ru_stime
+
+
+def _kill_process_tree(proc):
+    try:
+        if os.name == "nt":
+            subprocess.run(
+                ["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                capture_output=True,
+                creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+            )
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    if proc.poll() is None:
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+
+class JobRunner:
+    """Runs jobs on worker threads; callbacks fire only from dispatch() on the caller's thread."""
+
+    def __init__(self, max_workers=2):
+        self.events = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="autousb-job")
+        self._active = set()
+
+    def submit(self, name, func, *args, on_progress=None, on_done=None, on_error=None, on_cancel=None, tracer=None):
+        """Schedules func(job, *args) and returns the Job handle."""
+        callbacks = {"progress": on_progress, "done": on_done, "error": on_error, "cancelled": on_cancel}
+        job = Job(self, name, callbacks, tracer)
+        self._active.add(job)
+        self._executor.submit(self._run, job, func, args)
+        return job
+
+    def _run(self, job, func, args):
+        try:
+            result = job.tracer.profile(func, job, *args)
+        except JobCancelled:
+            self.events.put(("cancelled", job, None))
+        except Exception as exc:
+            self.events.put(("error", job, exc))
+        else:
+            self.events.put(("done", job, result))
+
+    def dispatch(self):
+        """Drains pending events and invokes their callbacks. Call from the UI thread only."""
+        while True:
+            try:
+                kind, job, payload = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if kind != "progress":
+                self._active.discard(job)
+            callback = job.callbacks.get(kind)
+            if callback is None:
+                continue
+            if kind == "cancelled":
+                callback()
+            else:
+                callback(payload)
+
+    def busy(self):
+        return bool(self._active)
+
+    def shutdown(self):
+        for job in list(self._active):
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
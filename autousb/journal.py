@@ -0,0 +1,204 @@
+"""Resumable copies: a journal per destination records what has safely reached the drive.
+
+A copy is written to a part file next to its destination (tool.exe.autousb-part) and renamed
+into place only once complete, so a half-written EXE never looks like a finished one. Every
+JOURNAL_CHUNK_SIZE bytes the part file is fsync'd and the chunk's SHA-256 appended to the
+journal, which lives in the cache directory rather than on the stick that may be yanked.
+
+When the same copy runs again (same destination, same source size and mtime), it re-reads
+the last recorded chunk from the drive, drops chunks that no longer match, and carries on
+from there. The journal also records whether the finished copy was read back, so a rerun
+does not verify a copy again that already passed, and rewrites one that did not.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from .util import cache_dir
+
+JOURNAL_VERSION = 1
+JOURNAL_CHUNK_SIZE = 16 * 1024 * 1024
+PART_SUFFIX = ".autousb-part"
+
+
+def part_path(dest):
+    """Where a copy to dest is written until it is complete."""
+    return f"{dest}{PART_SUFFIX}"
+
+
+def journal_dir():
+    return os.path.join(cache_dir(), "journals")
+
+
+def _source_identity(path):
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _dest_identity(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+class Journal:
+    """Progress of copying one source to one destination, saved after every chunk and step."""
+
+    def __init__(self, source, dest):
+        self.dest = os.path.abspath(dest)
+        digest = hashlib.sha256(self.dest.encode("utf-8")).hexdigest()[:24]
+        self.path = os.path.join(journal_dir(), f"{digest}.json")
+        self.source = _source_identity(source)
+        self.chunk_size = JOURNAL_CHUNK_SIZE
+        self.chunks = []
+        self.steps = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return
+        # A changed source or chunk size makes every recorded checksum meaningless.
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != JOURNAL_VERSION
+            or data.get("source") != self.source
+            or data.get("dest") != self.dest
+            or data.get("chunk_size") != self.chunk_size
+        ):
+            return
+        self.chunks = [chunk for chunk in data.get("chunks", []) if isinstance(chunk, str)]
+        steps = data.get("steps")
+        self.steps = steps if isinstance(steps, dict) else {}
+
+    def save(self):
+        """Writes the journal through a temp file so a crash keeps the previous one."""
+        os.makedirs(journal_dir(), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        data = {
+            "version": JOURNAL_VERSION,
+            "source": self.source,
+            "dest": self.dest,
+            "chunk_size": self.chunk_size,
+            "chunks": self.chunks,
+            "steps": self.steps,
+        }
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    @property
+    def offset(self):
+        """Bytes of the part file known to be on the device."""
+        return min(len(self.chunks) * self.chunk_size, self.source["size"])
+
+    def done(self, step):
+        """True if step completed and the destination is still what it left behind."""
+        record = self.steps.get(step)
+        return isinstance(record, dict) and record.get("dest") == _dest_identity(self.dest)
+
+    def mark(self, step, **attrs):
+        """Records that step completed, along with the destination as it now stands."""
+        self.steps[step] = dict(attrs, dest=_dest_identity(self.dest))
+        self.save()
+
+    def start_copy(self):
+        """Forgets everything after a fresh copy starts over."""
+        self.chunks = []
+        self.steps = {}
+        self.save()
+
+    def resume_offset(self, part):
+        """Returns where a copy into part can resume, after checking its last recorded chunk.
+
+        Chunks are only recorded after an fsync, so checking the newest one is enough unless
+        it reads back wrong; then it is dropped and the one before is checked.
+        """
+        try:
+            size = os.path.getsize(part)
+        except OSError:
+            size = -1
+        if size < 0:
+            self.chunks = []
+        while self.chunks:
+            end = self.offset
+            start = (len(self.chunks) - 1) * self.chunk_size
+            if size >= end and _read_back_sha256(part, start, end - start) == self.chunks[-1]:
+                break
+            self.chunks.pop()
+        return self.offset
+
+    def add_chunk(self, digest):
+        self.chunks.append(digest)
+        self.save()
+
+
+def _read_back_sha256(path, offset, length):
+    digest = hashlib.sha256()
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        if hasattr(os, "posix_fadvise"):
+            # The pages may still be cached from the interrupted run; ask the device instead.
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+        os.lseek(fd, offset, os.SEEK_SET)
+        while length:
+            data = os.read(fd, min(length, 4 * 1024 * 1024))
+            if not data:
+                break
+            digest.update(data)
+            length -= len(data)
+    finally:
+        os.close(fd)
+    return digest.hexdigest()
+
+
+def write_journaled(job, read, total, dest, source_path, journal, chunk_size, progress=None):
+    """Writes total bytes from read(offset, length) to dest, resuming from journal.
+
+    Data goes to dest's part file, which takes source_path's timestamps and then replaces
+    dest once complete. progress gets (position, bytes written by this run). Returns (bytes
+    written by this run, offset it resumed from). A failed or cancelled copy keeps its part
+    file for the next run.
+    """
+    part = part_path(dest)
+    resumed = journal.resume_offset(part) if journal.chunks else 0
+    if not resumed:
+        journal.start_copy()
+    if resumed:
+        job.report(f"Resuming {os.path.basename(dest)} at {resumed * 100 // max(total, 1)}%")
+    binary = getattr(os, "O_BINARY", 0)
+    fd = os.open(part, os.O_WRONLY | os.O_CREAT | binary, 0o666)
+    offset = resumed
+    try:
+        # Anything past the last verified chunk is unconfirmed and rewritten.
+        os.ftruncate(fd, offset)
+        os.lseek(fd, offset, os.SEEK_SET)
+        while offset < total:
+            end = min(offset + journal.chunk_size, total)
+            digest = hashlib.sha256()
+            while offset < end:
+                job.check_cancelled()
+                data = read(offset, min(chunk_size, end - offset))
+                if not data:
+                    raise OSError(f"{os.path.basename(dest)}: source ended early")
+                digest.update(data)
+                view = memoryview(data)
+                written = 0
+                while written < len(view):
+                    written += os.write(fd, view[written:])
+                offset += written
+                if progress is not None:
+                    progress(offset, offset - resumed)
+            os.fsync(fd)
+            journal.add_chunk(digest.hexdigest())
+    finally:
+        os.close(fd)
+    shutil.copystat(source_path, part)
+    os.replace(part, dest)
+    return offset - resumed, resumed
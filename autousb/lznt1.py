@@ -0,0 +1,120 @@
+"""LZNT1, the LZ77 variant Windows decompresses natively with ntdll's RtlDecompressBuffer.
+
+Using the format Windows already ships lets the tiny launcher inflate its payload with one
+call instead of carrying a decompressor. Data is cut into 4 KB chunks; each starts with a
+16-bit header (stored size - 3, signature 3 in bits 12-14, bit 15 set when compressed).
+A compressed chunk is a run of groups: a flag byte, then eight items that are literals
+(flag bit 0) or 16-bit back-references (flag bit 1). How a back-reference splits its bits
+between offset and length depends on how far into the chunk it appears.
+"""
+import struct
+
+CHUNK_SIZE = 4096
+MIN_MATCH = 3
+MAX_CANDIDATES = 32
+_HEADER = struct.Struct("<H")
+_TOKEN = struct.Struct("<H")
+
+
+def _split(position):
+    """Returns (length bits, max offset) for a back-reference at position within a chunk."""
+    length_bits = 12
+    position -= 1
+    while position >= 0x10:
+        position >>= 1
+        length_bits -= 1
+    return length_bits, 1 << (16 - length_bits)
+
+
+def _compress_chunk(chunk):
+    out = bytearray()
+    heads = {}
+    pos = 0
+    while pos < len(chunk):
+        flag_at = len(out)
+        out.append(0)
+        for bit in range(8):
+            if pos >= len(chunk):
+                break
+            best_len = best_off = 0
+            if pos and pos + MIN_MATCH <= len(chunk):
+                length_bits, max_offset = _split(pos)
+                max_len = min((1 << length_bits) - 1 + MIN_MATCH, len(chunk) - pos)
+                for start in reversed(heads.get(chunk[pos:pos + MIN_MATCH], ())[-MAX_CANDIDATES:]):
+                    if pos - start > max_offset:
+                        break
+                    length = MIN_MATCH
+                    while length < max_len and chunk[start + length] == chunk[pos + length]:
+                        length += 1
+                    if length > best_len:
+                        best_len, best_off = length, pos - start
+                        if length == max_len:
+                            break
+            step = best_len if best_len >= MIN_MATCH else 1
+            if step > 1:
+                out[flag_at] |= 1 << bit
+                out += _TOKEN.pack(((best_off - 1) << length_bits) | (best_len - MIN_MATCH))
+            else:
+                out.append(chunk[pos])
+            for at in range(pos, min(pos + step, len(chunk) - MIN_MATCH + 1)):
+                heads.setdefault(chunk[at:at + MIN_MATCH], []).append(at)
+            pos += step
+    return bytes(out)
+
+
+def compress(data):
+    """Returns data as an LZNT1 stream, storing any chunk that would not shrink."""
+    out = bytearray()
+    for offset in range(0, len(data), CHUNK_SIZE):
+        chunk = data[offset:offset + CHUNK_SIZE]
+        packed = _compress_chunk(chunk)
+        if len(packed) < len(chunk):
+            out += _HEADER.pack(0x8000 | 0x3000 | (len(packed) - 1))
+            out += packed
+        else:
+            out += _HEADER.pack(0x3000 | (len(chunk) - 1))
+            out += chunk
+    return bytes(out)
+
+
+def decompress(data):
+    """Inverse of compress; raises ValueError on a malformed stream."""
+    out = bytearray()
+    pos = 0
+    while pos + _HEADER.size <= len(data):
+        (header,) = _HEADER.unpack_from(data, pos)
+        if header == 0:
+            break
+        size = (header & 0x0FFF) + 1
+        body = data[pos + _HEADER.size:pos + _HEADER.size + size]
+        pos += _HEADER.size + size
+        if len(body) != size:
+            raise ValueError("truncated LZNT1 chunk")
+        if not header & 0x8000:
+            out += body
+            continue
+        chunk = bytearray()
+        at = 0
+        while at < len(body):
+            flags = body[at]
+            at += 1
+            for bit in range(8):
+                if at >= len(body):
+                    break
+                if not flags & (1 << bit):
+                    chunk.append(body[at])
+                    at += 1
+                    continue
+                if not chunk or at + _TOKEN.size > len(body):
+                    raise ValueError("bad LZNT1 back-reference")
+                (token,) = _TOKEN.unpack_from(body, at)
+                at += _TOKEN.size
+                length_bits, _max_offset = _split(len(chunk))
+                offset = (token >> length_bits) + 1
+                length = (token & ((1 << length_bits) - 1)) + MIN_MATCH
+                if offset > len(chunk):
+                    raise ValueError("bad LZNT1 back-reference")
+                for _ in range(length):
+                    chunk.append(chunk[-offset])
+        out += chunk
+    return bytes(out)
@@ -0,0 +1,147 @@
+"""Timed spans for provisioning and build runs, logged as JSON lines.
+
+Each run (one save, one build, one CLI command) gets a Tracer. Work wraps its phases in
+tracer.span(name, **attrs); the span records wall time, the calling thread's CPU time and
+whatever attributes the phase adds (bytes moved, cache hits, child CPU time). finish()
+appends the spans to the log and returns a one-line summary for the status bar.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+
+from .util import cache_dir, format_bytes
+
+LOG_MAX_BYTES = 5 * 1024 * 1024
+
+
+def default_log_path():
+    """Returns the span log path; AUTOUSB_METRICS_LOG overrides it and "off" disables logging."""
+    override = os.getenv("AUTOUSB_METRICS_LOG")
+    if override:
+        return "" if override.lower() == "off" else override
+    return os.path.join(cache_dir(), "metrics.jsonl")
+
+
+class Tracer:
+    """Collects spans for one run. Spans may be recorded from several threads."""
+
+    def __init__(self, run, log_path=None, profile_path=None):
+        self.run = run
+        self.run_id = f"{int(time.time() * 1000):x}-{os.getpid()}"
+        self.log_path = default_log_path() if log_path is None else log_path
+        self.profile_path = profile_path
+        self.spans = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        """Times the block. The yielded dict accepts extra attributes such as bytes or cache_hit."""
+        record = dict(attrs)
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield record
+        except BaseException as exc:
+            record["error"] = type(exc).__name__
+            raise
+        finally:
+            self.add(name, time.perf_counter() - wall_start, time.thread_time() - cpu_start, wall_start, **record)
+
+    def add(self, name, wall_s, cpu_s=0.0, started=None, **attrs):
+        record = {"span": name, "offset_s": (started or time.perf_counter()) - self._started, "wall_s": wall_s, "cpu_s": cpu_s}
+        record.update(attrs)
+        with self._lock:
+            self.spans.append(record)
+
+    def profile(self, func, *args):
+        """Runs func(*args) under cProfile when a profile path is set, dumping stats afterwards."""
+        if not self.profile_path:
+            return func(*args)
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args)
+        finally:
+            profiler.dump_stats(self.profile_path)
+
+    def summary(self):
+        """Returns per-phase totals in first-seen order, e.g. "copy 2.1 s (64.0 MB, 30.5 MB/s) · ..."."""
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for record in spans:
+            entry = totals.setdefault(record["span"], {"wall": 0.0, "bytes": 0, "count": 0, "hits": 0, "child_cpu": 0.0})
+            entry["wall"] += record["wall_s"]
+            entry["bytes"] += record.get("bytes", 0)
+            entry["count"] += 1
+            entry["hits"] += 1 if record.get("cache_hit") else 0
+            entry["child_cpu"] += record.get("child_cpu_s", 0.0)
+        parts = []
+        for name, entry in totals.items():
+            text = f"{name} {_format_seconds(entry['wall'])}"
+            extras = []
+            if entry["bytes"]:
+                extras.append(format_bytes(entry["bytes"]))
+                if entry["wall"] > 0:
+                    extras.append(f"{format_bytes(entry['bytes'] / entry['wall'])}/s")
+            if entry["child_cpu"]:
+                extras.append(f"cpu {_format_seconds(entry['child_cpu'])}")
+            if entry["hits"]:
+                extras.append(f"{entry['hits']} hit{'s' if entry['hits'] != 1 else ''}")
+            if entry["count"] > 1:
+                extras.append(f"x{entry['count']}")
+            if extras:
+                text += f" ({', '.join(extras)})"
+            parts.append(text)
+        parts.append(f"total {_format_seconds(time.perf_counter() - self._started)}")
+        return " · ".join(parts)
+
+    def finish(self, status="ok"):
+        """Appends every span to the log and returns the summary line."""
+        summary = self.summary()
+        if self.log_path:
+            self._write_log(status)
+        return summary
+
+    def _write_log(self, status):
+        timestamp = time.time()
+        with self._lock:
+            lines = [
+                json.dumps({"ts": timestamp, "run": self.run, "run_id": self.run_id, "status": status, **record})
+                for record in self.spans
+            ]
+        try:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > LOG_MAX_BYTES:
+                os.replace(self.log_path, f"{self.log_path}.1")
+            with open(self.log_path, "a", encoding="utf-8") as fh:
+                fh.write("\n".join(lines) + "\n")
+        except OSError:
+            pass
+
+
+class _NullTracer:
+    """Stands in when nobody is collecting spans."""
+
+    profile_path = None
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        yield {}
+
+    def add(self, *args, **kwargs):
+        pass
+
+    def profile(self, func, *args):
+        return func(*args)
+
+
+NULL_TRACER = _NullTracer()
+
+
+def _format_seconds(seconds):
+    return f"{seconds * 1000:.0f} ms" if seconds < 1 else f"{seconds:.1f} s"
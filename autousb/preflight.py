@@ -0,0 +1,177 @@
+"""Pre-flight checks before writing to a drive: free space, filesystem limits and write speed.
+
+The capacity check is cheap and runs before every copy. The write probe is optional: it
+writes a few megabytes with fsync, so it measures the stick rather than the page cache, and
+its result is remembered per drive to size copy chunks and estimate how long a copy takes.
+"""
+import os
+import shutil
+import threading
+import time
+
+from .copier import COPY_CHUNK_SIZE, is_up_to_date
+from .drives import filesystem_type
+from .journal import part_path
+from .sync import scan_tree
+from .util import format_bytes
+
+PROBE_BYTES = 8 * 1024 * 1024
+PROBE_NAME = ".autousb-probe.tmp"
+FAT_FSTYPES = {"vfat", "msdos", "fat", "fat16", "fat32"}
+FAT_MAX_FILE_SIZE = 4 * 1024 * 1024 * 1024 - 1
+SLOW_DRIVE_RATE = 5 * 1024 * 1024
+FAST_DRIVE_RATE = 100 * 1024 * 1024
+
+_probes = {}
+_probes_lock = threading.Lock()
+
+
+class PreflightError(Exception):
+    """Raised when a payload cannot fit on, or cannot be stored by, the target drive."""
+
+
+class DriveProbe:
+    """What is known about a drive's capacity and, once probed, its write speed."""
+
+    def __init__(self, drive, fstype="", free=None, rate=None):
+        self.drive = drive
+        self.fstype = fstype
+        self.free = free
+        self.rate = rate
+
+    def describe(self):
+        parts = [self.fstype] if self.fstype else []
+        if self.free is not None:
+            parts.append(f"{format_bytes(self.free)} free")
+        if self.rate:
+            parts.append(f"{format_bytes(self.rate)}/s")
+        return ", ".join(parts)
+
+
+class Preflight:
+    """Outcome of check_drive: payload size, space it still needs, and the chosen chunk size."""
+
+    def __init__(self, probe, total, needed, chunk_size):
+        self.probe = probe
+        self.total = total
+        self.needed = needed
+        self.chunk_size = chunk_size
+
+    @property
+    def eta(self):
+        """Seconds to write the whole payload at the probed speed; unchanged files make it shorter."""
+        return self.total / self.probe.rate if self.probe.rate else None
+
+    def describe(self):
+        text = f"{format_bytes(self.total)} payload, {format_bytes(self.probe.free)} free"
+        if self.eta is not None:
+            eta = f"{self.eta:.1f}" if self.eta < 10 else f"{self.eta:.0f}"
+            text += f", at most {eta} s at {format_bytes(self.probe.rate)}/s"
+        return text
+
+
+def free_space(path):
+    """Returns the bytes an unprivileged user may still write below path."""
+    if hasattr(os, "statvfs"):
+        st = os.statvfs(path)
+        return st.f_bavail * st.f_frsize
+    return shutil.disk_usage(path).free
+
+
+def drive_status(drive, fstype=""):
+    """Returns a DriveProbe with current free space and the last measured speed, if any."""
+    with _probes_lock:
+        known = _probes.get(drive)
+    fstype = fstype or (known.fstype if known else filesystem_type(drive))
+    return DriveProbe(drive, fstype, free_space(drive), known.rate if known else None)
+
+
+def probe_drive(drive, size=PROBE_BYTES, job=None):
+    """Measures sequential write speed with a short fsync'd write and remembers the result."""
+    path = os.path.join(drive, PROBE_NAME)
+    block = os.urandom(min(size, COPY_CHUNK_SIZE))
+    started = time.perf_counter()
+    try:
+        with open(path, "wb", buffering=0) as fh:
+            written = 0
+            while written < size:
+                if job is not None:
+                    job.check_cancelled()
+                written += fh.write(block)
+            os.fsync(fh.fileno())
+        elapsed = time.perf_counter() - started
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    probe = drive_status(drive)
+    probe.rate = written / max(elapsed, 1e-6)
+    with _probes_lock:
+        _probes[drive] = probe
+    return probe
+
+
+def forget_probe(drive):
+    """Drops the remembered speed, e.g. after the drive was unplugged."""
+    with _probes_lock:
+        _probes.pop(drive, None)
+
+
+def chunk_size_for(rate):
+    """Small chunks keep progress and cancel responsive on slow sticks; large ones cut syscalls."""
+    if rate is None:
+        return COPY_CHUNK_SIZE
+    if rate < SLOW_DRIVE_RATE:
+        return 256 * 1024
+    if rate >= FAST_DRIVE_RATE:
+        return 8 * 1024 * 1024
+    return COPY_CHUNK_SIZE
+
+
+def _existing_size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+def payload_sizes(drive, start_file_path, payload_dir=None):
+    """Returns (payload bytes, bytes still needed on drive, largest single file).
+
+    A file is rewritten into a part file next to the old copy and renamed over it only when
+    complete, so every file that is not up to date needs its full size. A part file left by an
+    interrupted copy already holds some of that space.
+    """
+    if payload_dir:
+        files = [
+            (st.st_size, os.path.join(payload_dir, *rel.split("/")), os.path.join(drive, *rel.split("/")))
+            for rel, st in scan_tree(payload_dir).items()
+        ]
+    else:
+        dest = os.path.join(drive, os.path.basename(start_file_path))
+        files = [(os.path.getsize(start_file_path), start_file_path, dest)]
+    total = sum(size for size, _src, _dest in files)
+    needed = sum(
+        max(0, size - _existing_size(part_path(dest)))
+        for size, src, dest in files
+        if not is_up_to_date(src, dest)
+    )
+    largest = max((size for size, _src, _dest in files), default=0)
+    return total, needed, largest
+
+
+def check_drive(drive, start_file_path, payload_dir=None):
+    """Raises PreflightError if the payload will not fit on drive. Returns a Preflight."""
+    probe = drive_status(drive)
+    total, needed, largest = payload_sizes(drive, start_file_path, payload_dir)
+    if probe.fstype.lower() in FAT_FSTYPES and largest > FAT_MAX_FILE_SIZE:
+        raise PreflightError(
+            f"{drive} is formatted {probe.fstype}, which cannot hold files over 4 GB "
+            f"(largest file is {format_bytes(largest)}). Reformat it as exFAT or NTFS."
+        )
+    if needed > probe.free:
+        raise PreflightError(
+            f"Not enough space on {drive}: {format_bytes(needed)} needed, {format_bytes(probe.free)} free."
+        )
+    return Preflight(probe, total, needed, chunk_size_for(probe.rate))
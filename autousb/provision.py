@@ -0,0 +1,458 @@
+"""Writing autorun.inf and provisioning one or many drives."""
+import mmap
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .copier import COPY_CHUNK_SIZE, PROGRESS_INTERVAL, SourceHashes, copy_file, is_up_to_date
+from .drives import physical_device
+from .jobs import JobCancelled
+from .journal import Journal, part_path, write_journaled
+from .preflight import PreflightError, check_drive
+from .sync import SyncError, sync_folder
+from .verify import VerifyError, verify_copies
+from .util import format_bytes
+
+PROVISION_MAX_WORKERS = 8
+
+
+class ProvisionError(Exception):
+    """Raised when a drive could not be provisioned."""
+
+
+def check_provision_inputs(drive, start_file_path, copy_files, payload_dir=None):
+    """Raises ProvisionError with a user-facing message if the inputs cannot be provisioned."""
+    if not drive:
+        raise ProvisionError("Please select a USB drive.")
+    if not os.path.isdir(drive):
+        raise ProvisionError(f"Drive '{drive}' does not exist.")
+    if start_file_path and not os.path.isfile(start_file_path):
+        raise ProvisionError(f"File not found: {start_file_path}")
+    if copy_files and not start_file_path:
+        raise ProvisionError("Select an executable to auto-run before saving to USB.")
+    if payload_dir:
+        check_payload_dir(payload_dir, start_file_path)
+
+
+def check_payload_dir(payload_dir, start_file_path):
+    """Raises ProvisionError unless payload_dir exists and contains the start file."""
+    if not os.path.isdir(payload_dir):
+        raise ProvisionError(f"Payload folder not found: {payload_dir}")
+    try:
+        outside = start_file_path and start_file_name(start_file_path, payload_dir).startswith("..")
+    except ValueError:
+        # relpath across Windows drive letters
+        outside = True
+    if outside:
+        raise ProvisionError("The executable to auto-run must be inside the payload folder.")
+
+
+def start_file_name(start_file_path, payload_dir=None):
+    """Returns the executable's path on the drive as autorun.inf spells it.
+
+    Without a payload folder the file lands in the drive root; with one it keeps its place
+    in the folder's tree, written with backslashes for Windows.
+    """
+    if not start_file_path:
+        return ""
+    if not payload_dir:
+        return os.path.basename(start_file_path)
+    rel = os.path.relpath(os.path.abspath(start_file_path), os.path.abspath(payload_dir))
+    return rel.replace(os.sep, "\\")
+
+
+def write_autorun(drive, content):
+    """Writes autorun.inf to drive unless it already has exactly this content. Returns its path."""
+    autorun_path = os.path.join(drive, "autorun.inf")
+    data = content.encode("utf-8")
+    try:
+        with open(autorun_path, "rb") as f:
+            if f.read(len(data) + 1) == data:
+                return autorun_path
+    except OSError:
+        pass
+    # Written aside and renamed, so a pulled stick keeps the old file rather than half a new one.
+    part = part_path(autorun_path)
+    with open(part, "wb") as f:
+        f.write(data)
+    os.replace(part, autorun_path)
+    return autorun_path
+
+
+def autorun_content(label, start_file_name):
+    """Returns the autorun.inf text for the given volume label and executable name."""
+    autorun_lines = ["[Autorun]"]
+    if label:
+        autorun_lines.append(f"Label={label}")
+    if start_file_name:
+        # Use both Open and ShellExecute for better compatibility
+        autorun_lines.append(f"Open={start_file_name}")
+        autorun_lines.append(f"ShellExecute={start_file_name}")
+        autorun_lines.append("Action=Run autorun")
+        autorun_lines.append("UseAutoPlay=1")
+        # If there's no explicit icon, let the exe act as the icon
+        autorun_lines.append(f"Icon={start_file_name}")
+    autorun_lines.append("; autorun.inf created by AutoUSB")
+    # Windows prefers CRLF line endings for autorun.inf
+    return "\r\n".join(autorun_lines) + "\r\n"
+
+
+def provision_drive(job, drive, start_file_path, label, copy_files, verify_hash=False, payload_dir=None, verify=False):
+    """Copies the start file, or mirrors the payload folder, (optionally) and writes autorun.inf.
+
+    With verify, everything written is read back from the device and compared with the source.
+    A single start file is copied under a journal, so an interrupted copy resumes from its last
+    fsync'd chunk and a rerun skips a read-back that already passed.
+    Returns (autorun_path, a CopyResult or SyncResult, or None when nothing was copied).
+    """
+    name = start_file_name(start_file_path, payload_dir)
+    copy_result = None
+    journal = None
+    chunk_size = COPY_CHUNK_SIZE
+    if copy_files:
+        chunk_size = _preflight(job, drive, start_file_path, payload_dir).chunk_size
+    if copy_files and payload_dir:
+        try:
+            copy_result = sync_folder(job, payload_dir, drive, chunk_size=chunk_size, verify=verify)
+        except JobCancelled:
+            raise
+        except (SyncError, VerifyError) as exc:
+            raise ProvisionError(str(exc)) from exc
+        except Exception as exc:
+            raise ProvisionError(f"Could not sync the payload folder: {exc}") from exc
+    elif copy_files:
+        destination_start_file_path = os.path.join(drive, name)
+        try:
+            journal, rewrite = _open_journal(start_file_path, destination_start_file_path)
+            copy_result = copy_file(
+                start_file_path,
+                destination_start_file_path,
+                job,
+                verify_hash=verify_hash,
+                chunk_size=chunk_size,
+                skip_unchanged=not rewrite,
+                journal=journal,
+            )
+            if not copy_result.skipped:
+                journal.mark("copied")
+        except JobCancelled:
+            raise
+        except Exception as exc:
+            raise ProvisionError(f"Could not copy the start file: {exc}") from exc
+
+    job.check_cancelled()
+    autorun = autorun_content(label, name)
+    try:
+        with job.span("autorun.inf"):
+            autorun_path = write_autorun(drive, autorun)
+    except Exception as exc:
+        raise ProvisionError(f"Could not create autorun.inf: {exc}") from exc
+
+    if verify:
+        pairs = [(autorun.encode("utf-8"), autorun_path)]
+        if journal is not None and _needs_verify(journal, copy_result.skipped):
+            pairs.append((start_file_path, os.path.join(drive, name)))
+        job.report(f"Verifying {drive}...")
+        try:
+            mismatched = verify_copies(job, drive, pairs)
+        except OSError as exc:
+            raise ProvisionError(f"Could not read back {drive}: {exc}") from exc
+        _record_verified(pairs, mismatched)
+        if mismatched:
+            raise ProvisionError(str(VerifyError(drive, mismatched)))
+    return autorun_path, copy_result
+
+
+def _open_journal(start_file_path, dest):
+    """Returns (the copy's Journal, whether dest must be rewritten because it last read back wrong)."""
+    journal = Journal(start_file_path, dest)
+    rewrite = journal.done("mismatched")
+    if rewrite:
+        journal.start_copy()
+    return journal, rewrite
+
+
+def _needs_verify(journal, skipped):
+    """A fresh copy is read back; so is an earlier one whose run stopped before its read-back."""
+    return not skipped or (journal.done("copied") and not journal.done("verified"))
+
+
+def _record_verified(pairs, mismatched):
+    """Notes in each copied file's journal how it read back, so a rerun skips or rewrites it."""
+    for source, dest in pairs:
+        if not isinstance(source, bytes):
+            Journal(source, dest).mark("mismatched" if dest in mismatched else "verified")
+
+
+def _preflight(job, drive, start_file_path, payload_dir):
+    try:
+        with job.span("preflight"):
+            preflight = check_drive(drive, start_file_path, payload_dir)
+    except PreflightError as exc:
+        raise ProvisionError(str(exc)) from exc
+    except OSError as exc:
+        raise ProvisionError(f"Could not check free space on {drive}: {exc}") from exc
+    job.report(preflight.describe())
+    return preflight
+
+
+class DriveResult:
+    """Outcome of provisioning one drive in a multi-drive run."""
+
+    def __init__(self, drive):
+        self.drive = drive
+        self.ok = False
+        self.bytes_written = 0
+        self.seconds = 0.0
+        self.skipped = False
+        self.verified = None
+        self.error = ""
+
+    @property
+    def rate(self):
+        return self.bytes_written / self.seconds if self.seconds else 0.0
+
+
+def _map_source(fh):
+    size = os.fstat(fh.fileno()).st_size
+    if not size:
+        return b""
+    buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(buf, "madvise"):
+        buf.madvise(mmap.MADV_WILLNEED)
+    return buf
+
+
+class _DriveJob:
+    """One drive's view of a multi-drive job: plain progress strings become row updates."""
+
+    def __init__(self, job, drive):
+        self._job = job
+        self.drive = drive
+
+    def __getattr__(self, name):
+        return getattr(self._job, name)
+
+    def report(self, message):
+        self._job.report((self.drive, message, 0.0) if isinstance(message, str) else message)
+
+
+def _run_drive(job, drive, result, work, verifying=False):
+    """Runs work(started) for one drive of a multi-drive run and records the outcome in result.
+
+    Returns what work returned: the (source, copy) pairs still to be read back.
+    """
+    started = time.monotonic()
+    job.report((drive, "copying", 0.0))
+    pairs = None
+    try:
+        pairs = work(started)
+    except JobCancelled:
+        result.error = "cancelled"
+        raise
+    except Exception as exc:
+        result.error = str(exc)
+    else:
+        result.ok = True
+    finally:
+        result.seconds = time.monotonic() - started
+    status = "verifying" if verifying else "unchanged" if result.skipped else "done"
+    job.report((drive, status if result.ok else f"failed: {result.error}", result.rate))
+    return pairs if result.ok else None
+
+
+def _verify_drive(job, hashes, drive, pairs, result):
+    try:
+        mismatched = verify_copies(job, drive, pairs, hashes)
+        _record_verified(pairs, mismatched)
+    except JobCancelled:
+        result.ok, result.error = False, "cancelled"
+        raise
+    except OSError as exc:
+        result.ok, result.error = False, f"could not read back: {exc}"
+    else:
+        result.verified = not mismatched
+        if mismatched:
+            result.ok, result.error = False, str(VerifyError(drive, mismatched))
+    job.report((drive, "verified" if result.ok else f"failed: {result.error}", result.rate))
+
+
+def _autorun_to_drive(drive, label, name, _started=None):
+    """Writes drive's autorun.inf. Returns it as the (content, copy) pair to read back."""
+    autorun = autorun_content(label, name)
+    return [(autorun.encode("utf-8"), write_autorun(drive, autorun))]
+
+
+def _fan_out_to_drive(job, source, start_file_path, drive, label, verify_hash, result, started):
+    name = os.path.basename(start_file_path)
+    dest = os.path.join(drive, name)
+    pairs = []
+    journal, rewrite = _open_journal(start_file_path, dest)
+    if not rewrite and is_up_to_date(start_file_path, dest, verify_hash):
+        result.skipped = True
+    else:
+        chunk_size = check_drive(drive, start_file_path).chunk_size
+        # The drive wrapper turns the plain "Resuming ..." message into this drive's row update.
+        drive_job = _DriveJob(job, drive)
+        _write_source(drive_job, source, start_file_path, dest, drive, journal, result, started, chunk_size)
+        journal.mark("copied")
+    if _needs_verify(journal, result.skipped):
+        pairs.append((start_file_path, dest))
+    return pairs + _autorun_to_drive(drive, label, name)
+
+
+def _sync_to_drive(job, hashes, payload_dir, name, drive, label, result, verify, _started):
+    chunk_size = check_drive(drive, None, payload_dir).chunk_size
+    # The sync reads back its own files so that it can drop bad copies from the manifest.
+    synced = sync_folder(_DriveJob(job, drive), payload_dir, drive, hashes, chunk_size=chunk_size, verify=verify)
+    result.bytes_written = synced.bytes_written
+    result.skipped = not synced.files_written and not synced.files_deleted
+    return _autorun_to_drive(drive, label, name)
+
+
+def _write_source(job, source, start_file_path, dest, drive, journal, result, started, chunk_size=COPY_CHUNK_SIZE):
+    view = memoryview(source)
+    total = len(view)
+    last_report = 0.0
+
+    def progress(position, written):
+        nonlocal last_report
+        result.bytes_written = written
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            result.seconds = now - started
+            job.report((drive, f"copying {position * 100 // total}%", result.rate))
+
+    try:
+        result.bytes_written, _resumed = write_journaled(
+            job,
+            lambda offset, length: view[offset : offset + length],
+            total,
+            dest,
+            start_file_path,
+            journal,
+            chunk_size,
+            progress,
+        )
+    finally:
+        view.release()
+
+
+def provision_drives(
+    job,
+    drives,
+    start_file_path,
+    label,
+    max_workers=PROVISION_MAX_WORKERS,
+    payload_dir=None,
+    verify=False,
+    copy_files=True,
+    verify_hash=False,
+):
+    """Copies one executable, or mirrors a payload folder, plus autorun.inf to many drives concurrently.
+
+    A single executable is mapped into memory once and every destination writes from the same
+    pages; a payload folder is hashed once and synced to each drive against its manifest.
+    Without copy_files only autorun.inf is written; verify_hash compares an executable already
+    on a drive by content before skipping it, as provision_drive does. Drives on the same physical device share a worker so partitions of one stick never
+    compete for its bandwidth. With verify, each drive is read back on a separate pool as
+    soon as its copy finishes, overlapping with copies still running elsewhere.
+    Returns a list of DriveResult in the order of drives.
+    """
+    hashes = SourceHashes()
+    if not copy_files:
+        name = start_file_name(start_file_path, payload_dir)
+
+        def autorun_one(drive, result):
+            return _run_drive(job, drive, result, partial(_autorun_to_drive, drive, label, name), verify)
+
+        return _provision_groups(job, drives, autorun_one, max_workers, hashes if verify else None)
+
+    if payload_dir:
+        name = start_file_name(start_file_path, payload_dir)
+
+        def sync_one(drive, result):
+            work = partial(_sync_to_drive, job, hashes, payload_dir, name, drive, label, result, verify)
+            return _run_drive(job, drive, result, work, verify)
+
+        return _provision_groups(job, drives, sync_one, max_workers, hashes if verify else None)
+
+    with open(start_file_path, "rb") as fh:
+        with job.span("map source") as record:
+            source = _map_source(fh)
+            record["bytes"] = len(source)
+
+        def fan_out_one(drive, result):
+            work = partial(_fan_out_to_drive, job, source, start_file_path, drive, label, verify_hash, result)
+            return _run_drive(job, drive, result, work, verify)
+
+        try:
+            return _provision_groups(job, drives, fan_out_one, max_workers, hashes if verify else None)
+        finally:
+            if isinstance(source, mmap.mmap):
+                source.close()
+
+
+def _provision_groups(job, drives, provision_one, max_workers, verify_hashes=None):
+    results = {drive: DriveResult(drive) for drive in drives}
+    groups = {}
+    for drive in drives:
+        groups.setdefault(physical_device(drive), []).append(drive)
+    workers = max(1, min(len(groups), max_workers))
+    verify_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="autousb-verify")
+    verifications = []
+
+    def run_group(group):
+        for drive in group:
+            if job.cancelled:
+                results[drive].error = "cancelled"
+                continue
+            try:
+                with job.span("drive", drive=drive) as record:
+                    pairs = provision_one(drive, results[drive])
+                    record.update(bytes=results[drive].bytes_written, skipped=results[drive].skipped)
+            except JobCancelled:
+                continue
+            if pairs and verify_hashes is not None:
+                verifications.append(
+                    verify_pool.submit(_verify_drive, job, verify_hashes, drive, pairs, results[drive])
+                )
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="autousb-drive") as pool:
+            futures = [pool.submit(run_group, group) for group in groups.values()]
+            for future in futures:
+                future.result()
+        for future in verifications:
+            try:
+                future.result()
+            except JobCancelled:
+                pass
+    except BaseException:
+        # e.g. Ctrl-C in the CLI: stop the workers before the pools wait for them.
+        job.cancel()
+        raise
+    finally:
+        verify_pool.shutdown(wait=True)
+    job.check_cancelled()
+    return [results[drive] for drive in drives]
+
+
+def summarize_results(results, elapsed):
+    """Returns a human-readable summary of a multi-drive run."""
+    ok = [r for r in results if r.ok]
+    total_bytes = sum(r.bytes_written for r in ok)
+    verified = sum(1 for r in ok if r.verified)
+    lines = [
+        f"Provisioned {len(ok)} of {len(results)} drive{'s' if len(results) != 1 else ''} in {elapsed:.1f} s "
+        f"({format_bytes(total_bytes)} written, {format_bytes(total_bytes / max(elapsed, 1e-6))}/s aggregate"
+        f"{f', {verified} verified' if verified else ''})."
+    ]
+    failed = [r for r in results if not r.ok]
+    if failed:
+        lines.append("")
+        lines.append("Failed:")
+        lines.extend(f"{r.drive}: {r.error}" for r in failed)
+    return "\n".join(lines)
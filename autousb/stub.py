@@ -0,0 +1,363 @@
+"""Prebuilt launcher stub: compile once per toolchain, then build EXEs by appending the script.
+
+A stub build is the compiled launcher followed by an overlay:
+
+    payload bytes | length (u32) | crc32 (u32) | flags (u32) | b"AUSBPAY1"
+
+Windows ignores data past the last PE section, so the overlay survives untouched. At run
+time the stub reads its own trailer, checks the CRC, writes the payload to a temporary .bat
+and runs it.
+
+Two launchers share that format. The "stub" launcher is C++ linked statically against the
+MinGW runtime. The "tiny" one is plain C against kernel32 alone, with no runtime, startup
+files or unwind tables, so it comes out at a few KB instead of tens. Only the tiny launcher
+understands FLAG_LZNT1, where the payload is a u32 script length followed by LZNT1 data that
+it inflates with ntdll's RtlDecompressBuffer.
+"""
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import zlib
+
+from . import lznt1
+from .build import MINGW_FLAGS, BuildError, encode_batch
+from .util import cache_dir, format_bytes, tool_version
+
+PAYLOAD_MAGIC = b"AUSBPAY1"
+TRAILER = struct.Struct("<III8s")
+RAW_LENGTH = struct.Struct("<I")
+FLAG_LZNT1 = 1
+# Bump when STUB_SOURCE or TINY_SOURCE changes so every toolchain recompiles its launchers.
+STUB_VERSION = 1
+TINY_FLAGS = [
+    "-x",
+    "c",
+    "-Os",
+    "-s",
+    "-nostdlib",
+    "-nostartfiles",
+    "-ffreestanding",
+    "-fno-builtin",
+    "-fno-stack-protector",
+    "-fno-asynchronous-unwind-tables",
+    "-fno-ident",
+    # Keeps GCC from turning the zeroing loop back into a memset call nothing would provide.
+    "-fno-tree-loop-distribute-patterns",
+    "-mno-stack-arg-probe",
+    "-ffunction-sections",
+    "-Wl,--gc-sections",
+    "-Wl,--subsystem,windows",
+]
+TINY_LIBS = ["-lkernel32"]
+
+STUB_SOURCE = r"""
+#include <windows.h>
+
+struct Trailer {
+    DWORD length;
+    DWORD crc;
+    DWORD flags;
+    char magic[8];
+};
+
+static DWORD crc32(const unsigned char *data, DWORD size) {
+    DWORD crc = 0xFFFFFFFFu;
+    while (size--) {
+        crc ^= *data++;
+        for (int k = 0; k < 8; k++) crc = (crc >> 1) ^ (0xEDB88320u & (0u - (crc & 1u)));
+    }
+    return ~crc;
+}
+
+static BOOL read_at(HANDLE file, LONGLONG offset, void *buffer, DWORD size) {
+    LARGE_INTEGER pos;
+    DWORD read = 0;
+    pos.QuadPart = offset;
+    return SetFilePointerEx(file, pos, NULL, FILE_BEGIN) && ReadFile(file, buffer, size, &read, NULL) && read == size;
+}
+
+int WINAPI WinMain(HINSTANCE, HINSTANCE, LPSTR, int) {
+    char selfPath[MAX_PATH];
+    if (!GetModuleFileNameA(NULL, selfPath, MAX_PATH)) return 1;
+    HANDLE self = CreateFileA(selfPath, GENERIC_READ, FILE_SHARE_READ, NULL, OPEN_EXISTING, 0, NULL);
+    if (self == INVALID_HANDLE_VALUE) return 1;
+
+    LARGE_INTEGER size;
+    struct Trailer trailer;
+    if (!GetFileSizeEx(self, &size) || size.QuadPart < (LONGLONG)sizeof(trailer)) return 1;
+    LONGLONG trailerAt = size.QuadPart - sizeof(trailer);
+    if (!read_at(self, trailerAt, &trailer, sizeof(trailer))) return 1;
+    if (memcmp(trailer.magic, "AUSBPAY1", 8) != 0 || trailer.flags != 0 || trailer.length > trailerAt) return 1;
+
+    unsigned char *payload = (unsigned char *)HeapAlloc(GetProcessHeap(), 0, trailer.length + 1);
+    if (!payload || !read_at(self, trailerAt - trailer.length, payload, trailer.length)) return 1;
+    CloseHandle(self);
+    if (crc32(payload, trailer.length) != trailer.crc) return 2;
+
+    char tempPath[MAX_PATH];
+    char tempFile[MAX_PATH];
+    char batchFile[MAX_PATH + 4];
+    if (!GetTempPathA(MAX_PATH, tempPath)) return 1;
+    if (!GetTempFileNameA(tempPath, "ab", 0, tempFile)) return 1;
+    wsprintfA(batchFile, "%s.bat", tempFile);
+    HANDLE out = CreateFileA(batchFile, GENERIC_WRITE, 0, NULL, CREATE_ALWAYS, FILE_ATTRIBUTE_TEMPORARY, NULL);
+    if (out == INVALID_HANDLE_VALUE) return 1;
+    DWORD written = 0;
+    BOOL ok = WriteFile(out, payload, trailer.length, &written, NULL) && written == trailer.length;
+    CloseHandle(out);
+    HeapFree(GetProcessHeap(), 0, payload);
+    if (!ok) return 1;
+
+    char cmd[MAX_PATH + 16];
+    wsprintfA(cmd, "cmd /c \"%s\"", batchFile);
+    STARTUPINFOA si = {0};
+    si.cb = sizeof(si);
+    PROCESS_INFORMATION pi = {0};
+    DWORD exitCode = 1;
+    if (CreateProcessA(NULL, cmd, NULL, NULL, FALSE, CREATE_NO_WINDOW, NULL, NULL, &si, &pi)) {
+        WaitForSingleObject(pi.hProcess, INFINITE);
+        GetExitCodeProcess(pi.hProcess, &exitCode);
+        CloseHandle(pi.hProcess);
+        CloseHandle(pi.hThread);
+    }
+    DeleteFileA(batchFile);
+    DeleteFileA(tempFile);
+    return (int)exitCode;
+}
+"""
+
+# Plain C with no runtime: the entry point is start(), and only kernel32 is linked. ntdll is
+# always loaded, so RtlDecompressBuffer is looked up at run time rather than imported.
+TINY_SOURCE = r"""
+#include <windows.h>
+
+#define FLAG_LZNT1 1u
+
+typedef LONG (WINAPI *RtlDecompressBufferFn)(USHORT, PUCHAR, ULONG, PUCHAR, ULONG, PULONG);
+
+struct Trailer {
+    DWORD length;
+    DWORD crc;
+    DWORD flags;
+    char magic[8];
+};
+
+static DWORD crc32(const unsigned char *data, DWORD size) {
+    DWORD crc = 0xFFFFFFFFu;
+    while (size--) {
+        crc ^= *data++;
+        for (int k = 0; k < 8; k++) crc = (crc >> 1) ^ (0xEDB88320u & (0u - (crc & 1u)));
+    }
+    return ~crc;
+}
+
+static void zero(void *buffer, DWORD size) {
+    volatile unsigned char *p = (volatile unsigned char *)buffer;
+    while (size--) *p++ = 0;
+}
+
+static BOOL read_at(HANDLE file, LONGLONG offset, void *buffer, DWORD size) {
+    LARGE_INTEGER pos;
+    DWORD read = 0;
+    pos.QuadPart = offset;
+    return SetFilePointerEx(file, pos, NULL, FILE_BEGIN) && ReadFile(file, buffer, size, &read, NULL) && read == size;
+}
+
+static DWORD run(void) {
+    static const char magic[8] = {'A', 'U', 'S', 'B', 'P', 'A', 'Y', '1'};
+    char selfPath[MAX_PATH];
+    if (!GetModuleFileNameA(NULL, selfPath, MAX_PATH)) return 1;
+    HANDLE self = CreateFileA(selfPath, GENERIC_READ, FILE_SHARE_READ, NULL, OPEN_EXISTING, 0, NULL);
+    if (self == INVALID_HANDLE_VALUE) return 1;
+
+    LARGE_INTEGER size;
+    struct Trailer trailer;
+    if (!GetFileSizeEx(self, &size) || size.QuadPart < (LONGLONG)sizeof(trailer)) return 1;
+    LONGLONG trailerAt = size.QuadPart - sizeof(trailer);
+    if (!read_at(self, trailerAt, &trailer, sizeof(trailer))) return 1;
+    for (int i = 0; i < 8; i++) {
+        if (trailer.magic[i] != magic[i]) return 1;
+    }
+    if ((trailer.flags & ~FLAG_LZNT1) != 0 || trailer.length > trailerAt) return 1;
+
+    HANDLE heap = GetProcessHeap();
+    unsigned char *payload = (unsigned char *)HeapAlloc(heap, 0, trailer.length + 1);
+    if (!payload || !read_at(self, trailerAt - trailer.length, payload, trailer.length)) return 1;
+    CloseHandle(self);
+    if (crc32(payload, trailer.length) != trailer.crc) return 2;
+
+    unsigned char *script = payload;
+    DWORD scriptLength = trailer.length;
+    if (trailer.flags & FLAG_LZNT1) {
+        if (trailer.length < 4) return 2;
+        scriptLength = payload[0] | (payload[1] << 8) | (payload[2] << 16) | ((DWORD)payload[3] << 24);
+        RtlDecompressBufferFn decompress =
+            (RtlDecompressBufferFn)GetProcAddress(GetModuleHandleA("ntdll.dll"), "RtlDecompressBuffer");
+        script = (unsigned char *)HeapAlloc(heap, 0, scriptLength + 1);
+        ULONG produced = 0;
+        if (!decompress || !script) return 1;
+        if (decompress(COMPRESSION_FORMAT_LZNT1, script, scriptLength, payload + 4, trailer.length - 4, &produced) != 0
+            || produced != scriptLength) {
+            return 2;
+        }
+    }
+
+    char tempPath[MAX_PATH];
+    char tempFile[MAX_PATH];
+    char batchFile[MAX_PATH + 4];
+    if (!GetTempPathA(MAX_PATH, tempPath)) return 1;
+    if (!GetTempFileNameA(tempPath, "ab", 0, tempFile)) return 1;
+    lstrcpyA(batchFile, tempFile);
+    lstrcatA(batchFile, ".bat");
+    HANDLE out = CreateFileA(batchFile, GENERIC_WRITE, 0, NULL, CREATE_ALWAYS, FILE_ATTRIBUTE_TEMPORARY, NULL);
+    if (out == INVALID_HANDLE_VALUE) return 1;
+    DWORD written = 0;
+    BOOL ok = WriteFile(out, script, scriptLength, &written, NULL) && written == scriptLength;
+    CloseHandle(out);
+    if (!ok) return 1;
+
+    char cmd[MAX_PATH + 16];
+    lstrcpyA(cmd, "cmd /c \"");
+    lstrcatA(cmd, batchFile);
+    lstrcatA(cmd, "\"");
+    STARTUPINFOA si;
+    PROCESS_INFORMATION pi;
+    zero(&si, sizeof(si));
+    zero(&pi, sizeof(pi));
+    si.cb = sizeof(si);
+    DWORD exitCode = 1;
+    if (CreateProcessA(NULL, cmd, NULL, NULL, FALSE, CREATE_NO_WINDOW, NULL, NULL, &si, &pi)) {
+        WaitForSingleObject(pi.hProcess, INFINITE);
+        GetExitCodeProcess(pi.hProcess, &exitCode);
+        CloseHandle(pi.hProcess);
+        CloseHandle(pi.hThread);
+    }
+    DeleteFileA(batchFile);
+    DeleteFileA(tempFile);
+    return exitCode;
+}
+
+void start(void) {
+    ExitProcess(run());
+}
+"""
+
+
+def _tiny_flags(compiler):
+    # i686 symbols carry a leading underscore; x86_64 ones do not.
+    entry = "_start" if os.path.basename(compiler).startswith("i686") else "start"
+    return [*TINY_FLAGS, f"-Wl,-e,{entry}"]
+
+
+# launcher: (cache file prefix, source, source file name, flags for a compiler, libraries)
+LAUNCHERS = {
+    "stub": ("launcher", STUB_SOURCE, "launcher.cpp", lambda compiler: MINGW_FLAGS, []),
+    "tiny": ("tiny", TINY_SOURCE, "tiny.c", _tiny_flags, TINY_LIBS),
+}
+
+
+def stub_dir():
+    return os.path.join(cache_dir(), "stubs")
+
+
+def stub_key(compiler, launcher="stub"):
+    """Identifies the launcher built by one compiler binary, version and flag set."""
+    _prefix, source, _name, flags, libs = LAUNCHERS[launcher]
+    digest = hashlib.sha256()
+    parts = (str(STUB_VERSION), compiler, tool_version(compiler), "\0".join(flags(compiler) + libs), source)
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+def ensure_stub(job, compiler, launcher="stub"):
+    """Returns the path of the compiled launcher for compiler, compiling it on first use."""
+    prefix, source, source_name, flags, libs = LAUNCHERS[launcher]
+    stub_path = os.path.join(stub_dir(), f"{prefix}-{stub_key(compiler, launcher)}.exe")
+    if os.path.isfile(stub_path):
+        return stub_path
+    job.report(f"Compiling {launcher} launcher (one time per toolchain)...")
+    os.makedirs(stub_dir(), exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cpp_path = os.path.join(tmpdir, source_name)
+        with open(cpp_path, "w", encoding="utf-8") as fh:
+            fh.write(source)
+        out_path = os.path.join(tmpdir, "launcher.exe")
+        with job.span("stub compile", launcher=launcher):
+            returncode, output = job.run_process([compiler, *flags(compiler), cpp_path, "-o", out_path, *libs])
+        if returncode != 0:
+            raise BuildError(output)
+        # Concurrent builds may race to publish the same stub; each copies to its own temp
+        # name, so every rename puts a whole launcher in place.
+        tmp_stub = f"{stub_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            shutil.copyfile(out_path, tmp_stub)
+            os.replace(tmp_stub, stub_path)
+        except BaseException:
+            try:
+                os.remove(tmp_stub)
+            except OSError:
+                pass
+            raise
+    return stub_path
+
+
+def append_payload(stub_path, payload, save_path, flags=0):
+    """Writes stub_path followed by payload and its trailer to save_path."""
+    trailer = TRAILER.pack(len(payload), zlib.crc32(payload) & 0xFFFFFFFF, flags, PAYLOAD_MAGIC)
+    with open(stub_path, "rb") as src, open(save_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+        dst.write(payload)
+        dst.write(trailer)
+
+
+def pack_payload(script, compress=False):
+    """Returns (payload, flags) for script; LZNT1 is used only when it actually saves bytes."""
+    if compress:
+        packed = RAW_LENGTH.pack(len(script)) + lznt1.compress(script)
+        if len(packed) < len(script):
+            return packed, FLAG_LZNT1
+    return script, 0
+
+
+def read_payload(exe_path):
+    """Returns (script, flags) from a stub build, or raises BuildError if the overlay is invalid."""
+    with open(exe_path, "rb") as fh:
+        fh.seek(0, os.SEEK_END)
+        size = fh.tell()
+        if size < TRAILER.size:
+            raise BuildError(f"{exe_path} has no payload trailer.")
+        fh.seek(size - TRAILER.size)
+        length, crc, flags, magic = TRAILER.unpack(fh.read(TRAILER.size))
+        if magic != PAYLOAD_MAGIC or length > size - TRAILER.size:
+            raise BuildError(f"{exe_path} has no payload trailer.")
+        fh.seek(size - TRAILER.size - length)
+        payload = fh.read(length)
+    if zlib.crc32(payload) & 0xFFFFFFFF != crc:
+        raise BuildError(f"{exe_path} payload checksum mismatch.")
+    if flags & FLAG_LZNT1:
+        (length,) = RAW_LENGTH.unpack_from(payload)
+        try:
+            payload = lznt1.decompress(payload[RAW_LENGTH.size:])
+        except ValueError as exc:
+            raise BuildError(f"{exe_path} payload is corrupt: {exc}") from exc
+        if len(payload) != length:
+            raise BuildError(f"{exe_path} payload is corrupt: expected {length} bytes.")
+    return payload, flags
+
+
+def build_with_stub(job, compiler, content, save_path, launcher="stub", compress=False):
+    """Appends the script to a prebuilt launcher. Returns a note with the launcher and payload sizes."""
+    stub_path = ensure_stub(job, compiler, launcher)
+    script = encode_batch(content)
+    payload, flags = pack_payload(script, compress)
+    with job.span("stub append", bytes=len(payload)):
+        append_payload(stub_path, payload, save_path, flags)
+    note = f"{launcher} launcher {format_bytes(os.path.getsize(stub_path))} + payload {format_bytes(len(payload))}"
+    if flags & FLAG_LZNT1:
+        note += f" (LZNT1 from {format_bytes(len(script))})"
+    return note
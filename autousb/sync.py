@@ -0,0 +1,256 @@
+"""Mirroring a payload folder to a drive, driven by a manifest kept on the drive.
+
+The manifest records size, mtime and SHA-256 for every file the last sync wrote. A re-sync
+only stats the source tree; files whose size and mtime still match the manifest (and whose
+copy on the drive is still there) are skipped without reading them. Changed candidates are
+hashed in parallel, so a touched-but-identical file costs a read instead of a write, and
+files that disappeared from the source are deleted from the drive. Nothing the manifest does
+not list is ever deleted. With verify, the files written are read back from the device and
+any that differ are dropped from the manifest, so the next sync rewrites them.
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .copier import COPY_CHUNK_SIZE, SourceHashes, copy_file
+from .util import format_bytes
+from .verify import VerifyError, verify_copies
+
+MANIFEST_NAME = ".autousb-manifest.json"
+MANIFEST_VERSION = 1
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+
+
+class SyncError(Exception):
+    """Raised when the payload folder cannot be read or the manifest cannot be written."""
+
+
+class SyncResult:
+    """Counts of files and bytes written, skipped and deleted by one sync."""
+
+    def __init__(self):
+        self.files_written = 0
+        self.bytes_written = 0
+        self.files_skipped = 0
+        self.bytes_skipped = 0
+        self.files_deleted = 0
+        self.seconds = 0.0
+
+    @property
+    def rate(self):
+        return self.bytes_written / self.seconds if self.seconds else 0.0
+
+    def describe(self, name=""):
+        text = (
+            f"{f'synced {name}: ' if name else ''}{self.files_written} file{'s' if self.files_written != 1 else ''} written "
+            f"({format_bytes(self.bytes_written)}), {self.files_skipped} unchanged "
+            f"({format_bytes(self.bytes_skipped)})"
+        )
+        if self.files_deleted:
+            text += f", {self.files_deleted} deleted"
+        return text + f" in {self.seconds:.1f} s"
+
+
+def scan_tree(root):
+    """Returns {relative posix path: os.stat_result} for every regular file under root.
+
+    Linked folders are followed, but each folder is entered once, so a link loop ends.
+    """
+    files = {}
+    st = os.stat(root)
+    visited = {(st.st_dev, st.st_ino)}
+    stack = [("", root)]
+    while stack:
+        prefix, folder = stack.pop()
+        with os.scandir(folder) as it:
+            for entry in it:
+                rel = f"{prefix}{entry.name}"
+                if entry.is_dir():
+                    st = entry.stat()
+                    if (st.st_dev, st.st_ino) not in visited:
+                        visited.add((st.st_dev, st.st_ino))
+                        stack.append((f"{rel}/", entry.path))
+                elif entry.is_file() and rel != MANIFEST_NAME:
+                    files[rel] = entry.stat()
+    return files
+
+
+def manifest_path(drive):
+    return os.path.join(drive, MANIFEST_NAME)
+
+
+def _safe_rel(rel):
+    """True if rel is a relative posix path that cannot leave the folder it is joined to."""
+    if not isinstance(rel, str) or not rel or "\\" in rel or rel.startswith("/") or ":" in rel:
+        return False
+    return all(part not in ("", ".", "..") for part in rel.split("/"))
+
+
+def _inside(drive, path):
+    root = os.path.realpath(drive)
+    return os.path.commonpath([root, os.path.realpath(path)]) == root
+
+
+def load_manifest(drive):
+    """Returns the manifest's file table, or {} if the drive has none or it is unreadable.
+
+    The manifest comes from the stick, so entries whose path could point outside it are dropped.
+    """
+    try:
+        with open(manifest_path(drive), encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+        return {}
+    files = data.get("files")
+    if not isinstance(files, dict):
+        return {}
+    return {rel: record for rel, record in files.items() if _safe_rel(rel) and isinstance(record, dict)}
+
+
+def save_manifest(drive, files):
+    """Writes the manifest through a temp file so an unplugged stick keeps the previous one."""
+    path = manifest_path(drive)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, fh, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _unchanged(record, st, dest):
+    """True if the manifest entry matches the source stat and the drive copy is still present.
+
+    The manifest holds the source's own mtime, so unlike a source-to-FAT comparison this one
+    can be exact.
+    """
+    if not record or record.get("size") != st.st_size or record.get("mtime_ns") != st.st_mtime_ns:
+        return False
+    try:
+        return os.stat(dest).st_size == st.st_size
+    except OSError:
+        return False
+
+
+def _remove_empty_dirs(drive, rel):
+    folder = os.path.dirname(rel)
+    while folder:
+        try:
+            os.rmdir(os.path.join(drive, folder))
+        except OSError:
+            return
+        folder = os.path.dirname(folder)
+
+
+def sync_folder(job, source_dir, drive, hashes=None, workers=HASH_WORKERS, chunk_size=COPY_CHUNK_SIZE, verify=False):
+    """Mirrors source_dir onto the root of drive and returns a SyncResult.
+
+    The manifest is saved even when the sync fails or is cancelled, so the next run resumes
+    from the files that did make it. Raises VerifyError if a written file reads back wrong.
+    """
+    started = time.monotonic()
+    hashes = hashes or SourceHashes()
+    result = SyncResult()
+    try:
+        with job.span("scan") as record:
+            source = scan_tree(source_dir)
+            record["files"] = len(source)
+    except OSError as exc:
+        raise SyncError(f"Could not read payload folder: {exc}") from exc
+    old = load_manifest(drive)
+    manifest = dict(old)
+
+    pending = []
+    for rel, st in sorted(source.items()):
+        dest = os.path.join(drive, *rel.split("/"))
+        if _unchanged(old.get(rel), st, dest):
+            result.files_skipped += 1
+            result.bytes_skipped += st.st_size
+        else:
+            pending.append((rel, st, os.path.join(source_dir, *rel.split("/")), dest))
+    job.report(f"{len(pending)} of {len(source)} files may have changed")
+
+    written = []
+    completed = False
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="autousb-hash") as pool:
+            futures = {pool.submit(hashes.get, item[2], item[1].st_size, item[1].st_mtime_ns): item for item in pending}
+            try:
+                # Hashing runs ahead in the pool while this thread writes whatever is ready.
+                for done, future in enumerate(as_completed(futures), 1):
+                    rel, st, src, dest = futures[future]
+                    job.check_cancelled()
+                    digest = future.result()
+                    entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+                    previous = old.get(rel) or {}
+                    if previous.get("sha256") == digest and _dest_size(dest) == st.st_size:
+                        result.files_skipped += 1
+                        result.bytes_skipped += st.st_size
+                    else:
+                        job.report(f"Syncing {done}/{len(pending)}: {rel}")
+                        os.makedirs(os.path.dirname(dest), exist_ok=True)
+                        # A known, different hash means the drive copy is stale even if size and
+                        # mtime look equal within FAT's two-second resolution.
+                        copied = copy_file(
+                            src, dest, job, chunk_size=chunk_size, skip_unchanged="sha256" not in previous
+                        )
+                        if copied.skipped:
+                            result.files_skipped += 1
+                            result.bytes_skipped += st.st_size
+                        else:
+                            result.files_written += 1
+                            result.bytes_written += copied.bytes_copied
+                            written.append((src, dest, rel))
+                    manifest[rel] = entry
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        with job.span("delete") as record:
+            for rel in sorted(set(old) - set(source)):
+                job.check_cancelled()
+                path = os.path.join(drive, *rel.split("/"))
+                manifest.pop(rel)
+                # A folder on the stick may be a link out of it; only delete what resolves inside.
+                if not _inside(drive, path):
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                result.files_deleted += 1
+                _remove_empty_dirs(drive, rel)
+            record["files"] = result.files_deleted
+
+        if verify and written:
+            job.report(f"Verifying {len(written)} file{'s' if len(written) != 1 else ''}...")
+            try:
+                mismatched = set(verify_copies(job, drive, [(src, dest) for src, dest, _rel in written], hashes))
+            except OSError as exc:
+                raise SyncError(f"Could not read back {drive}: {exc}") from exc
+            if mismatched:
+                for _src, dest, rel in written:
+                    if dest in mismatched:
+                        manifest.pop(rel, None)
+                raise VerifyError(drive, [dest for _src, dest, _rel in written if dest in mismatched])
+        completed = True
+    finally:
+        result.seconds = time.monotonic() - started
+        if manifest != old or not os.path.exists(manifest_path(drive)):
+            try:
+                with job.span("manifest"):
+                    save_manifest(drive, manifest)
+            except OSError as exc:
+                # When the sync already failed, that error is the one worth reporting.
+                if completed:
+                    raise SyncError(f"Could not write the manifest: {exc}") from exc
+    return result
+
+
+def _dest_size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return -1
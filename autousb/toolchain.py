@@ -0,0 +1,193 @@
+"""Finding the MinGW-w64 compiler once, and a precompiled header for its per-script builds.
+
+Resolving the compiler walks PATH, and its version (part of every build cache key) costs a
+subprocess. A discovered compiler is now remembered per PATH and trusted for as long as the
+binary's real path, size and mtime stay the same; util.tool_version keeps versions on disk,
+so a fresh process does not ask again either. A compiler that is not found is looked for
+again on the next call, so an install shows up at once.
+
+The mingw backend compiles every script as C++ whose own code is a few dozen lines but whose
+headers (<windows.h>, <string>, <fstream>) run to tens of thousands, and parsing them is most
+of the compile. They are precompiled once into a GCC .gch; every build then -includes it and
+only the script-specific code is parsed. The .gch is keyed by the compiler's identity and
+version and by the flags, so an upgraded or replaced compiler gets a new one. A compiler that
+cannot build it (or a .gch it later rejects) just parses the headers as before; the failure is
+remembered for PCH_RETRY_S, or until the toolchains are forgotten or the build cache cleared.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+from .util import cache_dir, tool_version
+
+MINGW_COMPILERS = ("x86_64-w64-mingw32-g++", "i686-w64-mingw32-g++")
+# Bump when PCH_SOURCE changes so every toolchain precompiles again.
+PCH_VERSION = 1
+PCH_NAME = "autousb-mingw.h"
+PCH_SOURCE = "#include <windows.h>\n#include <string>\n#include <fstream>\n"
+# Flags that change what the headers expand to; builds using the .gch must pass the same ones.
+PCH_FLAGS = ["-Os"]
+PCH_FAILED = "failed.txt"
+# How long a failed precompile is trusted before the next build tries again.
+PCH_RETRY_S = 24 * 60 * 60
+
+_lock = threading.Lock()
+_toolchains = {}
+_found = {}
+
+
+class Toolchain:
+    """A compiler binary as discovered: its path, version and what identifies that exact binary."""
+
+    def __init__(self, path, identity):
+        self.path = path
+        self.identity = identity
+        self.version = tool_version(path)
+
+    def __repr__(self):
+        return f"Toolchain({self.path!r}, {self.version!r})"
+
+
+def _identity(path):
+    """(real path, size, mtime), which changes when the binary is upgraded or the symlink retargeted."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return os.path.realpath(path), st.st_size, st.st_mtime_ns
+
+
+def toolchain_for(path):
+    """Returns the Toolchain for a compiler path, reusing what is known while the binary is unchanged."""
+    identity = _identity(path)
+    with _lock:
+        known = _toolchains.get(path)
+    if known is not None and known.identity == identity:
+        return known
+    toolchain = Toolchain(path, identity)
+    with _lock:
+        _toolchains[path] = toolchain
+    return toolchain
+
+
+def find_toolchain(names=MINGW_COMPILERS):
+    """Returns the Toolchain for the first of names on PATH, or None when none is installed."""
+    memo_key = (names, os.environ.get("PATH", ""))
+    with _lock:
+        path = _found.get(memo_key)
+    if path is None or _identity(path) is None:
+        path = next(filter(None, map(shutil.which, names)), None)
+        if path is None:
+            return None
+        with _lock:
+            _found[memo_key] = path
+    return toolchain_for(path)
+
+
+def forget_toolchains():
+    """Drops everything discovered so far, e.g. after installing or removing a compiler."""
+    with _lock:
+        _toolchains.clear()
+        _found.clear()
+    forget_pch_failures()
+
+
+def forget_pch_failures():
+    """Removes every failed-precompile marker so the next build tries again. Returns how many."""
+    try:
+        folders = os.listdir(pch_root())
+    except OSError:
+        return 0
+    removed = 0
+    for name in folders:
+        try:
+            os.remove(os.path.join(pch_root(), name, PCH_FAILED))
+        except OSError:
+            continue
+        removed += 1
+    return removed
+
+
+def pch_root():
+    return os.path.join(cache_dir(), "pch")
+
+
+def pch_key(toolchain):
+    """Identifies the precompiled header one compiler binary, version and flag set produce."""
+    digest = hashlib.sha256()
+    real_path, size, mtime_ns = toolchain.identity or (toolchain.path, 0, 0)
+    parts = (str(PCH_VERSION), real_path, str(size), str(mtime_ns), toolchain.version, "\0".join(PCH_FLAGS))
+    for part in (*parts, PCH_SOURCE):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+def _compiler_tag(toolchain):
+    return hashlib.sha256(toolchain.path.encode("utf-8")).hexdigest()[:12]
+
+
+def ensure_pch(job, toolchain):
+    """Returns the header to -include for builds with toolchain, precompiling it on first use.
+
+    Returns None when precompiled headers are off (AUTOUSB_MINGW_PCH=0) or the compiler could
+    not produce one; the build then compiles the full headers itself.
+    """
+    if os.getenv("AUTOUSB_MINGW_PCH") == "0":
+        return None
+    folder = os.path.join(pch_root(), f"{_compiler_tag(toolchain)}-{pch_key(toolchain)}")
+    header = os.path.join(folder, PCH_NAME)
+    if os.path.isfile(f"{header}.gch"):
+        return header
+    if _failed_recently(os.path.join(folder, PCH_FAILED)):
+        return None
+    job.report("Precompiling Windows headers (one time per toolchain)...")
+    os.makedirs(folder, exist_ok=True)
+    # Concurrent builds may race to publish the same files; each rename leaves a whole one.
+    suffix = f"{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(f"{header}.{suffix}", "w", encoding="utf-8") as fh:
+        fh.write(PCH_SOURCE)
+    os.replace(f"{header}.{suffix}", header)
+    tmp_gch = f"{header}.gch.{suffix}"
+    try:
+        with job.span("pch compile"):
+            cmd = [toolchain.path, *PCH_FLAGS, "-x", "c++-header", header, "-o", tmp_gch]
+            returncode, output = job.run_process(cmd)
+        if returncode != 0 or not os.path.isfile(tmp_gch):
+            # run_process raises when the job was cancelled; a compiler killed by a signal
+            # says nothing about whether it can build the header, so only errors are kept.
+            if returncode >= 0:
+                with open(os.path.join(folder, PCH_FAILED), "w", encoding="utf-8") as fh:
+                    fh.write(output)
+            return None
+        os.replace(tmp_gch, f"{header}.gch")
+    finally:
+        try:
+            os.remove(tmp_gch)
+        except OSError:
+            pass
+    _prune_stale(folder)
+    return header
+
+
+def _failed_recently(marker):
+    try:
+        age = time.time() - os.path.getmtime(marker)
+    except OSError:
+        return False
+    return 0 <= age < PCH_RETRY_S
+
+
+def _prune_stale(current):
+    """Removes headers an earlier build of the same compiler left; a .gch runs to tens of MB."""
+    prefix = os.path.basename(current).split("-", 1)[0] + "-"
+    try:
+        entries = os.listdir(os.path.dirname(current))
+    except OSError:
+        return
+    for name in entries:
+        path = os.path.join(os.path.dirname(current), name)
+        if name.startswith(prefix) and path != current:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,96 @@
+"""Small helpers shared across the core modules."""
+import json
+import os
+import subprocess
+import threading
+
+_tool_versions = None
+_tool_versions_lock = threading.Lock()
+
+
+def cache_dir():
+    """Returns the per-user cache directory used for build artifacts."""
+    override = os.getenv("AUTOUSB_CACHE_DIR")
+    if override:
+        return override
+    if os.name == "nt":
+        base = os.getenv("LOCALAPPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "AutoUSB", "cache")
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "autousb")
+
+
+def _tool_versions_path():
+    return os.path.join(cache_dir(), "tool-versions.json")
+
+
+def _load_tool_versions():
+    try:
+        with open(_tool_versions_path(), encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _save_tool_versions(versions):
+    path = _tool_versions_path()
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(versions, fh)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def tool_version(path):
+    """Returns the first line of `path --version`, memoized per binary and kept on disk.
+
+    The key is the binary's real path, size and mtime, so a new process skips the subprocess
+    while an upgraded or swapped-in binary is asked again.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+    key = f"{os.path.realpath(path)}\0{st.st_size}\0{st.st_mtime_ns}" if st else f"{path}\0missing"
+    global _tool_versions
+    with _tool_versions_lock:
+        if _tool_versions is None:
+            _tool_versions = _load_tool_versions()
+        if key in _tool_versions:
+            return _tool_versions[key]
+    try:
+        result = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=30)
+        lines = (result.stdout or result.stderr).strip().splitlines()
+        version = lines[0] if lines else ""
+    except (OSError, subprocess.SubprocessError):
+        version = ""
+    with _tool_versions_lock:
+        prefix = key.split("\0", 1)[0] + "\0"
+        # Entries for earlier builds of the same binary will never match again.
+        for old in [old for old in _tool_versions if old.startswith(prefix)]:
+            del _tool_versions[old]
+        _tool_versions[key] = version
+        if st and version:
+            _save_tool_versions({name: value for name, value in _tool_versions.items() if "\0missing" not in name})
+    return version
+
+
+def format_bytes(size):
+    """Formats a byte count (or rate) for status lines."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def parse_size(text):
+    """Parses "512", "64K", "1.5G" and the like into bytes."""
+    units = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+    text = text.strip().upper().rstrip("B")
+    if text[-1:] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
@@ -0,0 +1,124 @@
+"""Read-back verification: after a copy, hash what is actually on the drive.
+
+A plain re-read after writing would be served from the page cache and prove nothing, so
+each file is flushed with fsync first and then read with O_DIRECT where the filesystem
+allows it. Where it does not, the cached pages are dropped with posix_fadvise(DONTNEED)
+before reading. Source hashes come from a SourceHashes memo, so each source file is hashed
+once however many drives are verified against it.
+"""
+import errno
+import hashlib
+import io
+import mmap
+import os
+
+from .copier import SourceHashes
+
+VERIFY_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class VerifyError(Exception):
+    """Raised when bytes read back from a drive differ from the source."""
+
+    def __init__(self, drive, mismatched):
+        self.drive = drive
+        self.mismatched = mismatched
+        names = ", ".join(os.path.basename(path) for path in mismatched[:3])
+        more = f" and {len(mismatched) - 3} more" if len(mismatched) > 3 else ""
+        super().__init__(f"Verification failed on {drive}: {names}{more} read back differently from the source.")
+
+
+def flush(path):
+    """Forces path's data to the device.
+
+    POSIX fsyncs a read-only descriptor, so a copy that kept a read-only source's mode can
+    still be flushed. Windows' FlushFileBuffers needs write access.
+    """
+    mode = os.O_RDWR | os.O_BINARY if os.name == "nt" else os.O_RDONLY
+    fd = os.open(path, mode)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _drop_cache(fd):
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def _hash_fd(fd, digest, buf, job):
+    with io.FileIO(fd, "rb", closefd=False) as fh:
+        while True:
+            if job is not None:
+                job.check_cancelled()
+            count = fh.readinto(buf)
+            if not count:
+                return
+            digest.update(memoryview(buf)[:count])
+
+
+def read_back_sha256(path, job=None, chunk_size=VERIFY_CHUNK_SIZE):
+    """Returns the SHA-256 of path as stored on the device rather than in the page cache."""
+    # An anonymous mapping is page aligned, as O_DIRECT requires.
+    buf = mmap.mmap(-1, chunk_size)
+    try:
+        direct = getattr(os, "O_DIRECT", 0)
+        if direct:
+            try:
+                fd = os.open(path, os.O_RDONLY | direct)
+            except OSError as exc:
+                if exc.errno != errno.EINVAL:
+                    raise
+            else:
+                try:
+                    digest = hashlib.sha256()
+                    _hash_fd(fd, digest, buf, job)
+                    return digest.hexdigest()
+                except OSError as exc:
+                    # Some filesystems accept O_DIRECT at open and reject it on read.
+                    if exc.errno != errno.EINVAL:
+                        raise
+                finally:
+                    os.close(fd)
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            _drop_cache(fd)
+            digest = hashlib.sha256()
+            _hash_fd(fd, digest, buf, job)
+            return digest.hexdigest()
+        finally:
+            os.close(fd)
+    finally:
+        buf.close()
+
+
+def verify_copies(job, drive, pairs, hashes=None):
+    """Checks each (source path, copy on drive) pair. Returns the copies that differ.
+
+    A source may also be given as bytes, for files such as autorun.inf that were generated.
+    """
+    hashes = hashes or SourceHashes()
+    expected = {}
+    for source, dest in pairs:
+        if isinstance(source, bytes):
+            expected[dest] = hashlib.sha256(source).hexdigest()
+        else:
+            st = os.stat(source)
+            expected[dest] = hashes.get(source, st.st_size, st.st_mtime_ns)
+    mismatched = []
+    verified = 0
+    with job.span("verify", drive=drive) as record:
+        for dest, digest in expected.items():
+            job.check_cancelled()
+            try:
+                flush(dest)
+                actual = read_back_sha256(dest, job)
+            except FileNotFoundError:
+                actual = None
+            if actual == digest:
+                verified += os.path.getsize(dest)
+            else:
+                mismatched.append(dest)
+        record.update(bytes=verified, mismatched=len(mismatched))
+    return mismatched
@@ -0,0 +1,181 @@
+"""Warm PyInstaller builds: a persistent work directory and a runner that never changes.
+
+The cold backend writes the script into runner.py and runs PyInstaller with --clean, so
+every build repeats the full dependency analysis. Here runner.py is fixed and reads the
+script from a data file bundled with --add-data. Only that file changes between builds,
+so PyInstaller keeps its analysis cache and just re-packages.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from .build import BuildError, encode_batch
+from .util import cache_dir, tool_version
+
+# Bump when RUNNER_SOURCE or the PyInstaller arguments change.
+WARM_VERSION = 1
+WARM_FLAGS = ["--onefile", "--noconsole", "--noconfirm"]
+EXE_NAME = "autorun_runner"
+SCRIPT_NAME = "script.bat"
+
+RUNNER_SOURCE = """import os, subprocess, sys, tempfile
+
+
+def main():
+    base = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(base, 'script.bat'), 'rb') as fh:
+        content = fh.read()
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.bat') as fh:
+        fh.write(content)
+        script_path = fh.name
+    try:
+        creation_flags = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+        subprocess.run(['cmd', '/c', script_path], check=False, creationflags=creation_flags)
+    finally:
+        try:
+            os.remove(script_path)
+        except OSError:
+            pass
+
+
+if __name__ == '__main__':
+    main()
+"""
+
+
+def warm_root(pyinstaller):
+    digest = hashlib.sha256()
+    for part in (str(WARM_VERSION), pyinstaller, tool_version(pyinstaller)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return os.path.join(cache_dir(), "pyinstaller-warm", digest.hexdigest()[:16])
+
+
+class _SlotLock:
+    """Cross-process lock on one warm work directory; concurrent builds use separate slots."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = None
+
+    def acquire(self, blocking):
+        fh = open(self.path, "a+b")
+        try:
+            if os.name == "nt":
+                import msvcrt
+
+                fh.seek(0)
+                mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+                msvcrt.locking(fh.fileno(), mode, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            fh.close()
+            if blocking:
+                raise
+            return False
+        self._fh = fh
+        return True
+
+    def release(self):
+        if self._fh is None:
+            return
+        if os.name == "nt":
+            import msvcrt
+
+            self._fh.seek(0)
+            msvcrt.locking(self._fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        self._fh.close()
+        self._fh = None
+
+
+def _acquire_slot(root):
+    """Locks the first free slot directory under root, or waits for slot 0 if all are busy."""
+    os.makedirs(root, exist_ok=True)
+    slots = max(1, os.cpu_count() or 1)
+    for index in range(slots):
+        lock = _SlotLock(os.path.join(root, f"slot{index}.lock"))
+        if lock.acquire(blocking=False):
+            return os.path.join(root, f"slot{index}"), lock
+    lock = _SlotLock(os.path.join(root, "slot0.lock"))
+    lock.acquire(blocking=True)
+    return os.path.join(root, "slot0"), lock
+
+
+def _load_timings(slot):
+    try:
+        with open(os.path.join(slot, "timings.json"), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_timings(slot, timings):
+    try:
+        with open(os.path.join(slot, "timings.json"), "w", encoding="utf-8") as fh:
+            json.dump(timings, fh)
+    except OSError:
+        pass
+
+
+def build_warm(job, pyinstaller, content, save_path):
+    """Builds save_path in a persistent slot directory. Returns a note about the time saved."""
+    slot, lock = _acquire_slot(warm_root(pyinstaller))
+    try:
+        os.makedirs(slot, exist_ok=True)
+        runner_path = os.path.join(slot, "runner.py")
+        cold = not os.path.isdir(os.path.join(slot, "work"))
+        # Rewriting an unchanged runner would bump its mtime and invalidate the analysis.
+        try:
+            with open(runner_path, encoding="utf-8") as fh:
+                runner_current = fh.read() == RUNNER_SOURCE
+        except OSError:
+            runner_current = False
+        if not runner_current:
+            with open(runner_path, "w", encoding="utf-8") as fh:
+                fh.write(RUNNER_SOURCE)
+        with open(os.path.join(slot, SCRIPT_NAME), "wb") as fh:
+            fh.write(encode_batch(content))
+
+        cmd = [
+            pyinstaller,
+            *WARM_FLAGS,
+            "--workpath",
+            os.path.join(slot, "work"),
+            "--distpath",
+            os.path.join(slot, "dist"),
+            "--specpath",
+            slot,
+            "--add-data",
+            f"{os.path.join(slot, SCRIPT_NAME)}{os.pathsep}.",
+            "--name",
+            EXE_NAME,
+            runner_path,
+        ]
+        started = time.monotonic()
+        returncode, output = job.run_process(cmd, cwd=slot)
+        elapsed = time.monotonic() - started
+        if returncode != 0:
+            raise BuildError(output)
+        built_path = os.path.join(slot, "dist", f"{EXE_NAME}.exe")
+        if not os.path.exists(built_path):
+            raise BuildError("Expected build artifact not found after PyInstaller run.")
+        shutil.copy2(built_path, save_path)
+
+        timings = _load_timings(slot)
+        if cold or "cold" not in timings:
+            timings["cold"] = elapsed
+            _save_timings(slot, timings)
+            return f"cold build {elapsed:.1f} s; later builds reuse the analysis"
+        saved = timings["cold"] - elapsed
+        return f"warm build {elapsed:.1f} s, saved {saved:.1f} s vs cold"
+    finally:
+        lock.release()
@@ -0,0 +1,63 @@
+"""Measures the cost of one drive refresh against a synthetic mount table and sysfs tree.
+
+Run from the repository root: python benchmarks/bench_drive_scan.py [--mounts N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autousb.drives import scan_drives  # noqa: E402
+
+
+def build_fake_system(root, mounts, user="bench"):
+    """Writes a mountinfo file with `mounts` USB mounts plus system noise, and a matching sysfs tree."""
+    sysfs = os.path.join(root, "sys")
+    lines = [
+        "22 1 259:2 / / rw,relatime shared:1 - ext4 /dev/nvme0n1p2 rw",
+        "23 22 0:21 / /proc rw,nosuid shared:5 - proc proc rw",
+        "24 22 0:22 / /sys rw,nosuid shared:6 - sysfs sysfs rw",
+    ]
+    for i in range(mounts):
+        disk = f"sd{i}"
+        major, minor = 8, i * 16 + 1
+        disk_dir = os.path.join(sysfs, "devices", "usb", "block", disk)
+        part_dir = os.path.join(disk_dir, f"{disk}1")
+        os.makedirs(part_dir)
+        with open(os.path.join(disk_dir, "removable"), "w") as fh:
+            fh.write("1\n")
+        with open(os.path.join(part_dir, "partition"), "w") as fh:
+            fh.write("1\n")
+        with open(os.path.join(part_dir, "size"), "w") as fh:
+            fh.write(f"{31260672 + i}\n")
+        os.makedirs(os.path.join(sysfs, "dev", "block"), exist_ok=True)
+        os.symlink(part_dir, os.path.join(sysfs, "dev", "block", f"{major}:{minor}"))
+        lines.append(
+            f"{100 + i} 22 {major}:{minor} / /media/{user}/USB\\040{i} rw,nosuid,nodev shared:{200 + i} - vfat /dev/{disk}1 rw"
+        )
+    return "\n".join(lines) + "\n", sysfs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mounts", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        text, sysfs = build_fake_system(root, args.mounts)
+        drives = scan_drives(text, sysfs_root=sysfs, user="bench")
+        assert len(drives) == args.mounts, len(drives)
+        assert all(d.removable and d.fstype == "vfat" and d.size for d in drives)
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            scan_drives(text, sysfs_root=sysfs, user="bench")
+        per_refresh = (time.perf_counter() - started) / args.repeat
+    print(f"{args.mounts} mounts: {per_refresh * 1000:.2f} ms per refresh ({per_refresh * 1e6 / args.mounts:.1f} us per mount)")
+
+
+if __name__ == "__main__":
+    main()
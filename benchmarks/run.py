@@ -0,0 +1,404 @@
+"""Headless benchmark suite for provisioning and build latency. Emits JSON for run-to-run comparison.
+
+Run from the repository root:
+
+    python benchmarks/run.py --output bench.json
+    python benchmarks/run.py --only copy --max-copy-size 2G --drive-dir /mnt/loopdrive
+
+Everything runs against local stand-ins: a synthetic mountinfo/sysfs tree, a tmpfs (or any
+directory) as the "drive", and fake compiler/PyInstaller executables on PATH. The pch group
+is the exception: precompiled headers only pay off with a real MinGW-w64, so it is skipped
+without one.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import textwrap
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autousb.build import LAUNCHER_BACKENDS, build_exe, find_mingw, next_available_path  # noqa: E402
+from autousb.cache import BuildCache  # noqa: E402
+from autousb.copier import copy_file  # noqa: E402
+from autousb.drives import scan_drives  # noqa: E402
+from autousb.fatimage import FatImageBuilder, write_image  # noqa: E402
+from autousb.jobs import Job  # noqa: E402
+from autousb.provision import autorun_content, write_autorun  # noqa: E402
+from autousb.sync import sync_folder  # noqa: E402
+from autousb.util import parse_size  # noqa: E402
+from bench_drive_scan import build_fake_system  # noqa: E402
+
+MB = 1024 * 1024
+COPY_SIZES = [1 * MB, 16 * MB, 128 * MB, 512 * MB, 2048 * MB]
+SYNC_FILES = 32
+IMAGE_TARGETS = [1, 4]
+
+
+def timed(func, repeat):
+    """Runs func repeat times and returns per-run seconds (best, median)."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return min(samples), statistics.median(samples)
+
+
+def result(name, params, best, median, **extra):
+    entry = {"name": name, "params": params, "best_s": best, "median_s": median}
+    entry.update(extra)
+    return entry
+
+
+def bench_drive_scan(args, workdir):
+    results = []
+    for mounts in (10, 100, args.mounts):
+        root = tempfile.mkdtemp(dir=workdir)
+        text, sysfs = build_fake_system(root, mounts)
+        found = scan_drives(text, sysfs_root=sysfs, user="bench")
+        assert len(found) == mounts
+        best, median = timed(lambda: scan_drives(text, sysfs_root=sysfs, user="bench"), args.repeat)
+        results.append(result("drive_scan", {"mounts": mounts}, best, median, per_mount_us=median * 1e6 / mounts))
+    return results
+
+
+def bench_autorun(args, workdir):
+    drive = tempfile.mkdtemp(dir=workdir)
+    best, median = timed(lambda: autorun_content("PROVISIONED", "installer_with_a_long_name.exe"), args.repeat * 100)
+    results = [result("autorun_content", {}, best, median)]
+
+    counter = [0]
+
+    def fresh_write():
+        counter[0] += 1
+        write_autorun(drive, autorun_content(f"LABEL{counter[0]}", "tool.exe"))
+
+    best, median = timed(fresh_write, args.repeat)
+    results.append(result("autorun_write", {"unchanged": False}, best, median))
+    content = autorun_content("LABEL", "tool.exe")
+    write_autorun(drive, content)
+    best, median = timed(lambda: write_autorun(drive, content), args.repeat)
+    results.append(result("autorun_write", {"unchanged": True}, best, median))
+    return results
+
+
+def _drive_dir(args, workdir):
+    if args.drive_dir:
+        return tempfile.mkdtemp(dir=args.drive_dir)
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return tempfile.mkdtemp(dir="/dev/shm")
+    return tempfile.mkdtemp(dir=workdir)
+
+
+def bench_copy(args, workdir):
+    results = []
+    drive = _drive_dir(args, workdir)
+    try:
+        for size in [s for s in COPY_SIZES if s <= args.max_copy_size]:
+            src = os.path.join(workdir, f"payload_{size}.bin")
+            with open(src, "wb") as fh:
+                block = os.urandom(MB)
+                for _ in range(size // MB):
+                    fh.write(block)
+            dst = os.path.join(drive, "payload.bin")
+            samples = []
+            method = ""
+            for _ in range(max(1, args.repeat // 10)):
+                if os.path.exists(dst):
+                    os.remove(dst)
+                copied = copy_file(src, dst)
+                samples.append(copied.seconds)
+                method = copied.method
+            median = statistics.median(samples)
+            results.append(
+                result("copy", {"bytes": size}, min(samples), median, method=method, mb_per_s=size / MB / median)
+            )
+            best, median = timed(lambda: copy_file(src, dst), args.repeat)
+            results.append(result("copy_unchanged", {"bytes": size}, best, median))
+            os.remove(dst)
+            os.remove(src)
+    finally:
+        for name in os.listdir(drive):
+            os.remove(os.path.join(drive, name))
+        os.rmdir(drive)
+    return results
+
+
+def bench_sync(args, workdir):
+    """Payload folder sync: first copy, re-sync with nothing changed, re-sync after one file changed."""
+    drive = _drive_dir(args, workdir)
+    payload = os.path.join(workdir, "payload")
+    size = args.max_copy_size
+    try:
+        block = os.urandom(MB)
+        for index in range(SYNC_FILES):
+            folder = os.path.join(payload, f"dir{index % 4}")
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, f"file{index}.bin"), "wb") as fh:
+                for _ in range(max(1, size // SYNC_FILES // MB)):
+                    fh.write(block)
+        job = Job()
+        first = sync_folder(job, payload, drive)
+        params = {"bytes": first.bytes_written, "files": SYNC_FILES}
+        results = [result("sync_initial", params, first.seconds, first.seconds, mb_per_s=first.bytes_written / MB / first.seconds)]
+        best, median = timed(lambda: sync_folder(job, payload, drive), args.repeat)
+        results.append(result("sync_unchanged", params, best, median))
+
+        changed = os.path.join(payload, "dir0", "file0.bin")
+        samples = []
+        for round_ in range(max(1, args.repeat // 10)):
+            with open(changed, "r+b") as fh:
+                fh.write(round_.to_bytes(4, "little") + os.urandom(4))
+            samples.append(sync_folder(job, payload, drive).seconds)
+        results.append(result("sync_one_changed", params, min(samples), statistics.median(samples)))
+        return results
+    finally:
+        shutil.rmtree(payload, ignore_errors=True)
+        shutil.rmtree(drive, ignore_errors=True)
+
+
+def bench_image(args, workdir):
+    """FAT32 image mode: build once, then write to 1..N loop files, against a raw sequential write."""
+    drive = _drive_dir(args, workdir)
+    size = args.max_copy_size
+    payload = os.path.join(workdir, "image_payload.bin")
+    try:
+        block = os.urandom(MB)
+        with open(payload, "wb") as fh:
+            for _ in range(size // MB):
+                fh.write(block)
+        raw = os.path.join(drive, "raw.bin")
+        started = time.perf_counter()
+        with open(payload, "rb") as src, open(raw, "wb") as dst:
+            shutil.copyfileobj(src, dst, 4 * MB)
+            os.fsync(dst.fileno())
+        raw_seconds = time.perf_counter() - started
+        os.remove(raw)
+        results = [result("raw_write", {"bytes": size}, raw_seconds, raw_seconds, mb_per_s=size / MB / raw_seconds)]
+
+        builder = FatImageBuilder("BENCH")
+        builder.add_file("payload.bin", payload)
+        builder.add_bytes("autorun.inf", autorun_content("BENCH", "payload.bin").encode("utf-8"))
+        started = time.perf_counter()
+        image = builder.build(os.path.join(workdir, "bench.img"))
+        build_seconds = time.perf_counter() - started
+        results.append(result("image_build", {"bytes": image.used_bytes}, build_seconds, build_seconds))
+
+        for count in IMAGE_TARGETS:
+            targets = [os.path.join(drive, f"target{index}.img") for index in range(count)]
+            started = time.perf_counter()
+            written = write_image(Job(), image, targets)
+            seconds = time.perf_counter() - started
+            total = sum(r.bytes_written for r in written)
+            results.append(
+                result("image_write", {"targets": count, "bytes": image.used_bytes}, seconds, seconds, mb_per_s=total / MB / seconds)
+            )
+            for target in targets:
+                os.remove(target)
+        os.remove(image.path)
+        return results
+    finally:
+        os.remove(payload)
+        shutil.rmtree(drive, ignore_errors=True)
+
+
+def bench_next_path(args, workdir):
+    results = []
+    for existing in (10, 1000, args.existing):
+        folder = tempfile.mkdtemp(dir=workdir)
+        open(os.path.join(folder, "autorun_built.exe"), "wb").close()
+        for i in range(1, existing):
+            open(os.path.join(folder, f"autorun_built_{i}.exe"), "wb").close()
+        best, median = timed(lambda: next_available_path(folder, "autorun_built.exe"), args.repeat)
+        results.append(result("next_available_path", {"existing": existing}, best, median))
+    return results
+
+
+FAKE_COMPILER = """\
+#!{python}
+import sys, time
+args = sys.argv[1:]
+if args == ["--version"]:
+    print("fake-mingw 1.0")
+    sys.exit(0)
+time.sleep({delay})
+with open(args[args.index("-o") + 1], "wb") as fh:
+    fh.write(b"MZ" + b"\\0" * 40000)
+"""
+
+FAKE_PYINSTALLER = """\
+#!{python}
+import os, sys, time
+args = sys.argv[1:]
+if args == ["--version"]:
+    print("6.6.0")
+    sys.exit(0)
+def opt(name):
+    return args[args.index(name) + 1] if name in args else None
+work = opt("--workpath")
+warm = work and os.path.isdir(work) and "--clean" not in args
+time.sleep({delay} / 5 if warm else {delay})
+if work:
+    os.makedirs(work, exist_ok=True)
+dist = opt("--distpath")
+os.makedirs(dist, exist_ok=True)
+with open(os.path.join(dist, opt("--name") + ".exe"), "wb") as fh:
+    fh.write(b"MZ" + b"\\0" * 400000)
+"""
+
+
+def _install_fake_tools(bindir, delay):
+    for name, template in (("x86_64-w64-mingw32-g++", FAKE_COMPILER), ("pyinstaller", FAKE_PYINSTALLER)):
+        path = os.path.join(bindir, name)
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(template.format(python=sys.executable, delay=delay))
+        os.chmod(path, 0o755)
+    return os.path.join(bindir, "x86_64-w64-mingw32-g++"), os.path.join(bindir, "pyinstaller")
+
+
+def bench_build(args, workdir):
+    if os.name == "nt":
+        return []
+    bindir = tempfile.mkdtemp(dir=workdir)
+    compiler, pyinstaller = _install_fake_tools(bindir, args.compile_delay)
+    old_cache = os.environ.get("AUTOUSB_CACHE_DIR")
+    os.environ["AUTOUSB_CACHE_DIR"] = tempfile.mkdtemp(dir=workdir)
+    out_dir = tempfile.mkdtemp(dir=workdir)
+    results = []
+    try:
+        cache = BuildCache()
+        job = Job(name="bench")
+        counter = [0]
+
+        def build(backend, tool, unique):
+            counter[0] += 1
+            content = textwrap.dedent(
+                f"""\
+                @echo off
+                echo build {counter[0] if unique else 0}
+                """
+            )
+            save_path = next_available_path(out_dir, "autorun_built.exe")
+            return build_exe(job, backend, tool, content, save_path, cache)
+
+        backends = (
+            ("mingw", compiler),
+            ("stub", compiler),
+            ("tiny", compiler),
+            ("tiny-lz", compiler),
+            ("pyinstaller-warm", pyinstaller),
+        )
+        for backend, tool in backends:
+            started = time.perf_counter()
+            size = build(backend, tool, unique=True).size
+            first = time.perf_counter() - started
+            best, median = timed(lambda: build(backend, tool, unique=True), args.repeat // 5 or 1)
+            results.append(
+                result("build", {"backend": backend, "content": "unique"}, best, median, first_s=first, exe_bytes=size)
+            )
+            if backend not in LAUNCHER_BACKENDS:
+                build(backend, tool, unique=False)  # prime the build cache
+                best, median = timed(lambda: build(backend, tool, unique=False), args.repeat // 5 or 1)
+                results.append(result("build", {"backend": backend, "content": "repeated"}, best, median))
+    finally:
+        if old_cache is None:
+            os.environ.pop("AUTOUSB_CACHE_DIR", None)
+        else:
+            os.environ["AUTOUSB_CACHE_DIR"] = old_cache
+    return results
+
+
+def bench_pch(args, workdir):
+    """Per-script mingw builds with and without the precompiled header. Needs a real MinGW-w64."""
+    compiler = args.mingw or find_mingw()
+    if not compiler:
+        print("  skipped: no MinGW-w64 on PATH (or pass --mingw)", file=sys.stderr)
+        return []
+    old_cache = os.environ.get("AUTOUSB_CACHE_DIR")
+    old_pch = os.environ.get("AUTOUSB_MINGW_PCH")
+    os.environ["AUTOUSB_CACHE_DIR"] = tempfile.mkdtemp(dir=workdir)
+    save_path = os.path.join(tempfile.mkdtemp(dir=workdir), "autorun_built.exe")
+    results = []
+    try:
+        cache = BuildCache()
+        job = Job(name="bench")
+        counter = [0]
+
+        def build():
+            # Every script differs, so the build cache never answers and each run compiles.
+            counter[0] += 1
+            build_exe(job, "mingw", compiler, f"@echo off\necho build {counter[0]}\n", save_path, cache)
+
+        for pch in ("0", "1"):
+            os.environ["AUTOUSB_MINGW_PCH"] = pch
+            started = time.perf_counter()
+            build()
+            first = time.perf_counter() - started
+            best, median = timed(build, args.repeat // 5 or 1)
+            params = {"backend": "mingw", "content": "unique", "pch": pch == "1"}
+            results.append(result("build", params, best, median, first_s=first))
+    finally:
+        for name, value in (("AUTOUSB_CACHE_DIR", old_cache), ("AUTOUSB_MINGW_PCH", old_pch)):
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return results
+
+
+BENCHMARKS = {
+    "drives": bench_drive_scan,
+    "autorun": bench_autorun,
+    "copy": bench_copy,
+    "sync": bench_sync,
+    "image": bench_image,
+    "next_path": bench_next_path,
+    "build": bench_build,
+    "pch": bench_pch,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS), help="run only these groups")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--mounts", type=int, default=500, help="largest fake mount table")
+    parser.add_argument("--existing", type=int, default=5000, help="most autorun_built_N.exe files to pre-create")
+    parser.add_argument("--max-copy-size", type=parse_size, default=parse_size("128M"), help="largest copy payload, e.g. 2G")
+    parser.add_argument("--drive-dir", help="directory standing in for the USB drive (default: /dev/shm)")
+    parser.add_argument("--compile-delay", type=float, default=0.5, help="seconds the fake compiler takes")
+    parser.add_argument("--mingw", help="real MinGW-w64 g++ for the pch group (default: the one on PATH)")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "argv": sys.argv[1:],
+        },
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.only or list(BENCHMARKS):
+            print(f"running {name}...", file=sys.stderr, flush=True)
+            report["results"].extend(BENCHMARKS[name](args, workdir))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
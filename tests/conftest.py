@@ -0,0 +1,48 @@
+import os
+import sys
+import types
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Keeps build caches, journals and metrics.jsonl out of the real cache directory."""
+    cache = tmp_path / "cache"
+    monkeypatch.setenv("AUTOUSB_CACHE_DIR", str(cache))
+    return cache
+
+
+FAKE_COMPILER = """\
+#!{python}
+import os, sys, time
+args = sys.argv[1:]
+if args == ["--version"]:
+    print("fake-mingw 1.0")
+    sys.exit(0)
+mode = open({mode!r}).read().strip()
+if mode == "fail":
+    print("stub.cpp:1: error: expected ';'")
+    sys.exit(1)
+if mode == "slow":
+    time.sleep(30)
+with open(args[args.index("-o") + 1], "wb") as fh:
+    fh.write(b"MZ" + bytes(int(os.environ.get("FAKE_MINGW_SIZE", "4000"))))
+"""
+
+
+@pytest.fixture
+def fake_mingw(tmp_path, monkeypatch):
+    """Puts a stand-in x86_64-w64-mingw32-g++ first on PATH. Write "fail" or "slow" to its .mode file."""
+    if os.name == "nt":
+        pytest.skip("the fake compiler is a POSIX script")
+    bindir = tmp_path / "fakebin"
+    bindir.mkdir()
+    mode = bindir / "mode"
+    mode.write_text("ok")
+    compiler = bindir / "x86_64-w64-mingw32-g++"
+    compiler.write_text(FAKE_COMPILER.format(python=sys.executable, mode=str(mode)))
+    compiler.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bindir}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv("AUTOUSB_MINGW_PCH", "0")
+    return types.SimpleNamespace(path=str(compiler), mode=mode)
@@ -0,0 +1,71 @@
+import os
+import threading
+
+import pytest
+
+from autousb import cli
+from autousb.build import build_exe
+from autousb.cache import BuildCache
+from autousb.jobs import Job, JobCancelled
+
+
+def leftovers(folder):
+    return sorted(name for name in os.listdir(folder) if name.startswith(".autousb-build-"))
+
+
+def test_build_replaces_the_output_when_complete(tmp_path, fake_mingw):
+    out = tmp_path / "out" / "setup.exe"
+    out.parent.mkdir()
+    out.write_bytes(b"old")
+    result = build_exe(Job(), "mingw", fake_mingw.path, "echo hi", str(out), BuildCache(max_bytes=0))
+    assert result.path == str(out)
+    assert out.read_bytes().startswith(b"MZ")
+    assert result.size == out.stat().st_size
+    assert leftovers(out.parent) == []
+
+
+def test_failed_build_keeps_an_existing_output(tmp_path, fake_mingw):
+    fake_mingw.mode.write_text("fail")
+    out = tmp_path / "mine.exe"
+    out.write_bytes(b"the user's own program")
+    with pytest.raises(Exception, match="expected"):
+        build_exe(Job(), "mingw", fake_mingw.path, "echo hi", str(out), BuildCache(max_bytes=0))
+    assert out.read_bytes() == b"the user's own program"
+    assert leftovers(tmp_path) == []
+
+
+def test_cancelled_build_keeps_an_existing_output(tmp_path, fake_mingw):
+    fake_mingw.mode.write_text("slow")
+    out = tmp_path / "mine.exe"
+    out.write_bytes(b"keep")
+    job = Job()
+    threading.Timer(0.3, job.cancel).start()
+    with pytest.raises(JobCancelled):
+        build_exe(job, "mingw", fake_mingw.path, "echo hi", str(out), BuildCache(max_bytes=0))
+    assert out.read_bytes() == b"keep"
+    assert leftovers(tmp_path) == []
+
+
+def test_cache_hit_is_published_the_same_way(tmp_path, fake_mingw):
+    cache = BuildCache(str(tmp_path / "cache"))
+    first = build_exe(Job(), "mingw", fake_mingw.path, "echo hi", str(tmp_path / "a.exe"), cache)
+    fake_mingw.mode.write_text("fail")
+    second = build_exe(Job(), "mingw", fake_mingw.path, "echo hi", str(tmp_path / "b.exe"), cache)
+    assert not first.cached and second.cached
+    assert (tmp_path / "b.exe").read_bytes() == (tmp_path / "a.exe").read_bytes()
+    assert leftovers(tmp_path) == []
+
+
+def test_cli_failed_build_keeps_output_and_drops_its_placeholder(tmp_path, fake_mingw, monkeypatch, capsys):
+    fake_mingw.mode.write_text("fail")
+    monkeypatch.chdir(tmp_path)
+    script = tmp_path / "setup.bat"
+    script.write_text("echo hi\n")
+    mine = tmp_path / "mine.exe"
+    mine.write_bytes(b"mine")
+
+    assert cli.main(["-q", "build", "--backend", "mingw", "--script", str(script), "--output", str(mine)]) == 1
+    assert mine.read_bytes() == b"mine"
+    assert cli.main(["-q", "build", "--backend", "mingw", "--script", str(script)]) == 1
+    assert not (tmp_path / "autorun_built.exe").exists()
+    assert "expected" in capsys.readouterr().err
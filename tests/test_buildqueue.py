@@ -0,0 +1,54 @@
+import os
+
+from autousb.buildqueue import build_queue, output_name
+from autousb.cache import BuildCache
+from autousb.jobs import Job
+
+
+def run_queue(tmp_path, fake_mingw, scripts):
+    out = tmp_path / "out"
+    out.mkdir()
+    reports = []
+    job = Job(callbacks={"progress": reports.append})
+    items = build_queue(job, "mingw", fake_mingw.path, scripts, str(out), BuildCache(), max_workers=2)
+    return out, items, reports
+
+
+def test_output_names():
+    assert output_name("setup.bat") == "setup.exe"
+    assert output_name("dir/Install.CMD") == "Install.exe"
+    assert output_name("notes.txt") == "autorun_built.exe"
+    assert output_name(".bat") == "autorun_built.exe"
+
+
+def test_identical_scripts_build_once_and_followers_get_a_copy(tmp_path, fake_mingw):
+    scripts = [
+        ("a.bat", "@echo off\r\necho hi\r\n"),
+        ("b.bat", "@echo off\necho hi\n"),
+        ("c.cmd", "echo other"),
+        ("a.bat", "@echo off\necho hi"),
+    ]
+    out, items, reports = run_queue(tmp_path, fake_mingw, scripts)
+
+    assert [item.status for item in items] == ["done", "done", "done", "done"]
+    assert [os.path.basename(item.save_path) for item in items] == ["a.exe", "b.exe", "c.exe", "a_1.exe"]
+    assert items[1].same_as is items[0] and items[3].same_as is items[0]
+    assert items[2].same_as is None
+    assert [name for name, status, _ in reports if status == "building"] == ["a.bat", "c.cmd"]
+    assert items[1].result.note == "same as a.bat"
+    first = (out / "a.exe").read_bytes()
+    assert first.startswith(b"MZ")
+    assert (out / "b.exe").read_bytes() == first
+    assert (out / "a_1.exe").read_bytes() == first
+    assert items[1].result.size == len(first)
+
+
+def test_failed_build_fails_its_followers_and_drops_their_placeholders(tmp_path, fake_mingw):
+    fake_mingw.mode.write_text("fail")
+    out, items, _reports = run_queue(tmp_path, fake_mingw, [("a.bat", "echo hi"), ("b.bat", "echo hi")])
+
+    assert [item.status for item in items] == ["failed", "failed"]
+    assert not any(item.ok for item in items)
+    assert "expected ';'" in items[0].error
+    assert items[1].error == items[0].error
+    assert os.listdir(out) == []
@@ -0,0 +1,74 @@
+import errno
+import os
+
+import pytest
+
+from autousb import copier
+from autousb.copier import copy_file
+from autousb.jobs import Job, JobCancelled
+from autousb.journal import part_path
+
+
+@pytest.fixture
+def no_kernel_copy(monkeypatch):
+    def unsupported(*args):
+        raise OSError(errno.ENOSYS, "not supported")
+
+    for name in ("copy_file_range", "sendfile"):
+        if hasattr(os, name):
+            monkeypatch.setattr(copier.os, name, unsupported)
+
+
+def test_unsupported_kernel_copy_falls_back_to_the_buffer(tmp_path, no_kernel_copy):
+    data = os.urandom(300_000)
+    src = tmp_path / "tool.exe"
+    src.write_bytes(data)
+    dst = tmp_path / "copy.exe"
+
+    result = copy_file(str(src), str(dst), chunk_size=64 * 1024)
+
+    assert result.method == "buffered"
+    assert result.bytes_copied == len(data)
+    assert dst.read_bytes() == data
+    assert not os.path.exists(part_path(str(dst)))
+
+
+def test_buffer_is_reused_until_the_chunk_size_changes():
+    first = copier._copy_buffer(64 * 1024)
+    assert copier._copy_buffer(64 * 1024) is first
+    second = copier._copy_buffer(128 * 1024)
+    assert second is not first
+    assert len(second) == 128 * 1024
+
+
+def test_cancel_mid_copy_keeps_the_old_file(tmp_path, monkeypatch, no_kernel_copy):
+    monkeypatch.setattr(copier, "PROGRESS_INTERVAL", 0)
+    src = tmp_path / "tool.exe"
+    src.write_bytes(os.urandom(400_000))
+    dst = tmp_path / "copy.exe"
+    dst.write_bytes(b"old")
+    reports = []
+
+    def progress(message):
+        reports.append(message)
+        job.cancel()
+
+    job = Job(callbacks={"progress": progress})
+    with pytest.raises(JobCancelled):
+        copy_file(str(src), str(dst), job, chunk_size=64 * 1024)
+
+    assert len(reports) == 1
+    assert dst.read_bytes() == b"old"
+    assert not os.path.exists(part_path(str(dst)))
+
+
+def test_unchanged_file_is_skipped(tmp_path):
+    src = tmp_path / "tool.exe"
+    src.write_bytes(b"MZ" + bytes(5000))
+    dst = tmp_path / "copy.exe"
+    assert copy_file(str(src), str(dst)).method != "skip"
+
+    again = copy_file(str(src), str(dst), verify_hash=True)
+
+    assert again.skipped
+    assert again.method == "skip"
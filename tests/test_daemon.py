@@ -0,0 +1,148 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from autousb.daemon import Daemon, DaemonClient, DaemonError, make_server
+
+@pytest.fixture
+def fake_compiler(fake_mingw, monkeypatch):
+    monkeypatch.setenv("AUTOUSB_BUILD_BACKEND", "mingw")
+    return fake_mingw.path
+
+
+def run_server(server):
+    server.daemon.start()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def tcp_server(fake_compiler):
+    server = make_server(port=0, daemon=Daemon(workers=4, watch_drives=False))
+    thread = run_server(server)
+    yield server
+    server.shutdown()
+    thread.join(5)
+    server.server_close()
+    server.daemon.stop()
+
+
+def test_requests_without_the_token_are_rejected(tcp_server):
+    for token in ("", "wrong"):
+        client = DaemonClient(url=tcp_server.info["url"], token=token, timeout=10)
+        try:
+            with pytest.raises(DaemonError) as excinfo:
+                client.status()
+        finally:
+            client.close()
+        assert excinfo.value.status == 401
+
+
+def test_build_reuses_the_artifact_and_lists_it(tcp_server):
+    client = DaemonClient(url=tcp_server.info["url"], token=tcp_server.info["token"], timeout=30)
+    try:
+        first = client.build("@echo off\r\necho hi\r\n", wait=True, timeout=20, name="hi.exe")
+        assert first["state"] == "done", first
+        built = first["result"]
+        assert built["backend"] == "mingw"
+        assert os.path.basename(built["path"]) == "hi.exe"
+        with open(built["path"], "rb") as fh:
+            assert fh.read(2) == b"MZ"
+
+        again = client.build("@echo off\necho hi\n", wait=True, timeout=20, name="hi.exe")
+        assert again["result"]["path"] == built["path"]
+        assert again["result"]["cached"] is True
+
+        other = client.build("echo other", wait=True, timeout=20)
+        assert other["state"] == "done", other
+        assert client.artifacts() == [
+            {"path": built["path"], "size": built["size"]},
+            {"path": other["result"]["path"], "size": other["result"]["size"]},
+        ]
+        assert client.job(first["id"])["state"] == "done"
+        assert client.status()["artifacts"] == 2
+    finally:
+        client.close()
+
+
+def test_concurrent_launcher_builds_while_status_is_polled(tcp_server):
+    client = DaemonClient(url=tcp_server.info["url"], token=tcp_server.info["token"], timeout=30)
+    replies = []
+
+    def build(index):
+        one = DaemonClient(url=tcp_server.info["url"], token=tcp_server.info["token"], timeout=30)
+        try:
+            replies.append(one.build(f"echo {index}", wait=True, timeout=20, backend="stub"))
+        finally:
+            one.close()
+
+    threads = [threading.Thread(target=build, args=(index,)) for index in range(6)]
+    for thread in threads:
+        thread.start()
+    # status() reads the toolchain table while the builds above resolve the stub backend.
+    for _ in range(50):
+        assert client.status()["pid"] == os.getpid()
+    for thread in threads:
+        thread.join(30)
+    client.close()
+    assert [reply["state"] for reply in replies] == ["done"] * 6, replies
+
+
+def test_empty_script_is_a_bad_request(tcp_server):
+    client = DaemonClient(url=tcp_server.info["url"], token=tcp_server.info["token"], timeout=10)
+    try:
+        with pytest.raises(DaemonError) as excinfo:
+            client.build("   \r\n")
+        assert excinfo.value.status == 400
+        with pytest.raises(DaemonError) as excinfo:
+            client.request("GET", "/nowhere")
+        assert excinfo.value.status == 404
+    finally:
+        client.close()
+
+
+@pytest.fixture
+def socket_path():
+    # AF_UNIX paths are limited to about 100 bytes, more than pytest's tmp_path may take.
+    import tempfile
+
+    folder = tempfile.mkdtemp(prefix="autousb-test-")
+    yield os.path.join(folder, "daemon.sock")
+    for name in os.listdir(folder):
+        os.remove(os.path.join(folder, name))
+    os.rmdir(folder)
+
+
+def test_socket_server_replaces_only_a_stale_socket(socket_path, fake_compiler):
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+
+    server = make_server(socket_path=socket_path, daemon=Daemon(workers=1, watch_drives=False))
+    thread = run_server(server)
+    try:
+        client = DaemonClient(socket_path=socket_path, timeout=10)
+        try:
+            assert client.status()["pid"] == os.getpid()
+            assert client.artifacts() == []
+        finally:
+            client.close()
+        with pytest.raises(DaemonError, match="already listening"):
+            make_server(socket_path=socket_path, daemon=server.daemon)
+    finally:
+        server.shutdown()
+        thread.join(5)
+        server.server_close()
+        server.daemon.stop()
+
+
+def test_socket_server_refuses_to_remove_a_regular_file(socket_path):
+    with open(socket_path, "w") as fh:
+        fh.write("keep me")
+    with pytest.raises(DaemonError, match="not a socket"):
+        make_server(socket_path=socket_path, daemon=object())
+    with open(socket_path) as fh:
+        assert fh.read() == "keep me"
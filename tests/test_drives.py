@@ -0,0 +1,139 @@
+import os
+import threading
+
+from autousb.drives import DriveInfo, DriveMonitor, parse_mountinfo, scan_drives
+
+ROOT_LINE = "22 1 259:2 / / rw,relatime shared:1 - ext4 /dev/nvme0n1p2 rw"
+
+
+def make_disk(sysfs, disk, major, minor, removable, sectors):
+    """Adds a disk with one partition to a fake sysfs tree and returns the partition's "major:minor"."""
+    disk_dir = os.path.join(sysfs, "devices", "block", disk)
+    part_dir = os.path.join(disk_dir, f"{disk}1")
+    os.makedirs(part_dir)
+    with open(os.path.join(disk_dir, "removable"), "w") as fh:
+        fh.write(f"{int(removable)}\n")
+    with open(os.path.join(part_dir, "partition"), "w") as fh:
+        fh.write("1\n")
+    with open(os.path.join(part_dir, "size"), "w") as fh:
+        fh.write(f"{sectors}\n")
+    os.makedirs(os.path.join(sysfs, "dev", "block"), exist_ok=True)
+    dev = f"{major}:{minor}"
+    os.symlink(part_dir, os.path.join(sysfs, "dev", "block", dev))
+    return dev
+
+
+def mount_line(mount_id, dev, mount_point, fstype, source, root="/"):
+    return f"{mount_id} 22 {dev} {root} {mount_point} rw,nosuid,nodev shared:{mount_id} - {fstype} {source} rw"
+
+
+def test_parse_mountinfo_unescapes_fields_and_skips_malformed_lines():
+    text = "\n".join(
+        [
+            ROOT_LINE,
+            mount_line(100, "8:1", "/media/u/MY\\040STICK", "vfat", "/dev/sdb1"),
+            "garbage line without separator",
+            "101 22 8:17 / /media/u/X rw - exfat",
+        ]
+    )
+    assert parse_mountinfo(text) == [
+        ("/", "ext4", "/dev/nvme0n1p2", "259:2"),
+        ("/media/u/MY STICK", "vfat", "/dev/sdb1", "8:1"),
+    ]
+
+
+def test_scan_drives_reads_sysfs_metadata(tmp_path):
+    sysfs = str(tmp_path / "sys")
+    usb = make_disk(sysfs, "sdb", 8, 17, removable=True, sectors=31260672)
+    ssd = make_disk(sysfs, "sdc", 8, 33, removable=False, sectors=1000)
+    text = "\n".join(
+        [
+            ROOT_LINE,
+            "23 22 0:21 / /proc rw,nosuid shared:5 - proc proc rw",
+            mount_line(100, usb, "/media/u/USB\\040STICK", "vfat", "/dev/sdb1"),
+            mount_line(101, ssd, "/run/media/u/DATA", "exfat", "/dev/sdc1"),
+            mount_line(102, "8:49", "/media/NOSYSFS", "exfat", "/dev/sdd1"),
+        ]
+    )
+    drives = scan_drives(text, sysfs_root=sysfs, user="u")
+    assert [(d.path, d.fstype, d.source, d.removable, d.size) for d in drives] == [
+        ("/media/u/USB STICK", "vfat", "/dev/sdb1", True, 31260672 * 512),
+        ("/run/media/u/DATA", "exfat", "/dev/sdc1", False, 1000 * 512),
+        ("/media/NOSYSFS", "exfat", "/dev/sdd1", None, None),
+    ]
+    assert drives[0].describe() == "vfat, 14.9 GB, removable"
+
+
+def test_scan_drives_ignores_mounts_outside_media_roots_and_other_users(tmp_path):
+    sysfs = str(tmp_path / "sys")
+    usb = make_disk(sysfs, "sdb", 8, 17, removable=True, sectors=100)
+    text = "\n".join(
+        [
+            ROOT_LINE,
+            mount_line(100, usb, "/mnt/usb", "vfat", "/dev/sdb1"),
+            mount_line(101, usb, "/media/other/USB", "vfat", "/dev/sdb1"),
+            mount_line(102, usb, "/media/u/USB/nested", "vfat", "/dev/sdb1"),
+        ]
+    )
+    assert scan_drives(text, sysfs_root=sysfs, user="u") == []
+
+
+def test_scan_drives_lists_bind_mounts_once_per_mount_point(tmp_path):
+    sysfs = str(tmp_path / "sys")
+    usb = make_disk(sysfs, "sdb", 8, 17, removable=True, sectors=100)
+    other = make_disk(sysfs, "sdc", 8, 33, removable=True, sectors=200)
+    text = "\n".join(
+        [
+            ROOT_LINE,
+            mount_line(100, usb, "/media/u/USB", "vfat", "/dev/sdb1"),
+            # A bind mount of a folder on the stick shows up under its own mount point.
+            mount_line(101, usb, "/media/u/TOOLS", "vfat", "/dev/sdb1", root="/tools"),
+            # Mounting over the same point: the later entry is the one visible there.
+            mount_line(102, other, "/media/u/USB", "exfat", "/dev/sdc1"),
+        ]
+    )
+    drives = scan_drives(text, sysfs_root=sysfs, user="u")
+    assert [(d.path, d.fstype, d.dev) for d in drives] == [
+        ("/media/u/USB", "exfat", other),
+        ("/media/u/TOOLS", "vfat", usb),
+    ]
+
+
+def test_drive_monitor_announces_the_table_it_reads(tmp_path):
+    sysfs = str(tmp_path / "sys")
+    usb = make_disk(sysfs, "sdb", 8, 17, removable=True, sectors=100)
+    mountinfo = tmp_path / "mountinfo"
+    mountinfo.write_text(ROOT_LINE + "\n" + mount_line(100, usb, "/media/u/USB", "vfat", "/dev/sdb1") + "\n")
+    seen = []
+    changed = threading.Event()
+
+    def on_change(drives):
+        seen.append(drives)
+        changed.set()
+
+    os.environ["USER"], user = "u", os.environ.get("USER")
+    monitor = DriveMonitor(on_change, mountinfo_path=str(mountinfo), sysfs_root=sysfs, interval=0.05)
+    try:
+        monitor.start()
+        assert changed.wait(5)
+    finally:
+        monitor.stop()
+        if user is None:
+            del os.environ["USER"]
+        else:
+            os.environ["USER"] = user
+    assert [d.path for d in seen[0]] == ["/media/u/USB"]
+    assert seen[0][0] == DriveInfo("/media/u/USB", "vfat", "/dev/sdb1", usb, True, 100 * 512)
+
+
+def test_drive_monitor_skips_a_table_the_caller_already_has(tmp_path):
+    mountinfo = tmp_path / "mountinfo"
+    mountinfo.write_text(ROOT_LINE + "\n")
+    seen = []
+    monitor = DriveMonitor(seen.append, mountinfo_path=str(mountinfo), sysfs_root=str(tmp_path), interval=0.05)
+    monitor.start(current=[])
+    try:
+        threading.Event().wait(0.3)
+    finally:
+        monitor.stop()
+    assert seen == []
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from autousb import cli
+from autousb.fatimage import PARTITION_OFFSET, FatImageBuilder, build_payload_image, write_image
+from autousb.jobs import Job
+
+PyFatFS = pytest.importorskip("pyfatfs.PyFatFS").PyFatFS
+
+
+def open_fs(path, partitioned=True):
+    return PyFatFS(str(path), offset=PARTITION_OFFSET if partitioned else 0, read_only=True)
+
+
+def test_builder_round_trips_through_pyfatfs(tmp_path):
+    big = tmp_path / "big.bin"
+    big.write_bytes(os.urandom(3 * 1024 * 1024 + 17))
+    builder = FatImageBuilder("tools")
+    builder.add_file("bin/Big File.bin", str(big))
+    builder.add_bytes("readme.txt", b"hello\r\n")
+    builder.add_bytes("bin/empty.dat", b"")
+    image = builder.build(str(tmp_path / "out.img"), partitioned=False)
+
+    assert image.used_bytes <= image.size
+    fs = open_fs(image.path, partitioned=False)
+    try:
+        assert sorted(fs.listdir("/")) == ["bin", "readme.txt"]
+        assert sorted(fs.listdir("/bin")) == ["Big File.bin", "empty.dat"]
+        assert fs.readbytes("/readme.txt") == b"hello\r\n"
+        assert fs.readbytes("/bin/Big File.bin") == big.read_bytes()
+        assert fs.readbytes("/bin/empty.dat") == b""
+    finally:
+        fs.close()
+
+
+def test_payload_image_holds_the_folder_and_autorun_inf(tmp_path):
+    payload = tmp_path / "dist"
+    (payload / "lib").mkdir(parents=True)
+    (payload / "tool.exe").write_bytes(b"MZ" + bytes(5000))
+    (payload / "lib" / "helper.dll").write_bytes(b"dll")
+    image = build_payload_image(str(tmp_path / "p.img"), str(payload / "tool.exe"), "TOOLS", str(payload))
+
+    with open(image.path, "rb") as fh:
+        assert fh.read(512)[510:] == b"\x55\xaa"
+    fs = open_fs(image.path)
+    try:
+        assert sorted(fs.listdir("/")) == ["autorun.inf", "lib", "tool.exe"]
+        assert fs.readbytes("/tool.exe") == (payload / "tool.exe").read_bytes()
+        assert fs.readbytes("/lib/helper.dll") == b"dll"
+        autorun = fs.readtext("/autorun.inf")
+    finally:
+        fs.close()
+    assert "Open=tool.exe" in autorun
+    assert "Label=TOOLS" in autorun
+
+
+def test_write_image_copies_the_used_extent_to_image_files(tmp_path):
+    exe = tmp_path / "tool.exe"
+    exe.write_bytes(os.urandom(200_000))
+    image = build_payload_image(str(tmp_path / "src.img"), str(exe), "USB")
+    targets = [str(tmp_path / "a.img"), str(tmp_path / "b.img")]
+    # A stale target must end up byte-identical, not keep old data past the extents.
+    with open(targets[1], "wb") as fh:
+        fh.write(b"\xff" * (image.size + 4096))
+
+    results = write_image(Job(), image, targets)
+
+    assert [result.ok for result in results] == [True, True]
+    with open(image.path, "rb") as fh:
+        expected = fh.read()
+    for target in targets:
+        with open(target, "rb") as fh:
+            assert fh.read() == expected
+    fs = open_fs(targets[0])
+    try:
+        assert fs.readbytes("/tool.exe") == exe.read_bytes()
+    finally:
+        fs.close()
+
+
+def test_cli_image_refuses_to_build_nowhere(tmp_path, capsys):
+    exe = tmp_path / "tool.exe"
+    exe.write_bytes(b"MZ")
+    assert cli.main(["-q", "image", "--exe", str(exe)]) == 1
+    err = capsys.readouterr().err
+    assert "--keep-image" in err
+
+
+def test_cli_image_keeps_the_image(tmp_path, capsys):
+    exe = tmp_path / "tool.exe"
+    exe.write_bytes(b"MZ" + bytes(100))
+    kept = tmp_path / "kept.img"
+    assert cli.main(["-q", "image", "--exe", str(exe), "--label", "KEEP", "--keep-image", str(kept)]) == 0
+    assert str(kept) in capsys.readouterr().out
+    fs = open_fs(kept)
+    try:
+        assert fs.readbytes("/tool.exe") == exe.read_bytes()
+    finally:
+        fs.close()
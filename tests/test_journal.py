@@ -0,0 +1,123 @@
+import os
+
+import pytest
+
+from autousb import journal as journal_module
+from autousb.copier import copy_file
+from autousb.jobs import Job, JobCancelled
+from autousb.journal import Journal, part_path, write_journaled
+from autousb.provision import provision_drives
+
+CHUNK = 64 * 1024
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(journal_module, "JOURNAL_CHUNK_SIZE", CHUNK)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "tool.exe"
+    path.write_bytes(os.urandom(4 * CHUNK + 1234))
+    return path
+
+
+def interrupt_copy(src, dest, after):
+    """Copies src to dest under a journal and cancels once the copy has read past after bytes."""
+    job = Job()
+    data = src.read_bytes()
+
+    def read(offset, length):
+        if offset >= after:
+            job.cancel()
+        return data[offset : offset + length]
+
+    with pytest.raises(JobCancelled):
+        write_journaled(job, read, len(data), str(dest), str(src), Journal(str(src), str(dest)), 16 * 1024)
+    return Journal(str(src), str(dest))
+
+
+def test_multi_drive_resume_reports_drive_rows(tmp_path, source):
+    drive = tmp_path / "drive"
+    drive.mkdir()
+    interrupted = interrupt_copy(source, drive / "tool.exe", after=2 * CHUNK + 100)
+    assert len(interrupted.chunks) == 2
+
+    messages = []
+    job = Job(callbacks={"progress": messages.append})
+    [result] = provision_drives(job, [str(drive)], str(source), "TOOLS")
+
+    assert result.ok, result.error
+    assert (drive / "tool.exe").read_bytes() == source.read_bytes()
+    assert not os.path.exists(part_path(str(drive / "tool.exe")))
+    # The GUI and daemon unpack every multi-drive message as (drive, status, rate).
+    assert all(isinstance(message, tuple) and len(message) == 3 for message in messages), messages
+    assert any(message[:2] == (str(drive), "Resuming tool.exe at 49%") for message in messages), messages
+
+
+def finish_copy(src, dest):
+    return copy_file(str(src), str(dest), Job(), journal=Journal(str(src), str(dest)))
+
+
+def test_cancelled_copy_resumes_from_the_recorded_offset(tmp_path, source):
+    dest = tmp_path / "drive" / "tool.exe"
+    dest.parent.mkdir()
+    interrupted = interrupt_copy(source, dest, after=2 * CHUNK + 100)
+    assert interrupted.offset == 2 * CHUNK
+    # Bytes past the last fsync'd chunk are on disk but unconfirmed.
+    assert os.path.getsize(part_path(str(dest))) > 2 * CHUNK
+
+    result = finish_copy(source, dest)
+
+    assert result.resumed_from == 2 * CHUNK
+    assert result.bytes_copied == source.stat().st_size - 2 * CHUNK
+    assert dest.read_bytes() == source.read_bytes()
+    assert len(Journal(str(source), str(dest)).chunks) == 5
+
+
+def test_corrupted_last_chunk_is_dropped_and_rewritten(tmp_path, source):
+    dest = tmp_path / "drive" / "tool.exe"
+    dest.parent.mkdir()
+    assert len(interrupt_copy(source, dest, after=3 * CHUNK + 100).chunks) == 3
+    with open(part_path(str(dest)), "r+b") as fh:
+        fh.seek(2 * CHUNK + 10)
+        byte = fh.read(1)
+        fh.seek(2 * CHUNK + 10)
+        fh.write(bytes([byte[0] ^ 0xFF]))
+
+    journal = Journal(str(source), str(dest))
+    assert journal.resume_offset(part_path(str(dest))) == 2 * CHUNK
+    result = finish_copy(source, dest)
+
+    assert result.resumed_from == 2 * CHUNK
+    assert dest.read_bytes() == source.read_bytes()
+
+
+def test_changed_source_invalidates_the_journal(tmp_path, source):
+    dest = tmp_path / "drive" / "tool.exe"
+    dest.parent.mkdir()
+    interrupt_copy(source, dest, after=2 * CHUNK + 100)
+    source.write_bytes(os.urandom(4 * CHUNK + 1234))
+    os.utime(source, (2_000_000_000, 2_000_000_000))
+
+    assert Journal(str(source), str(dest)).chunks == []
+    result = finish_copy(source, dest)
+
+    assert result.resumed_from == 0
+    assert dest.read_bytes() == source.read_bytes()
+
+
+def test_part_file_replaces_dest_only_when_complete(tmp_path, source):
+    dest = tmp_path / "drive" / "tool.exe"
+    dest.parent.mkdir()
+    dest.write_bytes(b"old version")
+    interrupt_copy(source, dest, after=CHUNK + 100)
+    assert dest.read_bytes() == b"old version"
+    assert os.path.exists(part_path(str(dest)))
+
+    finish_copy(source, dest)
+
+    assert dest.read_bytes() == source.read_bytes()
+    assert not os.path.exists(part_path(str(dest)))
+    assert dest.stat().st_mtime_ns == source.stat().st_mtime_ns
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from autousb import lznt1
+
+# The LZNT1 example from [MS-XCA] section 3.2: a null-terminated string and its compressed form.
+MS_XCA_PLAIN = (
+    b"F# F# G A A G F# E D D E F# F# E E F# F# G A A G F# E D D E F# E D D E E F# D E F# G F# D E F# G "
+    b"F# E D E A F# F# G A A G F# E D D E F# E D D\x00"
+)
+MS_XCA_COMPRESSED = bytes.fromhex(
+    "38b08846232000204720410010a24701a045204400084501507900c045200524138805b4024a44ef0358028c"
+    "091601484500be009e000401189000"
+)
+
+
+def test_decompresses_the_ms_xca_example():
+    assert lznt1.decompress(MS_XCA_COMPRESSED) == MS_XCA_PLAIN
+
+
+def test_compresses_the_ms_xca_example_at_least_as_well():
+    packed = lznt1.compress(MS_XCA_PLAIN)
+    assert lznt1.decompress(packed) == MS_XCA_PLAIN
+    assert len(packed) <= len(MS_XCA_COMPRESSED)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"a",
+        b"abc",
+        os.urandom(10_000),
+        b"\0" * 70_000,
+        b"ab" * 5_000,
+        b"@echo off\r\n" + b"".join(b"copy file%d.dll C:\\tools\\\r\n" % n for n in range(600)),
+        bytes(range(256)) * 40 + os.urandom(3000),
+    ],
+    ids=["empty", "one", "short", "random", "zeros", "pairs", "script", "mixed"],
+)
+def test_round_trip(data):
+    packed = lznt1.compress(data)
+    assert lznt1.decompress(packed) == data
+
+
+def test_chunks_are_4k_and_incompressible_ones_are_stored():
+    data = os.urandom(lznt1.CHUNK_SIZE + 100)
+    packed = lznt1.compress(data)
+    first = int.from_bytes(packed[:2], "little")
+    # Stored chunk: bit 15 clear, signature 3, size - 1 in the low 12 bits.
+    assert first == 0x3000 | (lznt1.CHUNK_SIZE - 1)
+    assert packed[2 : 2 + lznt1.CHUNK_SIZE] == data[: lznt1.CHUNK_SIZE]
+    assert len(packed) == len(data) + 4
+
+
+def test_long_runs_compress_well():
+    packed = lznt1.compress(b"A" * 4096 * 3)
+    assert len(packed) < 300
+    # Compressed chunk: bit 15 set, signature 3.
+    assert int.from_bytes(packed[:2], "little") & 0xF000 == 0xB000
+
+
+def test_malformed_streams_raise():
+    with pytest.raises(ValueError):
+        lznt1.decompress(MS_XCA_COMPRESSED[:-5])
+    # A back-reference before any literal has nothing to copy from.
+    with pytest.raises(ValueError):
+        lznt1.decompress(bytes([0x02, 0xB0, 0x01, 0x00, 0x00]))
@@ -0,0 +1,49 @@
+import os
+import shutil
+
+from autousb.journal import part_path
+from autousb.preflight import payload_sizes
+
+
+def write(path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(os.urandom(size))
+    return path
+
+
+def test_a_changed_file_needs_its_full_size(tmp_path):
+    exe = write(tmp_path / "src" / "tool.exe", 50_000)
+    drive = tmp_path / "drive"
+    # Same size, older content: the new copy goes to a part file beside the old one.
+    old = write(drive / "tool.exe", 50_000)
+    os.utime(old, (1_000_000, 1_000_000))
+    assert payload_sizes(str(drive), str(exe)) == (50_000, 50_000, 50_000)
+
+
+def test_an_up_to_date_file_needs_nothing(tmp_path):
+    exe = write(tmp_path / "src" / "tool.exe", 50_000)
+    drive = tmp_path / "drive"
+    drive.mkdir()
+    shutil.copy2(exe, drive / "tool.exe")
+    assert payload_sizes(str(drive), str(exe)) == (50_000, 0, 50_000)
+
+
+def test_a_resumable_part_file_counts_as_written(tmp_path):
+    exe = write(tmp_path / "src" / "tool.exe", 50_000)
+    drive = tmp_path / "drive"
+    drive.mkdir()
+    with open(part_path(str(drive / "tool.exe")), "wb") as fh:
+        fh.write(exe.read_bytes()[:20_000])
+    assert payload_sizes(str(drive), str(exe)) == (50_000, 30_000, 50_000)
+
+
+def test_payload_folder_counts_only_files_to_rewrite(tmp_path):
+    payload = tmp_path / "dist"
+    write(payload / "tool.exe", 10_000)
+    write(payload / "lib" / "big.dll", 40_000)
+    write(payload / "data.bin", 5_000)
+    drive = tmp_path / "drive"
+    (drive / "lib").mkdir(parents=True)
+    shutil.copy2(payload / "tool.exe", drive / "tool.exe")
+    write(drive / "lib" / "big.dll", 60_000)
+    assert payload_sizes(str(drive), str(payload / "tool.exe"), str(payload)) == (55_000, 45_000, 40_000)
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from autousb import cli
+from autousb.jobs import Job
+from autousb.provision import provision_drives
+
+
+@pytest.fixture
+def drives(tmp_path):
+    paths = []
+    for name in ("a", "b"):
+        path = tmp_path / name
+        path.mkdir()
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def exe(tmp_path):
+    path = tmp_path / "tool.exe"
+    path.write_bytes(b"MZ" + os.urandom(20_000))
+    return path
+
+
+def test_multi_drive_no_copy_only_writes_autorun(drives, exe, capsys):
+    argv = ["-q", "provision", "--exe", str(exe), "--label", "TOOLS", "--no-copy"]
+    for drive in drives:
+        argv += ["--drive", str(drive)]
+
+    assert cli.main(argv) == 0
+
+    assert "Provisioned 2 of 2 drives" in capsys.readouterr().out
+    for drive in drives:
+        assert sorted(os.listdir(drive)) == ["autorun.inf"]
+        assert "Open=tool.exe" in (drive / "autorun.inf").read_text()
+
+
+@pytest.mark.parametrize("verify_hash", [False, True])
+def test_multi_drive_verify_hash_skips_a_copy_with_another_mtime(drives, exe, verify_hash):
+    for drive in drives:
+        (drive / "tool.exe").write_bytes(exe.read_bytes())
+        os.utime(drive / "tool.exe", (1_000_000_000, 1_000_000_000))
+
+    results = provision_drives(Job(), [str(drive) for drive in drives], str(exe), "TOOLS", verify_hash=verify_hash)
+
+    assert all(result.ok for result in results), [result.error for result in results]
+    assert [result.skipped for result in results] == [verify_hash, verify_hash]
+    for drive in drives:
+        assert (drive / "tool.exe").read_bytes() == exe.read_bytes()
@@ -0,0 +1,133 @@
+import os
+import shutil
+import threading
+import zlib
+
+import pytest
+
+from autousb.build import BuildError
+from autousb.cache import BuildCache
+from autousb.jobs import Job
+from autousb.stub import (
+    FLAG_LZNT1,
+    PAYLOAD_MAGIC,
+    RAW_LENGTH,
+    TRAILER,
+    append_payload,
+    ensure_stub,
+    pack_payload,
+    read_payload,
+    stub_dir,
+)
+
+
+def run_together(count, target):
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def run():
+        barrier.wait()
+        try:
+            target()
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    return errors
+
+
+def test_concurrent_callers_all_get_the_launcher(fake_mingw, monkeypatch):
+    # A bigger launcher widens the window in which two publishers could collide.
+    monkeypatch.setenv("FAKE_MINGW_SIZE", str(8 * 1024 * 1024))
+    for _trial in range(5):
+        shutil.rmtree(stub_dir(), ignore_errors=True)
+        paths = []
+        assert run_together(4, lambda: paths.append(ensure_stub(Job(), fake_mingw.path))) == []
+        assert len(set(paths)) == 1
+        with open(paths[0], "rb") as fh:
+            assert fh.read(2) == b"MZ"
+        assert [name for name in os.listdir(stub_dir()) if name.endswith(".tmp")] == []
+
+
+def test_concurrent_cache_stores_of_one_key(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"))
+    src = tmp_path / "built.exe"
+    src.write_bytes(b"MZ" + os.urandom(2 * 1024 * 1024))
+    results = []
+    for _trial in range(5):
+        assert run_together(4, lambda: results.append(cache.store("k" * 64, str(src)))) == []
+    assert all(results)
+    assert cache.fetch("k" * 64, str(tmp_path / "out.exe"))
+    assert (tmp_path / "out.exe").read_bytes() == src.read_bytes()
+    assert [name for name in os.listdir(cache.root) if name.endswith(".tmp")] == []
+
+
+@pytest.fixture
+def stub(tmp_path):
+    path = tmp_path / "launcher.exe"
+    path.write_bytes(b"MZ" + bytes(1000))
+    return path
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_payload_round_trips_through_the_trailer(tmp_path, stub, compress):
+    script = b"@echo off\r\n" + b"echo hello\r\n" * 200
+    payload, flags = pack_payload(script, compress)
+    assert flags == (FLAG_LZNT1 if compress else 0)
+    exe = tmp_path / "out.exe"
+    append_payload(str(stub), payload, str(exe), flags)
+
+    data = exe.read_bytes()
+    assert data.startswith(stub.read_bytes())
+    length, crc, stored_flags, magic = TRAILER.unpack(data[-TRAILER.size :])
+    assert (length, crc, stored_flags, magic) == (len(payload), zlib.crc32(payload), flags, PAYLOAD_MAGIC)
+    assert read_payload(str(exe)) == (script, flags)
+
+
+def test_incompressible_scripts_are_stored_raw():
+    script = os.urandom(500)
+    assert pack_payload(script, compress=True) == (script, 0)
+
+
+def damage(path, offset_from_end):
+    data = bytearray(path.read_bytes())
+    data[-offset_from_end] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+
+def test_bad_trailers_are_rejected(tmp_path, stub):
+    exe = tmp_path / "out.exe"
+    payload, flags = pack_payload(b"echo hi\r\n" * 50, compress=True)
+    append_payload(str(stub), payload, str(exe), flags)
+    good = exe.read_bytes()
+
+    damage(exe, TRAILER.size + 3)
+    with pytest.raises(BuildError, match="checksum"):
+        read_payload(str(exe))
+
+    exe.write_bytes(good)
+    damage(exe, 1)
+    with pytest.raises(BuildError, match="no payload trailer"):
+        read_payload(str(exe))
+
+    exe.write_bytes(good[:-TRAILER.size] + TRAILER.pack(len(good), 0, flags, PAYLOAD_MAGIC))
+    with pytest.raises(BuildError, match="no payload trailer"):
+        read_payload(str(exe))
+
+    exe.write_bytes(b"MZ")
+    with pytest.raises(BuildError, match="no payload trailer"):
+        read_payload(str(exe))
+
+
+def test_corrupt_compressed_payload_is_rejected(tmp_path, stub):
+    exe = tmp_path / "out.exe"
+    payload, _flags = pack_payload(b"echo hi\r\n" * 50, compress=True)
+    # A valid CRC over a stream that claims more bytes than it holds.
+    bad = RAW_LENGTH.pack(10_000) + payload[RAW_LENGTH.size :]
+    append_payload(str(stub), bad, str(exe), FLAG_LZNT1)
+    with pytest.raises(BuildError, match="corrupt"):
+        read_payload(str(exe))
@@ -0,0 +1,129 @@
+import json
+import os
+
+import pytest
+
+from autousb.jobs import Job
+from autousb.sync import MANIFEST_NAME, MANIFEST_VERSION, load_manifest, scan_tree, sync_folder
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def write_manifest(drive, files):
+    (drive / MANIFEST_NAME).write_text(json.dumps({"version": MANIFEST_VERSION, "files": files}))
+
+
+@pytest.mark.parametrize(
+    "rel",
+    ["../victim/keep.txt", "/etc/passwd", "a/../../victim/keep.txt", "a//b", "./a", "a\\..\\b", "C:/x", ""],
+)
+def test_load_manifest_drops_paths_that_leave_the_drive(tmp_path, rel):
+    drive = tmp_path / "drive"
+    drive.mkdir()
+    write_manifest(drive, {rel: {"size": 1}, "lib/ok.dll": {"size": 2}})
+    assert load_manifest(str(drive)) == {"lib/ok.dll": {"size": 2}}
+
+
+def test_sync_never_deletes_outside_the_drive(tmp_path):
+    victim = write(tmp_path / "victim" / "keep.txt", b"precious")
+    payload = tmp_path / "payload"
+    write(payload / "tool.exe", b"MZ")
+    drive = tmp_path / "drive"
+    drive.mkdir()
+    write_manifest(drive, {"../victim/keep.txt": {"size": 8, "mtime_ns": 0, "sha256": "x"}})
+
+    result = sync_folder(Job(), str(payload), str(drive))
+
+    assert victim.read_bytes() == b"precious"
+    assert result.files_deleted == 0
+    assert (drive / "tool.exe").read_bytes() == b"MZ"
+    assert set(load_manifest(str(drive))) == {"tool.exe"}
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink") or os.name == "nt", reason="needs symlinks")
+def test_sync_does_not_delete_through_a_linked_folder(tmp_path):
+    victim = write(tmp_path / "victim" / "keep.txt", b"precious")
+    payload = tmp_path / "payload"
+    write(payload / "tool.exe", b"MZ")
+    drive = tmp_path / "drive"
+    drive.mkdir()
+    os.symlink(tmp_path / "victim", drive / "lib")
+    write_manifest(drive, {"lib/keep.txt": {"size": 8, "mtime_ns": 0, "sha256": "x"}})
+
+    result = sync_folder(Job(), str(payload), str(drive))
+
+    assert victim.read_bytes() == b"precious"
+    assert result.files_deleted == 0
+    assert "lib/keep.txt" not in load_manifest(str(drive))
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink") or os.name == "nt", reason="needs symlinks")
+def test_scan_tree_follows_linked_folders_once(tmp_path):
+    payload = tmp_path / "payload"
+    write(payload / "bin" / "tool.exe", b"MZ")
+    write(tmp_path / "shared" / "data.bin", b"data")
+    os.symlink(payload, payload / "bin" / "loop")
+    os.symlink(tmp_path / "shared", payload / "shared")
+
+    assert sorted(scan_tree(str(payload))) == ["bin/tool.exe", "shared/data.bin"]
+
+
+@pytest.fixture
+def synced(tmp_path):
+    payload = tmp_path / "payload"
+    write(payload / "tool.exe", b"MZ" + bytes(5000))
+    write(payload / "lib" / "a.dll", b"a" * 3000)
+    write(payload / "lib" / "b.dll", b"b" * 2000)
+    drive = tmp_path / "drive"
+    drive.mkdir()
+    write(drive / "notes.txt", b"mine")
+    first = sync_folder(Job(), str(payload), str(drive), workers=2)
+    return payload, drive, first
+
+
+def test_first_sync_writes_everything_and_records_it(synced):
+    payload, drive, first = synced
+    assert (first.files_written, first.files_skipped, first.files_deleted) == (3, 0, 0)
+    assert first.bytes_written == 10002
+    for rel in ("tool.exe", "lib/a.dll", "lib/b.dll"):
+        assert (drive / rel).read_bytes() == (payload / rel).read_bytes()
+    manifest = load_manifest(str(drive))
+    assert sorted(manifest) == ["lib/a.dll", "lib/b.dll", "tool.exe"]
+    assert manifest["tool.exe"]["size"] == 5002
+    assert manifest["tool.exe"]["mtime_ns"] == (payload / "tool.exe").stat().st_mtime_ns
+
+
+def test_unchanged_resync_writes_nothing(synced):
+    payload, drive, _first = synced
+    again = sync_folder(Job(), str(payload), str(drive))
+    assert (again.files_written, again.files_skipped, again.files_deleted) == (0, 3, 0)
+    assert again.bytes_skipped == 10002
+
+
+def test_resync_rewrites_changes_and_deletes_only_listed_files(synced):
+    payload, drive, _first = synced
+    write(payload / "lib" / "a.dll", b"A" * 3000)
+    (payload / "lib" / "b.dll").unlink()
+
+    again = sync_folder(Job(), str(payload), str(drive))
+
+    assert (again.files_written, again.files_skipped, again.files_deleted) == (1, 1, 1)
+    assert (drive / "lib" / "a.dll").read_bytes() == b"A" * 3000
+    assert not (drive / "lib" / "b.dll").exists()
+    assert (drive / "notes.txt").read_bytes() == b"mine"
+    assert sorted(load_manifest(str(drive))) == ["lib/a.dll", "tool.exe"]
+
+
+def test_removed_folder_is_cleaned_up(synced):
+    payload, drive, _first = synced
+    for name in ("a.dll", "b.dll"):
+        (payload / "lib" / name).unlink()
+
+    again = sync_folder(Job(), str(payload), str(drive))
+
+    assert again.files_deleted == 2
+    assert not (drive / "lib").exists()
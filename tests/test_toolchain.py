@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from autousb import toolchain
+from autousb.jobs import Job, JobCancelled
+from autousb.toolchain import PCH_FAILED, PCH_RETRY_S, ensure_pch, forget_pch_failures, forget_toolchains, toolchain_for
+
+FAKE_COMPILER = """\
+#!{python}
+import os, sys, time
+args = sys.argv[1:]
+if args == ["--version"]:
+    print("fake-mingw 1.0")
+    sys.exit(0)
+with open({log!r}, "a") as fh:
+    fh.write("compile\\n")
+mode = open({mode!r}).read().strip()
+if mode == "fail":
+    print("windows.h: No such file or directory")
+    sys.exit(1)
+if mode == "slow":
+    time.sleep(30)
+with open(args[args.index("-o") + 1], "wb") as fh:
+    fh.write(b"gch")
+"""
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="the fake compiler is a POSIX script")
+
+
+class FakeCompiler:
+    def __init__(self, folder):
+        self.log = folder / "compiles.log"
+        self.mode_file = folder / "mode"
+        self.path = folder / "x86_64-w64-mingw32-g++"
+        self.path.write_text(FAKE_COMPILER.format(python=sys.executable, log=str(self.log), mode=str(self.mode_file)))
+        self.path.chmod(0o755)
+        self.mode = "ok"
+
+    @property
+    def mode(self):
+        return self.mode_file.read_text()
+
+    @mode.setter
+    def mode(self, value):
+        self.mode_file.write_text(value)
+
+    @property
+    def compiles(self):
+        return len(self.log.read_text().splitlines()) if self.log.exists() else 0
+
+
+@pytest.fixture
+def compiler(tmp_path, monkeypatch):
+    monkeypatch.delenv("AUTOUSB_MINGW_PCH", raising=False)
+    forget_toolchains()
+    yield FakeCompiler(tmp_path)
+    forget_toolchains()
+
+
+def markers():
+    root = toolchain.pch_root()
+    if not os.path.isdir(root):
+        return []
+    return [name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, PCH_FAILED))]
+
+
+def test_precompiles_once(compiler):
+    header = ensure_pch(Job(), toolchain_for(str(compiler.path)))
+    assert header and os.path.isfile(f"{header}.gch")
+    assert ensure_pch(Job(), toolchain_for(str(compiler.path))) == header
+    assert compiler.compiles == 1
+
+
+def test_failure_is_remembered_until_it_expires(compiler):
+    compiler.mode = "fail"
+    tc = toolchain_for(str(compiler.path))
+    assert ensure_pch(Job(), tc) is None
+    assert ensure_pch(Job(), tc) is None
+    assert compiler.compiles == 1
+    [folder] = markers()
+
+    compiler.mode = "ok"
+    marker = os.path.join(toolchain.pch_root(), folder, PCH_FAILED)
+    old = time.time() - PCH_RETRY_S - 60
+    os.utime(marker, (old, old))
+    assert ensure_pch(Job(), tc) is not None
+    assert compiler.compiles == 2
+
+
+def test_forgetting_clears_failures(compiler):
+    compiler.mode = "fail"
+    tc = toolchain_for(str(compiler.path))
+    assert ensure_pch(Job(), tc) is None
+    assert len(markers()) == 1
+    forget_toolchains()
+    assert markers() == []
+
+    assert ensure_pch(Job(), tc) is None
+    assert forget_pch_failures() == 1
+    assert compiler.compiles == 2
+
+
+def test_cancelled_precompile_leaves_no_marker(compiler):
+    compiler.mode = "slow"
+    job = Job()
+    threading.Timer(0.5, job.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(JobCancelled):
+        ensure_pch(job, toolchain_for(str(compiler.path)))
+    assert time.monotonic() - started < 10
+    assert markers() == []
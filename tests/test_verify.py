@@ -0,0 +1,53 @@
+import os
+import stat
+
+import pytest
+
+from autousb import verify
+from autousb.copier import copy_file
+from autousb.jobs import Job
+from autousb.verify import verify_copies
+
+
+@pytest.fixture
+def read_only_copy(tmp_path):
+    src = tmp_path / "tool.exe"
+    src.write_bytes(os.urandom(300_000))
+    src.chmod(0o555)
+    drive = tmp_path / "drive"
+    drive.mkdir()
+    copy_file(str(src), str(drive / "tool.exe"))
+    assert not stat.S_IMODE((drive / "tool.exe").stat().st_mode) & 0o222
+    return src, drive
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Windows needs write access to flush")
+def test_flush_does_not_ask_for_write_access(read_only_copy, monkeypatch):
+    _src, drive = read_only_copy
+    modes = []
+    real_open = os.open
+
+    def recording_open(path, flags, *args):
+        modes.append(flags & (os.O_RDONLY | os.O_WRONLY | os.O_RDWR))
+        return real_open(path, flags, *args)
+
+    monkeypatch.setattr(verify.os, "open", recording_open)
+    verify.flush(str(drive / "tool.exe"))
+    assert modes == [os.O_RDONLY]
+
+
+@pytest.mark.skipif(os.name == "nt" or os.geteuid() == 0, reason="root ignores file modes")
+def test_read_only_copy_verifies(read_only_copy):
+    src, drive = read_only_copy
+    assert verify_copies(Job(), str(drive), [(str(src), str(drive / "tool.exe"))]) == []
+
+
+def test_changed_copy_is_reported(tmp_path):
+    src = tmp_path / "tool.exe"
+    src.write_bytes(b"MZ" + bytes(10_000))
+    drive = tmp_path / "drive"
+    drive.mkdir()
+    (drive / "tool.exe").write_bytes(b"MZ" + bytes(9_999) + b"!")
+    (drive / "autorun.inf").write_bytes(b"[Autorun]\r\n")
+    pairs = [(str(src), str(drive / "tool.exe")), (b"[Autorun]\r\n", str(drive / "autorun.inf"))]
+    assert verify_copies(Job(), str(drive), pairs) == [str(drive / "tool.exe")]